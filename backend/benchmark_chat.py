@@ -0,0 +1,502 @@
+"""
+End-to-end latency benchmark for /sakhi/chat, /onboarding/step and /user/answers.
+
+By default the backend runs in-process against the local stand-in servers
+(see stubs/), so a run needs no network access and results are comparable
+between commits. Pass --base-url to drive an already running backend instead
+(staging only: the benchmark creates users and writes messages).
+
+The load is a weighted mix of scenarios, replayed by --concurrency workers:
+
+    smalltalk         greetings and thanks                        (/sakhi/chat)
+    medical           simple fertility / pregnancy questions      (/sakhi/chat)
+    facility          clinic address / phone / timings questions  (/sakhi/chat)
+    emergency         danger-sign messages                        (/sakhi/chat)
+    chat_onboarding   new phone number -> name -> gender -> city  (/sakhi/chat)
+    onboarding_step   full questionnaire for one relationship     (/onboarding/step)
+    user_answers      bulk answer upload                          (/user/answers)
+
+Reported per scenario and overall: p50/p95/p99/mean/max latency, throughput,
+HTTP status counts, the chat routes taken and the trace ID of the slowest
+request. The per-stage breakdown is the difference in sakhi_stage_seconds,
+sakhi_upstream_call_seconds and upstream queueing between two /debug/metrics
+snapshots taken around the run.
+
+Usage:
+    python benchmark_chat.py [--requests 300] [--concurrency 16] [--output bench.json]
+    python benchmark_chat.py --mix smalltalk=5,medical=3,emergency=1 --chat-latency-ms 800
+    python benchmark_chat.py --base-url http://staging:8000 --requests 100
+    python benchmark_chat.py --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+CHAT_MESSAGES: Dict[str, List[str]] = {
+    "smalltalk": [
+        "hi",
+        "hello sakhi",
+        "thank you",
+        "ok",
+        "good morning",
+        "thanks, that helps",
+        "namaste",
+        "how are you?",
+    ],
+    "medical": [
+        "what is folic acid",
+        "how does IVF work",
+        "what is AMH and why does it matter",
+        "is it normal to feel anxious after embryo transfer",
+        "how can I deal with family pressure about having a baby",
+        "what foods should I eat during pregnancy",
+        "ivf success rate enta?",
+        "how many injections are needed for IUI",
+    ],
+    "facility": [
+        "vizag clinic address",
+        "phone number for vijayawada branch",
+        "what are the timings of the hyderabad clinic",
+        "where is your guntur centre located",
+    ],
+    "emergency": [
+        "severe bleeding",
+        "heavy bleeding and severe abdominal pain",
+        "I fainted and have sharp pain in my stomach",
+        "baby is not moving since morning",
+    ],
+}
+
+ONBOARDING_REPLIES = ("Deepthi", "Female", "Vizag")
+RELATIONSHIPS = ("herself", "himself", "father", "mother", "father_in_law", "mother_in_law", "sibling")
+ANSWER_KEYS = ("tryingDuration", "previousTreatments", "diagnosis", "priority")
+
+DEFAULT_MIX = "smalltalk=35,medical=30,facility=10,emergency=5,chat_onboarding=5,onboarding_step=10,user_answers=5"
+
+STAGE_HISTOGRAMS = (
+    "sakhi_stage_seconds",
+    "sakhi_upstream_call_seconds",
+    "sakhi_upstream_queue_seconds",
+    "sakhi_openai_rate_wait_seconds",
+)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in CHAT_MESSAGES and name not in ("chat_onboarding", "onboarding_step", "user_answers"):
+            raise SystemExit(f"Unknown scenario in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+    }
+
+
+class Recorder:
+    """
+    Collects one sample per HTTP request.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.routes: Dict[str, Counter] = defaultdict(Counter)
+        self.slowest: Dict[str, Dict[str, object]] = {}
+
+    def add(
+        self,
+        scenario: str,
+        seconds: float,
+        status: int,
+        route: Optional[str] = None,
+        trace_id: Optional[str] = None,
+    ) -> None:
+        self.statuses[scenario][str(status)] += 1
+        if 200 <= status < 300:
+            self.latencies[scenario].append(seconds)
+            if route:
+                self.routes[scenario][route] += 1
+        if seconds * 1000 > self.slowest.get(scenario, {}).get("ms", -1):
+            self.slowest[scenario] = {"ms": round(seconds * 1000, 1), "status": status, "trace_id": trace_id}
+
+
+class Workload:
+    """
+    Issues the requests for each scenario against the backend.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, rng: random.Random, run_id: str):
+        self.http = http
+        self.recorder = recorder
+        self.rng = rng
+        self.run_id = run_id
+        self.users: List[str] = []
+        self.emergency_users: List[str] = []
+        self._phones = 0
+
+    def _next_phone(self) -> str:
+        self._phones += 1
+        return f"+91{self.run_id}{self._phones:05d}"
+
+    async def _post(self, scenario: Optional[str], path: str, payload: dict) -> Tuple[int, dict]:
+        started = time.perf_counter()
+        trace_id = None
+        try:
+            resp = await self.http.post(path, json=payload)
+            status = resp.status_code
+            trace_id = resp.headers.get("x-trace-id")
+            body = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
+        except httpx.HTTPError:
+            status, body = 599, {}
+        elapsed = time.perf_counter() - started
+        if scenario:
+            route = body.get("route") if isinstance(body, dict) else None
+            self.recorder.add(scenario, elapsed, status, route, trace_id)
+        return status, body
+
+    async def onboard_user(self, scenario: Optional[str] = None) -> Optional[str]:
+        """
+        Walk a new phone number through chat onboarding. Returns the phone number.
+        Requests are only recorded when a scenario name is given.
+        """
+        phone = self._next_phone()
+        for message in ("hi",) + ONBOARDING_REPLIES:
+            status, _ = await self._post(scenario, "/sakhi/chat", {"phone_number": phone, "message": message})
+            if status != 200:
+                return None
+        return phone
+
+    async def setup(self, users: int, emergency_users: int) -> None:
+        phones = await asyncio.gather(*(self.onboard_user() for _ in range(users + emergency_users)))
+        phones = [p for p in phones if p]
+        if len(phones) < 2:
+            raise SystemExit("Could not create benchmark users; is the backend reachable?")
+        split = max(1, min(emergency_users, len(phones) - 1))
+        self.emergency_users = phones[:split]
+        self.users = phones[split:]
+
+    async def run(self, scenario: str) -> None:
+        if scenario in CHAT_MESSAGES:
+            pool = self.emergency_users if scenario == "emergency" else self.users
+            await self._post(
+                scenario,
+                "/sakhi/chat",
+                {"phone_number": self.rng.choice(pool), "message": self.rng.choice(CHAT_MESSAGES[scenario])},
+            )
+        elif scenario == "chat_onboarding":
+            await self.onboard_user(scenario)
+        elif scenario == "onboarding_step":
+            await self._onboarding_flow()
+        elif scenario == "user_answers":
+            await self._post(
+                scenario,
+                "/user/answers",
+                {
+                    "user_id": f"bench-{self.run_id}-{self.rng.randrange(10000)}",
+                    "answers": [
+                        {"question_key": key, "selected_options": [f"option {self.rng.randrange(4)}"]}
+                        for key in ANSWER_KEYS
+                    ],
+                },
+            )
+
+    async def _onboarding_flow(self) -> None:
+        relationship = self.rng.choice(RELATIONSHIPS)
+        payload = {
+            "parent_profile_id": f"bench-{self.run_id}-{self.rng.randrange(10000)}",
+            "relationship_type": relationship,
+            "current_step": 1,
+            "answers_json": {},
+        }
+        for _ in range(20):
+            status, body = await self._post("onboarding_step", "/onboarding/step", payload)
+            if status != 200 or body.get("completed"):
+                return
+            question = body["question"]
+            options = question.get("options") or ["30"]
+            payload["answers_json"][question["field_name"]] = self.rng.choice(options)
+            payload["current_step"] = body["step"] + 1
+
+
+def histogram_delta(before: dict, after: dict) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Per-series count / total / mean of the stage histograms accumulated between two snapshots.
+    """
+    out: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for name in STAGE_HISTOGRAMS:
+        prev = before.get(name, {}).get("series", {})
+        series = {}
+        for label, value in after.get(name, {}).get("series", {}).items():
+            count = value["count"] - prev.get(label, {}).get("count", 0)
+            total = value["sum"] - prev.get(label, {}).get("sum", 0.0)
+            if count > 0:
+                series[label] = {
+                    "count": count,
+                    "total_s": round(total, 3),
+                    "mean_ms": round(total / count * 1000, 1),
+                }
+        if series:
+            out[name] = dict(sorted(series.items(), key=lambda kv: -kv[1]["total_s"]))
+    return out
+
+
+def totals_by(series: Dict[str, Dict[str, float]], label: str) -> Dict[str, Dict[str, float]]:
+    """
+    Collapse histogram series onto one label (e.g. stage totals across chat routes).
+    """
+    merged: Dict[str, List[float]] = {}
+    for key, value in series.items():
+        labels = dict(part.split("=", 1) for part in key.split(",") if "=" in part)
+        entry = merged.setdefault(labels.get(label, key), [0, 0.0])
+        entry[0] += value["count"]
+        entry[1] += value["total_s"]
+    rows = {
+        name: {"count": count, "total_s": round(total, 3), "mean_ms": round(total / count * 1000, 1)}
+        for name, (count, total) in merged.items()
+    }
+    return dict(sorted(rows.items(), key=lambda kv: -kv[1]["total_s"]))
+
+
+async def fetch_metrics(http: httpx.AsyncClient) -> dict:
+    try:
+        resp = await http.get("/debug/metrics")
+        return resp.json() if resp.status_code == 200 else {}
+    except httpx.HTTPError:
+        return {}
+
+
+async def wait_until_ready(http: httpx.AsyncClient, timeout: float) -> None:
+    """
+    Poll /readyz so that startup warm-up is not part of the measurement.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await http.get("/readyz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    print(f"warning: backend not ready after {timeout:.0f}s, measuring anyway")
+
+
+async def benchmark(base_url: str, args) -> dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    scenarios = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+    run_id = f"{rng.randrange(10 ** 5):05d}"
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as http:
+        await wait_until_ready(http, args.timeout)
+        workload = Workload(http, Recorder(), rng, run_id)
+        await workload.setup(args.users, args.emergency_users)
+        for scenario in scenarios[: args.warmup]:
+            await workload.run(scenario)
+
+        recorder = workload.recorder = Recorder()
+
+        before = await fetch_metrics(http)
+        queue: asyncio.Queue = asyncio.Queue()
+        for scenario in scenarios:
+            queue.put_nowait(scenario)
+
+        async def worker():
+            while not queue.empty():
+                await workload.run(queue.get_nowait())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        after = await fetch_metrics(http)
+
+    stages = histogram_delta(before, after)
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    statuses = sum(recorder.statuses.values(), Counter())
+    return {
+        "config": {
+            "base_url": args.base_url or "in-process (stubs)",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "seed": args.seed,
+            "stub_latency_ms": None if args.base_url else {
+                "chat": args.chat_latency_ms,
+                "embeddings": args.embed_latency_ms,
+                "slm_pass": args.slm_pass_ms,
+            },
+            "git_commit": _git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "elapsed_s": round(elapsed, 3),
+        "overall": {**summarize(all_latencies, elapsed), "statuses": dict(statuses)},
+        "scenarios": {
+            name: {
+                **summarize(recorder.latencies[name], elapsed),
+                "statuses": dict(recorder.statuses[name]),
+                "routes": dict(recorder.routes[name]),
+                "slowest": recorder.slowest.get(name),
+            }
+            for name in sorted(recorder.statuses)
+        },
+        "stages": stages,
+        "stage_totals": totals_by(stages.get("sakhi_stage_seconds", {}), "stage"),
+        "upstream_totals": totals_by(stages.get("sakhi_upstream_call_seconds", {}), "upstream"),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def start_in_process_backend(args) -> str:
+    """
+    Start the stubs and the backend (uvicorn, in this process). Returns the backend URL.
+    """
+    from stubs.__main__ import serve, start_stubs
+
+    env = start_stubs(
+        args.stub_port,
+        args.stub_port + 1,
+        args.stub_port + 2,
+        chat_latency_ms=args.chat_latency_ms,
+        embed_latency_ms=args.embed_latency_ms,
+        slm_pass_ms=args.slm_pass_ms,
+    )
+    os.environ.update(env)
+    # Pacing state from earlier runs would otherwise leak into this one
+    os.environ.setdefault("OPENAI_RATE_DB", os.path.join(tempfile.gettempdir(), f"sakhi_bench_rate_{os.getpid()}.sqlite3"))
+
+    import main
+
+    serve(main.app, args.port)
+    return f"http://127.0.0.1:{args.port}"
+
+
+def print_report(result: dict) -> None:
+    print(f"\n{result['config']['requests']} requests, concurrency {result['config']['concurrency']}, "
+          f"{result['elapsed_s']}s ({result['config']['base_url']})")
+    header = f"{'scenario':<18}{'count':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  statuses"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["scenarios"].items()) + [("overall", result["overall"])]
+    for name, s in rows:
+        print(f"{name:<18}{s['count']:>7}{s['throughput_rps']:>8}{s['p50_ms']:>9}{s['p95_ms']:>9}"
+              f"{s['p99_ms']:>9}{s['max_ms']:>9}  {s['statuses']}")
+    for title, rows in (("stage", result["stage_totals"]), ("upstream", result["upstream_totals"])):
+        if not rows:
+            continue
+        print(f"\n{title:<28}{'calls':>7}{'mean ms':>10}{'total s':>10}")
+        for name, s in rows.items():
+            print(f"{name:<28}{s['count']:>7}{s['mean_ms']:>10}{s['total_s']:>10}")
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """
+    Print latency / throughput changes between two result files.
+    """
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def delta(a: float, b: float) -> str:
+        if not a:
+            return f"{b}"
+        return f"{b} ({(b - a) / a * 100:+.0f}%)"
+
+    print(f"{before_path} ({before['config'].get('git_commit')}) -> {after_path} ({after['config'].get('git_commit')})")
+    names = sorted(set(before["scenarios"]) | set(after["scenarios"])) + ["overall"]
+    for name in names:
+        a = before["overall"] if name == "overall" else before["scenarios"].get(name, {})
+        b = after["overall"] if name == "overall" else after["scenarios"].get(name, {})
+        if not a or not b:
+            print(f"{name:<18} only in {'after' if b else 'before'}")
+            continue
+        parts = [f"{key}={delta(a[key], b[key])}" for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")]
+        print(f"{name:<18} " + "  ".join(parts))
+
+    for section in ("stage_totals", "upstream_totals"):
+        rows_a = before.get(section, {})
+        rows_b = after.get(section, {})
+        for name in sorted(set(rows_a) | set(rows_b)):
+            a = rows_a.get(name, {}).get("mean_ms", 0.0)
+            b = rows_b.get(name, {}).get("mean_ms", 0.0)
+            print(f"  {name:<26} mean_ms={delta(a, b)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="drive a running backend instead of an in-process one")
+    parser.add_argument("--requests", type=int, default=300, help="scenarios to run (multi-request flows count once)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=20, help="onboarded users created before the run")
+    parser.add_argument("--emergency-users", type=int, default=4, help="users reserved for emergency messages")
+    parser.add_argument("--warmup", type=int, default=10, help="scenarios run sequentially before measuring")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two result files and exit")
+    parser.add_argument("--port", type=int, default=8100, help="in-process backend port")
+    parser.add_argument("--stub-port", type=int, default=8901, help="first of three stub ports")
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    parser.add_argument("--slm-pass-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    import logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    base_url = args.base_url or start_in_process_backend(args)
+    result = asyncio.run(benchmark(base_url.rstrip("/"), args))
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark SLM micro-batching against a local stub model server.
+
+The stub mimics a self-hosted model server with one GPU worker: every forward
+pass costs a fixed overhead plus a small per-item cost, and passes run one at a
+time. A JSON array request is served as a single batched pass.
+
+Usage:
+    python benchmark_slm_batching.py [--requests 200] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+PASS_OVERHEAD_S = 0.040  # fixed cost of one forward pass
+PER_ITEM_S = 0.002       # extra cost per request in the pass
+
+
+def build_stub_app() -> FastAPI:
+    app = FastAPI()
+    gpu = asyncio.Lock()
+
+    @app.post("/slm")
+    async def slm(request: Request):
+        body = await request.json()
+        items = body if isinstance(body, list) else [body]
+        async with gpu:
+            await asyncio.sleep(PASS_OVERHEAD_S + PER_ITEM_S * len(items))
+        replies = [{"reply": f"answer to: {item.get('question', '')}"} for item in items]
+        return replies if isinstance(body, list) else replies[0]
+
+    return app
+
+
+def start_stub_server(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(build_stub_app(), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(batching: bool, total: int, concurrency: int, endpoint: str) -> dict:
+    os.environ["SLM_ENDPOINT_URL"] = endpoint
+    os.environ["SLM_BATCH_ENABLED"] = "1" if batching else "0"
+    from modules.slm_client import SLMClient
+
+    client = SLMClient()
+    await client.startup()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await client.generate_rag_response(context="stub context", message=f"question {i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+
+    latencies.sort()
+    return {
+        "batching": batching,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    import logging
+    for name in ("modules.slm_client", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    start_stub_server(args.port)
+    endpoint = f"http://127.0.0.1:{args.port}/slm"
+
+    results = [
+        asyncio.run(run_load(False, args.requests, args.concurrency, endpoint)),
+        asyncio.run(run_load(True, args.requests, args.concurrency, endpoint)),
+    ]
+    for r in results:
+        label = "batched  " if r["batching"] else "unbatched"
+        print(f"{label}: {r['throughput_rps']:>7} req/s  p50={r['p50_ms']}ms  p95={r['p95_ms']}ms  ({r['elapsed_s']}s)")
+    print(f"throughput gain: {results[1]['throughput_rps'] / results[0]['throughput_rps']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
 from modules.user_profile import (
@@ -20,16 +29,59 @@ from modules.response_builder import (
     generate_medical_response,
     generate_smalltalk_response,
     generate_intent,
+    stream_medical_response,
+    stream_smalltalk_response,
 )
 from modules.conversation import save_user_message, save_sakhi_message, get_last_messages
 from modules.user_answers import save_bulk_answers
 from modules.model_gateway import get_model_gateway, Route
 from modules.slm_client import get_slm_client
+from modules.clinic_directory import get_clinic_directory, detect_reply_language
+from modules.followup_prefetch import get_followup_prefetcher
+from modules.speculative_retrieval import get_speculative_retriever
+from modules.hedging import get_hedger
+from modules.emergency import LANGUAGE_LABELS, get_emergency_lane
+from modules.streaming import SSE_HEADERS, TIME_TO_FIRST_TOKEN, iterate_in_thread, sse_event
+from modules.text_utils import split_follow_ups, truncate_response
+from modules.circuit_breaker import CircuitOpen, get_breaker
+from modules.deadlines import get_stage_budget, reset_deadline, start_deadline
+from modules.idempotency import get_idempotency_store
+from modules.logging_setup import configure_logging, shutdown_logging
+from modules.metrics import render_prometheus, snapshot as metrics_snapshot
+from modules.startup import WarmUp
+from modules.tracing import TracingMiddleware, set_trace_route, stage
+from modules.upstream_clients import close_clients, get_openai_client
+from modules.upstream_limiter import PRIORITY_HIGH, UpstreamOverloaded, set_request_priority
+from modules.user_locks import get_user_locks, user_key
+from modules.webhook_ingest import WebhookIngest
+from modules.write_behind import get_write_behind
+from rag import generate_embedding
 from modules.onboarding_engine import OnboardingRequest, get_next_question
 from modules.parent_profiles import create_parent_profile, update_parent_profile_answers
 from search_hierarchical import hierarchical_rag_query, format_hierarchical_context
+from supabase_client import get_supabase_session
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Queue-backed JSON logging for the whole process; configured here only
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await slm_client.startup()
+    await warm_up.start()
+    await webhook_ingest.start()
+    await write_behind.start()
+    yield
+    await webhook_ingest.stop()
+    await write_behind.stop()
+    await warm_up.stop()
+    await close_clients()
+    shutdown_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS Configuration - Allow Replit frontend to call this backend
 app.add_middleware(
@@ -38,11 +90,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Stage-Timings", "Idempotent-Replay"],
 )
+# Per-request trace: stage spans -> histograms with trace ID exemplars
+app.add_middleware(TracingMiddleware)
 
 # Initialize model gateway and SLM client (singleton instances)
 model_gateway = get_model_gateway()
 slm_client = get_slm_client()
+clinic_directory = get_clinic_directory()
+followup_prefetcher = get_followup_prefetcher()
+speculative_retriever = get_speculative_retriever()
+hedger = get_hedger()
+emergency_lane = get_emergency_lane()
+user_locks = get_user_locks()
+idempotency_store = get_idempotency_store()
+stage_budget = get_stage_budget()
+openai_breaker = get_breaker("openai")
+write_behind = get_write_behind()
+
+# Heavy resources are created after import, from the lifespan hook (see modules/startup.py)
+warm_up = WarmUp([
+    ("openai_client", get_openai_client),
+    ("supabase_session", get_supabase_session),
+    ("model_gateway", model_gateway.warm_up),
+])
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
 
 class RegisterRequest(BaseModel):
     name: str  # full name
@@ -61,6 +136,10 @@ class ChatRequest(BaseModel):
     language: str = "en"
 
 
+class WebhookMessage(ChatRequest):
+    message_id: str | None = None  # platform message ID, echoed to the outbound sender
+
+
 class AnswerItem(BaseModel):
     question_key: str
     selected_options: list[str]
@@ -103,11 +182,65 @@ class LoginRequest(BaseModel):
     password: str
 
 
+@app.exception_handler(HTTPException)
+async def overload_aware_http_exception_handler(request: Request, exc: HTTPException):
+    """
+    Endpoints wrap upstream failures in HTTPException(500). When the cause was
+    admission control shedding the call, answer 503 + Retry-After instead.
+    """
+    overloaded = exc if isinstance(exc, UpstreamOverloaded) else exc.__context__
+    if isinstance(overloaded, UpstreamOverloaded):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": overloaded.detail},
+            headers=overloaded.headers,
+        )
+    return await http_exception_handler(request, exc)
+
+
 @app.get("/")
 def home():
     return {"message": "Sakhi API working!"}
 
 
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 503 until startup warm-up (clients, routing anchors) has completed.
+    """
+    return JSONResponse(status_code=200 if warm_up.ready else 503, content=warm_up.status())
+
+
+@app.get("/debug/metrics")
+def debug_metrics():
+    """
+    In-process metrics snapshot (SLM pool utilization, speculation, time to first token, ...).
+    """
+    return metrics_snapshot()
+
+
+@app.get("/metrics")
+def prometheus_metrics(request: Request):
+    """
+    Prometheus scrape endpoint. Scrapers that accept OpenMetrics also get
+    exemplars (trace IDs) on the latency histograms.
+    """
+    if "application/openmetrics-text" in request.headers.get("accept", ""):
+        return PlainTextResponse(
+            render_prometheus(openmetrics=True),
+            media_type="application/openmetrics-text; version=1.0.0; charset=utf-8",
+        )
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/user/register")
 def register_user(req: RegisterRequest):
     try:
@@ -157,8 +290,76 @@ def login(req: LoginRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/sakhi/chat")
-async def sakhi_chat(req: ChatRequest):
+async def _embedding_or_none(message: str):
+    """
+    Embedding of the message, or None while the OpenAI breaker is open.
+    """
+    try:
+        return await asyncio.to_thread(generate_embedding, message)
+    except CircuitOpen:
+        return None
+
+
+def _route_around_open_breakers(route: Route, signal: str):
+    """
+    Degraded routing: SLM routes are answered through OpenAI while the SLM
+    breaker is open, and OpenAI routes through the SLM while the OpenAI breaker
+    is open. Returns (route, signal).
+    """
+    if route in (Route.SLM_DIRECT, Route.SLM_RAG):
+        if slm_client.breaker.is_open() and not openai_breaker.is_open():
+            set_trace_route(Route.OPENAI_RAG.value)
+            return Route.OPENAI_RAG, "YES" if route == Route.SLM_RAG else "NO"
+    elif openai_breaker.is_open() and not slm_client.breaker.is_open():
+        route = Route.SLM_RAG if signal == "YES" else Route.SLM_DIRECT
+        set_trace_route(route.value)
+    return route, signal
+
+
+def _generation_stage(route: Route, signal: str) -> str:
+    """
+    The generation stage a turn will run, for budget decisions before it.
+    """
+    if route == Route.SLM_RAG or (route != Route.SLM_DIRECT and signal == "YES"):
+        return "generate_medical"
+    return "generate_smalltalk"
+
+
+async def _intent(message: str, route: Route) -> str:
+    """
+    Generated intent description, or the gateway's canned one when the time
+    left is below the typical cost of generating it (or OpenAI is unavailable).
+    """
+    if openai_breaker.is_open() or not stage_budget.allows("intent"):
+        return model_gateway.get_intent_description(message, route)
+    with stage("intent"):
+        return await asyncio.to_thread(generate_intent, message)
+
+
+def _extract_media(kb_results):
+    """
+    Return (youtube_link, infographic_url) from the first FAQ match that has either.
+    """
+    infographic_url = None
+    youtube_link = None
+    for item in kb_results or []:
+        if item.get("source_type") == "FAQ":
+            if item.get("infographic_url"):
+                infographic_url = item["infographic_url"]
+            if item.get("youtube_link"):
+                youtube_link = item["youtube_link"]
+            # If we found an FAQ match, we likely want to use its metadata
+            if infographic_url or youtube_link:
+                break
+    return youtube_link, infographic_url
+
+
+def _resolve_chat_user(req: ChatRequest):
+    """
+    Resolve (or create) the chat user and run the name/gender/location onboarding.
+    Returns (user, onboarding_payload); onboarding_payload is set when the turn
+    was consumed by onboarding and should be returned as-is.
+    """
     # 1. Resolve or Create User
     user = None
     if req.user_id:
@@ -172,7 +373,7 @@ async def sakhi_chat(req: ChatRequest):
             try:
                 user = create_partial_user(req.phone_number)
                 # Return Welcome Message
-                return {
+                return user, {
                     "reply": "Welcome to Sakhi! I'm here to support you on your health journey. ❤️ \n Let's get started! What should I call you? (Please type just your name, e.g., Deepthi)",
                     "mode": "onboarding"
                 }
@@ -189,14 +390,20 @@ async def sakhi_chat(req: ChatRequest):
     # Handle possible case variants for location
     current_location = user.get("location") or user.get("Location")
 
-    print(f"DEBUG: User={user_id}, Name={current_name}, Gender={current_gender}, Location={current_location}")
+    logger.debug(
+        "Chat user %s (name=%s, gender=%s, location=%s)",
+        user_id,
+        bool(current_name),
+        bool(current_gender),
+        bool(current_location),
+    )
 
     msg = req.message.strip()
 
     # STATE 1: WAITING FOR NAME (User sent Name)
     if not current_name:
         update_user_profile(user_id, {"name": msg})
-        return {
+        return user, {
             "reply": f"Nice to meet you, {msg}! Can you let me know your gender ? (Please reply with 'Male' or 'Female')",
             "mode": "onboarding"
         }
@@ -204,7 +411,7 @@ async def sakhi_chat(req: ChatRequest):
     # STATE 2: WAITING FOR GENDER (User sent Gender)
     elif not current_gender:
         update_user_profile(user_id, {"gender": msg})
-        return {
+        return user, {
             "reply": "Got it. And finally, what's your location (City/Town)? (e.g., Vizag)",
             "mode": "onboarding"
         }
@@ -227,189 +434,754 @@ async def sakhi_chat(req: ChatRequest):
             "Visit the Website below for more information"
         )
         
-        return {
+        return user, {
             "reply": long_intro, 
             "mode": "onboarding_complete",
             "image": "Sakhi_intro.png"
         }
 
-    # 3. Normal Flow
-    try:
-        save_user_message(user_id, req.message, req.language)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+    return user, None
+
 
-    # STEP 0: Decide routing using Model Gateway
-    route = model_gateway.decide_route(req.message)
+def _spawn_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
-    # Step 1: classify message
+
+def _enter_emergency_lane(user: dict, message: str, language: str, request_started: float):
+    """
+    Pick the localized safety message and raise this user's upstream priority.
+    Returns (safety_message, language_key).
+    """
+    lang_key = detect_reply_language(message, user.get("preferred_language") or language)
+    safety = emergency_lane.safety_message(lang_key)
+    emergency_lane.mark(user.get("user_id"))
+    set_request_priority(PRIORITY_HIGH)
+    set_trace_route("emergency")
+    emergency_lane.record(request_started)
+    return safety, lang_key
+
+
+async def _emergency_followup(user_id: str, lock_key: str, message: str, lang_key: str) -> None:
+    """
+    Detailed answer after an emergency safety reply. Runs in the background at
+    high upstream priority and is saved to the conversation.
+
+    It gets a deadline of its own rather than what was left of the request's,
+    and holds the user's lock, so it starts once the safety turn has finished
+    and is saved before the user's next turn reads history.
+    """
+    reset_deadline()
+    start_deadline()
     try:
-        classification = classify_message(req.message)
+        async with user_locks.hold(lock_key):
+            profile = await asyncio.to_thread(get_user_profile, user_id)
+            user_name = profile.get("name") if profile else None
+            history = await asyncio.to_thread(get_last_messages, user_id, 5)
+            answer, _kb = await asyncio.to_thread(
+                generate_medical_response,
+                message,
+                LANGUAGE_LABELS.get(lang_key, "English"),
+                history,
+                user_name,
+            )
+            await asyncio.to_thread(save_sakhi_message, user_id, answer, lang_key)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to classify message: {e}")
+        logger.error("Emergency follow-up generation failed for %s: %s", user_id, e)
 
-    detected_lang = classification.get("language", req.language)
-    signal = classification.get("signal", "NO")
 
-    # Fetch user name for personalization
-    user_name = None
-    try:
-        profile = get_user_profile(user_id)
-        if profile:
-            user_name = profile.get("name")
-    except Exception:
-        user_name = None
+@app.post("/sakhi/chat")
+async def sakhi_chat(
+    req: ChatRequest,
+    response: Response,
+    idempotency_key: str | None = Header(default=None),
+):
+    """
+    Replays (same Idempotency-Key, or with IDEMPOTENCY_DERIVED_KEYS the same
+    message from the same user within IDEMPOTENCY_WINDOW_S) get the original
+    reply without any upstream work and an Idempotent-Replay: true header.
+    """
+    reply, replayed = await _chat_turn(req, idempotency_key)
+    if replayed:
+        response.headers["Idempotent-Replay"] = "true"
+    return reply
 
-    # Conversation history for both modes
-    history = get_last_messages(user_id, limit=5)
 
-    # ===== ROUTE 1: SLM_DIRECT (Small talk, no RAG) =====
-    if route == Route.SLM_DIRECT:
-        try:
-            final_ans = await slm_client.generate_chat(
-                message=req.message,
-                language=detected_lang,
-                user_name=user_name,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate SLM chat response: {e}")
-        
+async def _chat_turn(req: ChatRequest, idempotency_key: str | None = None):
+    """
+    One chat turn: deduplicated by idempotency key, then run under the user's lock.
+    The request deadline (REQUEST_DEADLINE_S) starts here. Returns (reply, replayed).
+    """
+    start_deadline()
+    lock_key = user_key(req.user_id, req.phone_number)
+    keyed = idempotency_store.key_for(idempotency_key, lock_key, req.message, req.language)
+
+    async def run_turn():
+        # One turn at a time per user; other users run in parallel
+        async with user_locks.hold(lock_key):
+            return await _sakhi_chat(req)
+
+    return await idempotency_store.run(keyed, run_turn)
+
+
+async def _sakhi_chat(req: ChatRequest):
+    request_started = time.perf_counter()
+
+    with stage("resolve_user"):
+        user, onboarding_reply = await asyncio.to_thread(_resolve_chat_user, req)
+    if onboarding_reply:
+        set_trace_route("onboarding")
+        return onboarding_reply
+
+    user_id = user.get("user_id")
+    current_location = user.get("location") or user.get("Location")
+    if emergency_lane.is_priority(user_id):
+        set_request_priority(PRIORITY_HIGH)
+
+    # 3. Normal Flow
+    try:
+        with stage("save_message"):
+            await asyncio.to_thread(save_user_message, user_id, req.message, req.language)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+
+    # A tapped/retyped follow-up from the previous reply may already be retrieved
+    prefetched = followup_prefetcher.lookup(user_id, req.message)
+
+    # Speculative mode: start retrieval as soon as the embedding exists, so it
+    # overlaps with routing and classification (discarded if no RAG is needed)
+    query_embedding = prefetched["embedding"] if prefetched else None
+    if query_embedding is None and (emergency_lane.enabled or speculative_retriever.enabled):
+        with stage("embedding"):
+            query_embedding = await _embedding_or_none(req.message)
+
+    # Emergency lane: safety message right away, detailed answer in the background
+    if (
+        emergency_lane.enabled
+        and query_embedding is not None
+        and emergency_lane.is_emergency(await asyncio.to_thread(model_gateway.emergency_similarity, query_embedding))
+    ):
+        safety, lang_key = _enter_emergency_lane(user, req.message, req.language, request_started)
         try:
-            save_sakhi_message(user_id, final_ans, detected_lang)
+            with stage("save_reply"):
+                await asyncio.to_thread(save_sakhi_message, user_id, safety, lang_key)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-        
-        # Generate intent description dynamically
-        intent = generate_intent(req.message)
-        
+        _spawn_background(_emergency_followup(user_id, user_key(req.user_id, req.phone_number), req.message, lang_key))
         return {
-            "intent": intent,
-            "reply": final_ans,
-            "mode": "general",
-            "language": detected_lang,
-            "route": "slm_direct"
+            "intent": model_gateway.get_intent_description(req.message, Route.OPENAI_RAG),
+            "reply": safety,
+            "mode": "emergency",
+            "language": lang_key,
+            "follow_ups": [],
+            "route": "emergency",
+            "detailed_reply_pending": True,
         }
-    
-    # ===== ROUTE 2: SLM_RAG (Simple medical, RAG + SLM) =====
-    elif route == Route.SLM_RAG:
-        # Perform RAG search
+
+    speculation = None
+    if speculative_retriever.enabled and not prefetched and query_embedding is not None:
+        speculation = speculative_retriever.start(req.message, query_embedding)
+
+    # Routes without retrieval, and stages that raise, discard the speculation in the finally
+    try:
+        # STEP 0: Decide routing using Model Gateway
+        with stage("route"):
+            try:
+                route = await asyncio.to_thread(model_gateway.decide_route, req.message, embedding=query_embedding)
+            except CircuitOpen:
+                # Semantic routing needs embeddings: answer medically through the SLM
+                route = Route.SLM_RAG
+        set_trace_route(route.value)
+
+        # ===== ROUTE 0: FACILITY_INFO (Clinic directory lookup, no LLM) =====
+        if route == Route.FACILITY_INFO:
+            reply_lang = detect_reply_language(req.message, req.language)
+            with stage("facility_lookup"):
+                facility_reply = await asyncio.to_thread(
+                    clinic_directory.answer, req.message, reply_lang, default_city=current_location
+                )
+            if facility_reply:
+                try:
+                    with stage("save_reply"):
+                        await asyncio.to_thread(save_sakhi_message, user_id, facility_reply, reply_lang)
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+
+                return {
+                    "intent": model_gateway.get_intent_description(req.message, route),
+                    "reply": facility_reply,
+                    "mode": "facility",
+                    "language": reply_lang,
+                    "route": "facility_info"
+                }
+            # Not in the directory: answer through the SLM RAG path
+            route = Route.SLM_RAG
+            set_trace_route(route.value)
+
+        # Step 1: classify message
         try:
-            kb_results = hierarchical_rag_query(req.message)
-            context_text = format_hierarchical_context(kb_results)
+            with stage("classify"):
+                classification = await asyncio.to_thread(classify_message, req.message)
+        except CircuitOpen:
+            # Classifier unavailable: keep the requested language and trust the route
+            classification = {"language": req.language, "signal": "NO" if route == Route.SLM_DIRECT else "YES"}
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to classify message: {e}")
+
+        detected_lang = classification.get("language", req.language)
+        signal = classification.get("signal", "NO")
+        route, signal = _route_around_open_breakers(route, signal)
+
+        # Optional lookups are skipped when the rest of the turn would not fit the budget
+        generate_stage = _generation_stage(route, signal)
+
+        # Fetch user name for personalization
+        user_name = user.get("name")
+        if stage_budget.allows("profile", "history", generate_stage):
+            try:
+                with stage("profile"):
+                    profile = await asyncio.to_thread(get_user_profile, user_id)
+                if profile:
+                    user_name = profile.get("name")
+            except Exception:
+                user_name = None
+
+        # Conversation history for both modes
+        history = []
+        if stage_budget.allows("history", generate_stage):
+            with stage("history"):
+                history = await asyncio.to_thread(get_last_messages, user_id, limit=5)
+
+        # ===== ROUTE 1: SLM_DIRECT (Small talk, no RAG) =====
+        if route == Route.SLM_DIRECT:
+            try:
+                with stage("generate_smalltalk"):
+                    final_ans, winner = await hedger.run(
+                        "slm_direct",
+                        primary=lambda: slm_client.generate_chat(
+                            message=req.message,
+                            language=detected_lang,
+                            user_name=user_name,
+                        ),
+                        backup=lambda: generate_smalltalk_response(
+                            req.message,
+                            detected_lang,
+                            history,
+                            user_name=user_name,
+                        ),
+                    )
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to generate SLM chat response: {e}")
+            if winner != "primary":
+                set_trace_route("openai_smalltalk")
+            
+            try:
+                with stage("save_reply"):
+                    await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+            
+            # Generate intent description dynamically
+            intent = await _intent(req.message, route)
+            
+            return {
+                "intent": intent,
+                "reply": final_ans,
+                "mode": "general",
+                "language": detected_lang,
+                "route": "slm_direct" if winner == "primary" else "openai_smalltalk"
+            }
         
-        # Generate response using SLM with context
+        # ===== ROUTE 2: SLM_RAG (Simple medical, RAG + SLM) =====
+        elif route == Route.SLM_RAG:
+            # Perform RAG search
+            try:
+                with stage("retrieval"):
+                    if prefetched:
+                        kb_results = prefetched["kb_results"]
+                    elif speculation:
+                        kb_results = await speculation.result()
+                    else:
+                        kb_results = await asyncio.to_thread(hierarchical_rag_query, req.message)
+            except CircuitOpen:
+                # No embeddings for retrieval: answer without context
+                kb_results = []
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
+            context_text = format_hierarchical_context(kb_results)
+            
+            # Generate response using SLM with context
+            try:
+                with stage("generate_medical"):
+                    final_ans, winner = await hedger.run(
+                        "slm_rag",
+                        primary=lambda: slm_client.generate_rag_response(
+                            context=context_text,
+                            message=req.message,
+                            language=detected_lang,
+                            user_name=user_name,
+                        ),
+                        backup=lambda: generate_medical_response(
+                            prompt=req.message,
+                            target_lang=detected_lang,
+                            history=history,
+                            user_name=user_name,
+                            kb_results=kb_results,
+                        )[0],
+                    )
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to generate SLM RAG response: {e}")
+            if winner != "primary":
+                set_trace_route("openai_rag")
+            
+            try:
+                with stage("save_reply"):
+                    await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+            
+            # Extract metadata from KB results
+            youtube_link, infographic_url = _extract_media(kb_results)
+            
+            # Generate intent description dynamically
+            intent = await _intent(req.message, route)
+            
+            _, follow_ups = split_follow_ups(final_ans)
+            followup_prefetcher.schedule(user_id, follow_ups)
+            
+            response_payload = {
+                "intent": intent,
+                "reply": final_ans,
+                "mode": "medical",
+                "language": detected_lang,
+                "youtube_link": youtube_link,
+                "infographic_url": infographic_url,
+                "follow_ups": follow_ups,
+                "route": "slm_rag" if winner == "primary" else "openai_rag"
+            }
+            logger.info("Chat reply sent (route=%s)", response_payload["route"], extra={"payload": response_payload})
+            return response_payload
+
+        # Keep existing small talk logic as fallback (though routing should handle this)
+        if signal != "YES":
+            # Small-talk mode: no RAG
+            set_trace_route("openai_smalltalk")
+            try:
+                with stage("generate_smalltalk"):
+                    final_ans = await asyncio.to_thread(
+                        generate_smalltalk_response,
+                        req.message,
+                        detected_lang,
+                        history,
+                        user_name=user_name,
+                        store_to_kb=False,
+                    )
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to generate small-talk response: {e}")
+
+            try:
+                with stage("save_reply"):
+                    await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+
+            return {"reply": final_ans, "mode": "general", "language": detected_lang}
+
+        # ===== ROUTE 3: OPENAI_RAG (Complex medical or default, RAG + GPT-4) =====
+        # Medical mode: RAG
         try:
-            final_ans = await slm_client.generate_rag_response(
-                context=context_text,
-                message=req.message,
-                language=detected_lang,
-                user_name=user_name,
-            )
+            if speculation:
+                with stage("retrieval"):
+                    prefetched_kb = await speculation.result()
+            else:
+                prefetched_kb = prefetched["kb_results"] if prefetched else None
+            if prefetched and prefetched.get("answer"):
+                final_ans, _kb = prefetched["answer"], prefetched["kb_results"]
+            else:
+                # Includes retrieval when nothing was prefetched or speculated
+                with stage("generate_medical"):
+                    final_ans, _kb = await asyncio.to_thread(
+                        generate_medical_response,
+                        prompt=req.message,
+                        target_lang=detected_lang,
+                        history=history,
+                        user_name=user_name,
+                        kb_results=prefetched_kb,
+                    )
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate SLM RAG response: {e}")
-        
+            raise HTTPException(status_code=500, detail=f"Failed to generate medical response: {e}")
+
         try:
-            save_sakhi_message(user_id, final_ans, detected_lang)
+            with stage("save_reply"):
+                await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-        
-        # Extract metadata from KB results
-        infographic_url = None
-        youtube_link = None
-        if kb_results:
-            for item in kb_results:
-                if item.get("source_type") == "FAQ":
-                    if item.get("infographic_url"):
-                        infographic_url = item["infographic_url"]
-                    if item.get("youtube_link"):
-                        youtube_link = item["youtube_link"]
-                    if infographic_url or youtube_link:
-                        break
-        
+
+        # Extract infographic_url and youtube_link if available in kb_results
+        youtube_link, infographic_url = _extract_media(_kb)
+
         # Generate intent description dynamically
-        intent = generate_intent(req.message)
+        intent = await _intent(req.message, route)
+        
+        # Pre-retrieve the suggested follow-ups so a tapped one answers faster
+        _, follow_ups = split_follow_ups(final_ans)
+        followup_prefetcher.schedule(
+            user_id,
+            follow_ups,
+            answer_fn=lambda question, kb: generate_medical_response(
+                prompt=question,
+                target_lang=detected_lang,
+                history=history + [
+                    {"role": "user", "content": req.message},
+                    {"role": "sakhi", "content": final_ans},
+                ],
+                user_name=user_name,
+                kb_results=kb,
+            )[0],
+        )
         
         response_payload = {
             "intent": intent,
-            "reply": final_ans,
-            "mode": "medical",
+            "reply": final_ans, 
+            "mode": "medical", 
             "language": detected_lang,
             "youtube_link": youtube_link,
             "infographic_url": infographic_url,
-            "route": "slm_rag"
+            "follow_ups": follow_ups,
+            "route": "openai_rag"
         }
-        print(f"Response Payload: {response_payload}")
+        logger.info("Chat reply sent (route=%s)", response_payload["route"], extra={"payload": response_payload})
         return response_payload
+    finally:
+        if speculation:
+            speculation.discard()
 
-    # Keep existing small talk logic as fallback (though routing should handle this)
-    if signal != "YES":
-        # Small-talk mode: no RAG
-        try:
-            final_ans = generate_smalltalk_response(
-                req.message,
-                detected_lang,
-                history,
-                user_name=user_name,
-                store_to_kb=False,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate small-talk response: {e}")
-
-        try:
-            save_sakhi_message(user_id, final_ans, detected_lang)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
 
-        return {"reply": final_ans, "mode": "general", "language": detected_lang}
+async def _emergency_events(user: dict, req: ChatRequest, request_started: float):
+    """
+    SSE events for the emergency lane: the safety message first, then the detailed
+    answer streamed at high upstream priority.
+    """
+    user_id = user.get("user_id")
+    safety, lang_key = _enter_emergency_lane(user, req.message, req.language, request_started)
+    yield sse_event("meta", {"route": "emergency", "mode": "emergency", "language": lang_key})
+    yield sse_event("safety", {"text": safety})
 
-    # ===== ROUTE 3: OPENAI_RAG (Complex medical or default, RAG + GPT-4) =====
-    # Medical mode: RAG
     try:
-        final_ans, _kb = generate_medical_response(
-            prompt=req.message,
-            target_lang=detected_lang,
-            history=history,
-            user_name=user_name,
+        await asyncio.to_thread(save_sakhi_message, user_id, safety, lang_key)
+        history = await asyncio.to_thread(get_last_messages, user_id, 5)
+        token_iter, kb_results = await asyncio.to_thread(
+            stream_medical_response,
+            req.message,
+            LANGUAGE_LABELS.get(lang_key, "English"),
+            history,
+            user.get("name"),
         )
+        parts = []
+        tokens = iterate_in_thread(token_iter)
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+        finally:
+            # Releases the upstream slot when the client goes away mid-stream
+            await tokens.aclose()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate medical response: {e}")
+        logger.error("Emergency streaming failed: %s", e)
+        yield sse_event("error", {"detail": getattr(e, "detail", None) or str(e)})
+        return
 
+    final_ans = truncate_response("".join(parts))
     try:
-        save_sakhi_message(user_id, final_ans, detected_lang)
+        await asyncio.to_thread(save_sakhi_message, user_id, final_ans, lang_key)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+        logger.error("Failed to save streamed Sakhi message: %s", e)
 
-    # Extract infographic_url and youtube_link if available in kb_results
-    infographic_url = None
-    youtube_link = None
-
-    if _kb:
-        for item in _kb:
-            if item.get("source_type") == "FAQ":
-                if item.get("infographic_url"):
-                    infographic_url = item["infographic_url"]
-                if item.get("youtube_link"):
-                    youtube_link = item["youtube_link"]
-                # If we found an FAQ match, we likely want to use its metadata
-                if infographic_url or youtube_link:
-                    break
-
-    # Generate intent description dynamically
-    intent = generate_intent(req.message)
-    
-    response_payload = {
-        "intent": intent,
-        "reply": final_ans, 
-        "mode": "medical", 
-        "language": detected_lang,
+    youtube_link, infographic_url = _extract_media(kb_results)
+    _, follow_ups = split_follow_ups(final_ans)
+    yield sse_event("meta", {
+        "intent": model_gateway.get_intent_description(req.message, Route.OPENAI_RAG),
         "youtube_link": youtube_link,
         "infographic_url": infographic_url,
-        "route": "openai_rag"
-    }
-    print(f"Response Payload: {response_payload}")
-    return response_payload
+        "follow_ups": follow_ups,
+    })
+    yield sse_event("done", {"reply": final_ans})
+
+
+@app.post("/sakhi/chat/stream")
+async def sakhi_chat_stream(req: ChatRequest):
+    """
+    Streaming variant of /sakhi/chat; see _sakhi_chat_stream for the events.
+    The user's lock is held until the stream has been fully sent (or aborted).
+    """
+    start_deadline()
+    lease = await user_locks.acquire(user_key(req.user_id, req.phone_number))
+    try:
+        response = await _sakhi_chat_stream(req)
+    except BaseException:
+        lease.release()
+        raise
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = _release_after(response.body_iterator, lease)
+        # Also runs when the client disconnects mid-stream
+        response.background = BackgroundTask(lease.release)
+    else:
+        lease.release()
+    return response
+
+
+async def _release_after(events, lease):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        lease.release()
+
+
+async def _sakhi_chat_stream(req: ChatRequest):
+    """
+    Streaming variant of /sakhi/chat (Server-Sent Events).
+
+    Events, in order:
+    - meta:  {"route", "mode", "language"} as soon as routing is decided
+    - safety: {"text"} emergency lane only, the safety message before any generation
+    - token: {"text"} for each generated chunk
+    - meta:  {"intent", "youtube_link", "infographic_url", "follow_ups"} after generation
+    - done:  {"reply"} with the final (truncated) reply, which is also persisted
+    - error: {"detail"} if generation fails mid-stream
+    """
+    request_started = time.perf_counter()
+
+    with stage("resolve_user"):
+        user, onboarding_reply = await asyncio.to_thread(_resolve_chat_user, req)
+    if onboarding_reply:
+        set_trace_route("onboarding")
+
+        async def onboarding_events():
+            yield sse_event("meta", {"mode": onboarding_reply.get("mode")})
+            yield sse_event("token", {"text": onboarding_reply["reply"]})
+            yield sse_event("done", onboarding_reply)
+        return StreamingResponse(onboarding_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    user_id = user.get("user_id")
+    current_location = user.get("location") or user.get("Location")
+    if emergency_lane.is_priority(user_id):
+        set_request_priority(PRIORITY_HIGH)
+
+    try:
+        with stage("save_message"):
+            await asyncio.to_thread(save_user_message, user_id, req.message, req.language)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+
+    prefetched = followup_prefetcher.lookup(user_id, req.message)
+    query_embedding = prefetched["embedding"] if prefetched else None
+    if query_embedding is None and emergency_lane.enabled:
+        with stage("embedding"):
+            query_embedding = await _embedding_or_none(req.message)
+
+    if (
+        emergency_lane.enabled
+        and query_embedding is not None
+        and emergency_lane.is_emergency(await asyncio.to_thread(model_gateway.emergency_similarity, query_embedding))
+    ):
+        return StreamingResponse(
+            _emergency_events(user, req, request_started),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+
+    with stage("route"):
+        try:
+            route = await asyncio.to_thread(model_gateway.decide_route, req.message, embedding=query_embedding)
+        except CircuitOpen:
+            # Semantic routing needs embeddings: answer medically through the SLM
+            route = Route.SLM_RAG
+    set_trace_route(route.value)
+
+    # Facility answers are templated, so they go out as a single token
+    if route == Route.FACILITY_INFO:
+        reply_lang = detect_reply_language(req.message, req.language)
+        with stage("facility_lookup"):
+            facility_reply = await asyncio.to_thread(
+                clinic_directory.answer, req.message, reply_lang, default_city=current_location
+            )
+        if facility_reply:
+            try:
+                with stage("save_reply"):
+                    await asyncio.to_thread(save_sakhi_message, user_id, facility_reply, reply_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+
+            async def facility_events():
+                yield sse_event("meta", {"route": "facility_info", "mode": "facility", "language": reply_lang})
+                TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - request_started, route="facility_info")
+                yield sse_event("token", {"text": facility_reply})
+                yield sse_event("meta", {
+                    "intent": model_gateway.get_intent_description(req.message, route),
+                    "youtube_link": None,
+                    "infographic_url": None,
+                    "follow_ups": [],
+                })
+                yield sse_event("done", {"reply": facility_reply})
+            return StreamingResponse(facility_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+        route = Route.SLM_RAG
+
+    try:
+        with stage("classify"):
+            classification = await asyncio.to_thread(classify_message, req.message)
+    except CircuitOpen:
+        # Classifier unavailable: keep the requested language and trust the route
+        classification = {"language": req.language, "signal": "NO" if route == Route.SLM_DIRECT else "YES"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to classify message: {e}")
+
+    detected_lang = classification.get("language", req.language)
+    signal = classification.get("signal", "NO")
+    route, signal = _route_around_open_breakers(route, signal)
+
+    user_name = user.get("name")
+    history = []
+    generate_stage = _generation_stage(route, signal)
+    if stage_budget.allows("history", generate_stage):
+        with stage("history"):
+            history = await asyncio.to_thread(get_last_messages, user_id, limit=5)
+
+    kb_results = None
+    if route == Route.SLM_DIRECT:
+        route_label, mode = "slm_direct", "general"
+        tokens = slm_client.stream_chat(req.message, language=detected_lang, user_name=user_name)
+    elif route == Route.SLM_RAG:
+        route_label, mode = "slm_rag", "medical"
+        try:
+            with stage("retrieval"):
+                if prefetched:
+                    kb_results = prefetched["kb_results"]
+                else:
+                    kb_results = await asyncio.to_thread(hierarchical_rag_query, req.message)
+        except CircuitOpen:
+            # No embeddings for retrieval: answer without context
+            kb_results = []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
+        context_text = format_hierarchical_context(kb_results)
+        tokens = slm_client.stream_rag_response(context_text, req.message, language=detected_lang, user_name=user_name)
+    elif signal != "YES":
+        route_label, mode = "openai_smalltalk", "general"
+        tokens = iterate_in_thread(stream_smalltalk_response(req.message, detected_lang, history, user_name=user_name))
+    else:
+        route_label, mode = "openai_rag", "medical"
+        try:
+            with stage("retrieval"):
+                token_iter, kb_results = await asyncio.to_thread(
+                    stream_medical_response,
+                    req.message,
+                    detected_lang,
+                    history,
+                    user_name,
+                    prefetched["kb_results"] if prefetched else None,
+                )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
+        tokens = iterate_in_thread(token_iter)
+    set_trace_route(route_label)
+
+    async def events():
+        yield sse_event("meta", {"route": route_label, "mode": mode, "language": detected_lang})
+
+        parts = []
+        try:
+            with stage("generate_medical" if mode == "medical" else "generate_smalltalk"):
+                async for token in tokens:
+                    if not parts:
+                        ttft = time.perf_counter() - request_started
+                        TIME_TO_FIRST_TOKEN.observe(ttft, route=route_label)
+                        logger.debug("Time to first token: %.3fs (route=%s)", ttft, route_label)
+                    parts.append(token)
+                    yield sse_event("token", {"text": token})
+        except Exception as e:
+            logger.error("Streaming generation failed: %s", e)
+            yield sse_event("error", {"detail": getattr(e, "detail", None) or str(e)})
+            return
+        finally:
+            # Releases the upstream slot when the client goes away mid-stream
+            await tokens.aclose()
+
+        final_ans = truncate_response("".join(parts))
+        try:
+            with stage("save_reply"):
+                await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+        except Exception as e:
+            logger.error("Failed to save streamed Sakhi message: %s", e)
+
+        youtube_link, infographic_url = _extract_media(kb_results)
+        _, follow_ups = split_follow_ups(final_ans) if mode == "medical" else (final_ans, [])
+        followup_prefetcher.schedule(user_id, follow_ups)
+        intent = await _intent(req.message, route)
+
+        yield sse_event("meta", {
+            "intent": intent,
+            "youtube_link": youtube_link,
+            "infographic_url": infographic_url,
+            "follow_ups": follow_ups,
+        })
+        yield sse_event("done", {"reply": final_ans})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def _webhook_turn(req: ChatRequest, received: float):
+    # The budget counts from when the webhook arrived, not from when a worker got to it
+    start_deadline(started=received)
+    reply, _replayed = await _chat_turn(req)
+    return reply
+
+
+def _webhook_message_key(req: ChatRequest, message_id: str):
+    return idempotency_store.key_for(f"webhook:{message_id}", user_key(req.user_id, req.phone_number), req.message)
+
+
+def _webhook_turn_failed(job) -> None:
+    # Let the platform's redelivery of this message run the turn again
+    idempotency_store.release(_webhook_message_key(job.request, job.message_id))
+
+
+# Webhook turns run in a bounded worker pool through the regular chat handler
+webhook_ingest = WebhookIngest(handler=_webhook_turn, on_failure=_webhook_turn_failed)
+
+
+@app.post("/webhook/message", status_code=202)
+async def webhook_message(req: WebhookMessage):
+    """
+    Validate and enqueue an inbound message, then acknowledge immediately.
+    The reply is delivered later through the outbound sender (modules/outbound.py).
+    """
+    received = time.perf_counter()
+    recipient = req.phone_number or req.user_id
+    if not recipient:
+        raise HTTPException(status_code=400, detail="user_id or phone_number is required")
+    if not req.message.strip():
+        raise HTTPException(status_code=400, detail="message is empty")
+    set_trace_route("webhook_ack")
+    chat_req = ChatRequest(
+        user_id=req.user_id,
+        phone_number=req.phone_number,
+        message=req.message,
+        language=req.language,
+    )
+    # Platform redeliveries of the same message ID are acknowledged but not processed again
+    message_id = req.message_id or uuid.uuid4().hex
+    keyed = _webhook_message_key(chat_req, message_id) if req.message_id else None
+    if not idempotency_store.claim(keyed):
+        return {"status": "duplicate", "message_id": message_id, "queue_depth": webhook_ingest.depth()}
+    try:
+        job = webhook_ingest.submit(chat_req, recipient, message_id, received)
+    except UpstreamOverloaded:
+        # Not queued: the platform's retry after the 503 must be processed
+        idempotency_store.release(keyed)
+        raise
+    return {"status": "accepted", "message_id": job.message_id, "queue_depth": webhook_ingest.depth()}
 
 
 @app.post("/user/answers")
@@ -426,10 +1198,11 @@ def save_user_answers(req: UserAnswersRequest):
             raise HTTPException(status_code=400, detail="selected_options must be non-empty for each answer")
 
     try:
-        saved_count, _ = save_bulk_answers(
-            user_id=req.user_id,
-            answers=[a.dict() for a in req.answers],
-        )
+        with stage("save_answers"):
+            saved_count, _ = save_bulk_answers(
+                user_id=req.user_id,
+                answers=[a.dict() for a in req.answers],
+            )
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
@@ -490,7 +1263,8 @@ def onboarding_step(req: OnboardingStepRequest):
         )
         
         # Get next question or completion status
-        response = get_next_question(onboarding_request)
+        with stage("onboarding_engine"):
+            response = get_next_question(onboarding_request)
         
         return response.to_dict()
         
@@ -506,11 +1280,14 @@ def onboarding_complete(req: OnboardingCompleteRequest):
     Store completed onboarding answers to parent_profiles table.
     """
     import traceback
-    
-    print(f"DEBUG: Received onboarding complete request")
-    print(f"DEBUG: user_id={req.user_id}, relationship={req.relationship_type}")
-    print(f"DEBUG: parent_profile_id={req.parent_profile_id}")
-    print(f"DEBUG: answers_json={req.answers_json}")
+
+    logger.info(
+        "Onboarding complete for user %s (relationship=%s, parent_profile_id=%s)",
+        req.user_id,
+        req.relationship_type,
+        req.parent_profile_id,
+        extra={"answers": req.answers_json},
+    )
     
     if not req.user_id or not req.relationship_type:
         raise HTTPException(
@@ -522,14 +1299,12 @@ def onboarding_complete(req: OnboardingCompleteRequest):
         # Create or update parent profile
         if req.parent_profile_id:
             # Update existing profile
-            print(f"DEBUG: Updating existing profile")
             profile = update_parent_profile_answers(
                 parent_profile_id=req.parent_profile_id,
                 answers_json=req.answers_json
             )
         else:
             # Create new profile
-            print(f"DEBUG: Creating new profile")
             profile = create_parent_profile(
                 user_id=req.user_id,
                 target_user_id=req.target_user_id,
@@ -537,7 +1312,6 @@ def onboarding_complete(req: OnboardingCompleteRequest):
                 answers_json=req.answers_json
             )
         
-        print(f"DEBUG: Success! Profile={profile}")
         return {
             "status": "success",
             "parent_profile_id": profile.get("parent_profile"),
@@ -546,6 +1320,5 @@ def onboarding_complete(req: OnboardingCompleteRequest):
         
     except Exception as e:
         error_trace = traceback.format_exc()
-        print(f"ERROR in onboarding_complete: {e}")
-        print(f"TRACEBACK: {error_trace}")
+        logger.exception("onboarding_complete failed for user %s", req.user_id)
         raise HTTPException(status_code=500, detail=f"{str(e)} | Trace: {error_trace[:500]}")
@@ -0,0 +1,209 @@
+# modules/circuit_breaker.py
+"""
+Circuit breakers per dependency, so a degraded upstream fails fast.
+
+Without a breaker every request waits for the full timeout of a dependency
+that is down, and the backlog grows. Each dependency call runs inside its
+breaker:
+
+    with get_breaker("postgrest_write").guard():
+        resp = session.post(...)
+
+- closed:    calls pass; BREAKER_FAILURES consecutive failures open it
+- open:      calls fail immediately with CircuitOpen (503 + Retry-After)
+             for BREAKER_RESET_S
+- half_open: after that, one probe call is let through; success closes the
+             breaker, failure opens it again
+
+Failures are timeouts, connection errors and 5xx answers. 4xx answers mean
+the dependency is up, and local load shedding (UpstreamOverloaded) or
+cancellation says nothing about it, so neither counts.
+
+Dependencies and their degraded behaviour:
+- rpc_hierarchical_search, rpc_match_faq (and other RPCs): retrieval returns
+  what is available, so the reply is generated without that context
+- postgrest_write: conversation rows go to the write-behind queue
+  (modules/write_behind.py)
+- slm: SLM routes are answered through OpenAI
+- openai: OpenAI routes are answered through the SLM; classification and
+  intent fall back to defaults
+
+Thresholds can be set per dependency: BREAKER_<NAME>_FAILURES, BREAKER_<NAME>_RESET_S.
+
+Metrics:
+- sakhi_breaker_state{dependency}                -> 0 closed, 1 half_open, 2 open
+- sakhi_breaker_transitions_total{dependency, state}
+- sakhi_breaker_rejected_total{dependency}       -> calls failed fast while open
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from modules.metrics import counter, gauge
+from modules.upstream_limiter import UpstreamOverloaded
+
+BREAKER_STATE = gauge("sakhi_breaker_state", "Circuit breaker state per dependency (0 closed, 1 half_open, 2 open)")
+BREAKER_TRANSITIONS = counter("sakhi_breaker_transitions_total", "Circuit breaker state changes per dependency")
+BREAKER_REJECTED = counter("sakhi_breaker_rejected_total", "Calls failed fast because the dependency's breaker was open")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(UpstreamOverloaded):
+    """
+    Raised instead of calling a dependency whose breaker is open. Maps to 503 + Retry-After.
+    """
+
+    def __init__(self, dependency: str, retry_after: int):
+        super().__init__(dependency, retry_after)
+        self.detail = f"Dependency '{dependency}' is unavailable, please retry"
+        self.dependency = dependency
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    """
+    Whether an exception raised by a dependency call says the dependency is unhealthy.
+    """
+    if not isinstance(exc, Exception) or isinstance(exc, UpstreamOverloaded):
+        return False
+    # Errors that wrap an upstream answer (e.g. SLMUpstreamError, a 502 for any
+    # SLM error status) are judged by the upstream's own status
+    status = getattr(exc, "upstream_status", None)
+    if not isinstance(status, int):
+        status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return True
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker with a single half-open probe. Thread-safe.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            name: Dependency label used in metrics and errors
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds to stay open before letting a probe through
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, dependency=name)
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        # Called with the lock held
+        if state == self._state:
+            return
+        self._state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], dependency=self.name)
+        BREAKER_TRANSITIONS.inc(dependency=self.name, state=state)
+
+    def is_open(self) -> bool:
+        """
+        True while calls would be rejected. Unlike allow(), does not take the probe,
+        so handlers can use it to pick a degraded path up front.
+        """
+        with self._lock:
+            if self._state == OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self._state == HALF_OPEN and self._probing
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go out now (takes the probe when half-open).
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def _release_probe(self) -> None:
+        # The call ended without telling us anything; let the next caller probe
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self) -> int:
+        left = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, int(left + 0.999))
+
+    @contextmanager
+    def guard(self):
+        """
+        Run the enclosed dependency call, or raise CircuitOpen right away.
+        """
+        if not self.allow():
+            BREAKER_REJECTED.inc(dependency=self.name)
+            raise CircuitOpen(self.name, self.retry_after())
+        try:
+            yield
+        except BaseException as e:
+            if counts_as_failure(e):
+                self.record_failure()
+            else:
+                self._release_probe()
+            raise
+        self.record_success()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Breaker for a dependency, created on first use. Thresholds come from
+    BREAKER_<NAME>_FAILURES / BREAKER_<NAME>_RESET_S, falling back to
+    BREAKER_FAILURES (default 5) and BREAKER_RESET_S (default 30).
+    """
+    breaker = _breakers.get(name)
+    if breaker is not None:
+        return breaker
+    with _breakers_lock:
+        if name not in _breakers:
+            prefix = f"BREAKER_{name.upper()}"
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv(f"{prefix}_FAILURES", os.getenv("BREAKER_FAILURES", "5"))),
+                reset_timeout=float(os.getenv(f"{prefix}_RESET_S", os.getenv("BREAKER_RESET_S", "30"))),
+            )
+        return _breakers[name]
+
@@ -0,0 +1,325 @@
+# modules/clinic_directory.py
+"""
+Structured, in-memory clinic directory for facility queries.
+
+Facility questions ("vizag clinic address", "phone number for vijayawada branch")
+are answered by a direct lookup over clinic records instead of embedding + RPC +
+SLM generation. Records come from two sources:
+
+1. A curated JSON file (CLINIC_DIRECTORY_PATH, default: clinic_directory.json).
+   No file is shipped: it must hold the branches' verified details, since
+   replies are sent to patients as is:
+       {"clinics": [{"city": "...", "branch": "...", "address": "...",
+                     "phone": "...", "timings": "...", "aliases": ["..."]}]}
+2. The hospital info documents (CLINIC_INFO_FILES, comma separated, default:
+   emo_hospital_info.json). Sections that mention a known city together with a
+   phone number are turned into clinic records.
+
+With no records (the default) answer() returns None and facility questions
+go through the SLM RAG path. If nothing matches, callers fall back the same way.
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Canonical city -> spellings users actually type (English, Tinglish, Telugu script)
+CITY_ALIASES: Dict[str, List[str]] = {
+    "Visakhapatnam": ["visakhapatnam", "vizag", "vishakapatnam", "visakapatnam", "vishakhapatnam", "vsp", "విశాఖపట్నం", "విశాఖ", "వైజాగ్"],
+    "Vijayawada": ["vijayawada", "bezawada", "vja", "విజయవాడ", "बेजवाडा"],
+    "Hyderabad": ["hyderabad", "hyd", "secunderabad", "హైదరాబాద్", "हैदराबाद"],
+    "Guntur": ["guntur", "గుంటూరు"],
+    "Rajahmundry": ["rajahmundry", "rajamahendravaram", "rjy", "రాజమండ్రి", "రాజమహేంద్రవరం"],
+    "Kakinada": ["kakinada", "కాకినాడ"],
+    "Nellore": ["nellore", "నెల్లూరు"],
+    "Tirupati": ["tirupati", "tirupathi", "తిరుపతి"],
+    "Warangal": ["warangal", "వరంగల్"],
+}
+
+# Which detail the user is after
+FIELD_KEYWORDS: Dict[str, List[str]] = {
+    "phone": ["phone", "number", "contact", "call", "mobile", "ఫోన్", "నంబర్", "फ़ोन", "फोन", "नंबर"],
+    "address": ["address", "location", "located", "where", "reach", "direction", "ekkada", "ఎక్కడ", "చిరునామా", "पता", "कहाँ", "कहां"],
+    "timings": ["timing", "time", "hours", "open", "close", "samayam", "సమయం", "సమయాలు", "समय"],
+}
+
+_PHONE_PATTERN = re.compile(r"(?:\+?91[\s-]?)?(?:[6-9]\d{4}[\s-]?\d{5}|0\d{2,4}[\s-]?\d{6,8})")
+_TIMINGS_PATTERN = re.compile(
+    r"((?:(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\s*(?:-|to|–)\s*(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*[,:]?\s*)?"
+    r"\d{1,2}(?::\d{2})?\s*(?:am|pm)\s*(?:-|to|–)\s*\d{1,2}(?::\d{2})?\s*(?:am|pm))",
+    re.IGNORECASE,
+)
+_ADDRESS_PATTERN = re.compile(r"(?:address|located at)\s*[:\-]?\s*([^\n]+?)(?:\.\s|\n|$)", re.IGNORECASE)
+
+# Reply templates per language
+TEMPLATES: Dict[str, Dict[str, str]] = {
+    "en": {
+        "header": "Here are the details for our {branch} clinic:",
+        "address": "📍 Address: {value}",
+        "phone": "📞 Phone: {value}",
+        "timings": "🕘 Timings: {value}",
+        "list": "We have clinics in {cities}. Tell me which city you are in and I will share the address and phone number.",
+    },
+    "te": {
+        "header": "మా {branch} క్లినిక్ వివరాలు:",
+        "address": "📍 చిరునామా: {value}",
+        "phone": "📞 ఫోన్: {value}",
+        "timings": "🕘 సమయాలు: {value}",
+        "list": "మాకు {cities} లో క్లినిక్‌లు ఉన్నాయి. మీరు ఏ నగరంలో ఉన్నారో చెప్పండి, చిరునామా మరియు ఫోన్ నంబర్ పంపిస్తాను.",
+    },
+    "tinglish": {
+        "header": "Mana {branch} clinic details ivi:",
+        "address": "📍 Address: {value}",
+        "phone": "📞 Phone: {value}",
+        "timings": "🕘 Timings: {value}",
+        "list": "Maaku {cities} lo clinics unnayi. Meeru ye city lo unnaro cheppandi, address and phone number pampistanu.",
+    },
+    "hi": {
+        "header": "हमारे {branch} क्लिनिक की जानकारी:",
+        "address": "📍 पता: {value}",
+        "phone": "📞 फ़ोन: {value}",
+        "timings": "🕘 समय: {value}",
+        "list": "हमारे क्लिनिक {cities} में हैं। आप किस शहर में हैं, बताइए — मैं पता और फ़ोन नंबर भेज दूँगी।",
+    },
+}
+
+
+def normalize_language(language: Optional[str]) -> str:
+    """
+    Map classifier/request language labels ("Telugu", "te", "Tinglish", ...) to a template key.
+    """
+    lang = (language or "en").strip().lower()
+    if lang in ("te", "telugu"):
+        return "te"
+    if lang in ("tinglish", "te-latn", "roman telugu"):
+        return "tinglish"
+    if lang in ("hi", "hindi"):
+        return "hi"
+    return "en"
+
+
+def detect_reply_language(message: str, fallback: Optional[str] = "en") -> str:
+    """
+    Cheap script-based language guess so facility replies do not need the classifier call.
+    """
+    if re.search(r"[ఀ-౿]", message or ""):
+        return "te"
+    if re.search(r"[ऀ-ॿ]", message or ""):
+        return "hi"
+    return normalize_language(fallback)
+
+
+class ClinicDirectory:
+    """
+    In-memory index of clinic branches keyed by city alias.
+    """
+
+    def __init__(self, clinics: Optional[List[Dict[str, Any]]] = None):
+        self.clinics: List[Dict[str, Any]] = []
+        self._alias_index: Dict[str, List[Dict[str, Any]]] = {}
+        for clinic in clinics or []:
+            self.add(clinic)
+
+    def add(self, clinic: Dict[str, Any]) -> None:
+        """
+        Register a clinic record and index all of its aliases.
+        """
+        city = (clinic.get("city") or "").strip()
+        if not city:
+            return
+        record = {
+            "city": city,
+            "branch": (clinic.get("branch") or city).strip(),
+            "address": (clinic.get("address") or "").strip() or None,
+            "phone": (clinic.get("phone") or "").strip() or None,
+            "timings": (clinic.get("timings") or "").strip() or None,
+        }
+        aliases = {city.lower(), record["branch"].lower()}
+        aliases.update(a.lower() for a in CITY_ALIASES.get(city, []))
+        aliases.update(a.lower() for a in clinic.get("aliases") or [])
+        self.clinics.append(record)
+        for alias in aliases:
+            self._alias_index.setdefault(alias, []).append(record)
+
+    def __len__(self) -> int:
+        return len(self.clinics)
+
+    def find(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Return clinics whose city or branch alias appears in the text.
+        """
+        lowered = (text or "").lower()
+        tokens = set(re.findall(r"\w+", lowered))
+        matches: List[Dict[str, Any]] = []
+        for alias, records in self._alias_index.items():
+            if _mentions(alias, lowered, tokens):
+                for record in records:
+                    if record not in matches:
+                        matches.append(record)
+        return matches
+
+    def answer(
+        self,
+        message: str,
+        language: Optional[str] = "en",
+        default_city: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Build a templated reply for a facility query.
+
+        Args:
+            message: User's message
+            language: Language label from the request or classifier
+            default_city: User's profile location, used when the message names no city
+
+        Returns:
+            Reply text, or None when the directory cannot answer (caller falls back to the LLM)
+        """
+        if not self.clinics:
+            return None
+
+        templates = TEMPLATES[normalize_language(language)]
+        matches = self.find(message)
+        if not matches and default_city:
+            matches = self.find(default_city)
+        if not matches and len(self.clinics) == 1:
+            matches = list(self.clinics)
+
+        if not matches:
+            cities = sorted({c["city"] for c in self.clinics})
+            return templates["list"].format(cities=", ".join(cities))
+
+        lowered = (message or "").lower()
+        wanted = [f for f, kws in FIELD_KEYWORDS.items() if any(kw in lowered for kw in kws)]
+
+        blocks = []
+        for clinic in matches:
+            fields = [f for f in wanted if clinic.get(f)] or [f for f in ("address", "phone", "timings") if clinic.get(f)]
+            if not fields:
+                continue
+            lines = [templates["header"].format(branch=clinic["branch"])]
+            lines.extend(templates[f].format(value=clinic[f]) for f in fields)
+            blocks.append("\n".join(lines))
+
+        if not blocks:
+            return None
+        return "\n\n".join(blocks)
+
+
+def _mentions(alias: str, lowered: str, tokens: set) -> bool:
+    # Short ASCII aliases ("hyd", "vsp") must match a whole word, not part of "hydration"
+    if alias.isascii() and " " not in alias:
+        return alias in tokens
+    return alias in lowered
+
+
+def _extract_from_text(text: str, title: str = "") -> List[Dict[str, Any]]:
+    """
+    Pull clinic records out of a free-text section (one per city mentioned alongside a phone number).
+    """
+    records = []
+    haystack = f"{title}\n{text}"
+    lowered = haystack.lower()
+    tokens = set(re.findall(r"\w+", lowered))
+    phones = _PHONE_PATTERN.findall(haystack)
+    if not phones:
+        return records
+
+    for city, aliases in CITY_ALIASES.items():
+        if not any(_mentions(alias, lowered, tokens) for alias in aliases):
+            continue
+        timings = _TIMINGS_PATTERN.search(haystack)
+        address = _ADDRESS_PATTERN.search(haystack)
+        records.append({
+            "city": city,
+            "branch": city,
+            "phone": phones[0].strip(),
+            "timings": timings.group(1).strip() if timings else None,
+            "address": address.group(1).strip() if address else None,
+        })
+    return records
+
+
+def _extract_from_document(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Walk an H1 > H2 > H3 document (the same shape ingest_json.py ingests).
+    """
+    records = []
+    chunks = node.get("chunks") or []
+    if chunks:
+        text = "\n".join(c.get("text", "") for c in chunks)
+        records.extend(_extract_from_text(text, node.get("title", "")))
+    for child in node.get("children") or []:
+        records.extend(_extract_from_document(child))
+    return records
+
+
+def _resolve_path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(_BASE_DIR, path)
+
+
+def load_clinic_directory(
+    directory_path: Optional[str] = None,
+    info_files: Optional[List[str]] = None,
+) -> ClinicDirectory:
+    """
+    Build the directory from the curated JSON file and the hospital info documents.
+    Missing or malformed files are logged and skipped.
+    """
+    directory = ClinicDirectory()
+
+    directory_path = _resolve_path(directory_path or os.getenv("CLINIC_DIRECTORY_PATH", "clinic_directory.json"))
+    if os.path.exists(directory_path):
+        try:
+            with open(directory_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for clinic in data.get("clinics", []) if isinstance(data, dict) else data:
+                directory.add(clinic)
+        except Exception as e:
+            logger.error("Failed to load clinic directory %s: %s", directory_path, e)
+
+    if info_files is None:
+        info_files = [p.strip() for p in os.getenv("CLINIC_INFO_FILES", "emo_hospital_info.json").split(",") if p.strip()]
+
+    known = {(c["city"], c["phone"]) for c in directory.clinics}
+    for info_file in info_files:
+        path = _resolve_path(info_file)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error("Failed to read hospital info %s: %s", path, e)
+            continue
+        for root in data.get("document_structure", []) if isinstance(data, dict) else []:
+            for record in _extract_from_document(root):
+                if (record["city"], record["phone"]) not in known:
+                    directory.add(record)
+                    known.add((record["city"], record["phone"]))
+
+    logger.info("Clinic directory loaded with %d branches", len(directory))
+    return directory
+
+
+# Module-level singleton instance
+_directory_instance = None
+
+
+def get_clinic_directory() -> ClinicDirectory:
+    """
+    Get or create a singleton ClinicDirectory instance.
+
+    Returns:
+        ClinicDirectory instance
+    """
+    global _directory_instance
+    if _directory_instance is None:
+        _directory_instance = load_clinic_directory()
+    return _directory_instance
@@ -2,6 +2,8 @@
 from datetime import datetime
 import uuid
 
+from modules.circuit_breaker import CircuitOpen
+from modules.write_behind import get_write_behind
 from supabase_client import supabase_insert, supabase_select
 
 
@@ -15,7 +17,13 @@ def _save_message(user_id: str, message: str, lang: str, message_type: str, chat
     }
     if chat_id:
         payload["chat_id"] = chat_id
-    return supabase_insert("sakhi_conversations", payload)
+    try:
+        return supabase_insert("sakhi_conversations", payload)
+    except CircuitOpen:
+        # Writes are down: keep the row and insert it once they recover
+        if not get_write_behind().enqueue("sakhi_conversations", payload):
+            raise
+        return [payload]
 
 
 def save_user_message(user_id: str, text: str, lang: str = "en"):
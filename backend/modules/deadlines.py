@@ -0,0 +1,165 @@
+# modules/deadlines.py
+"""
+Per-request deadlines and budget-aware skipping of optional stages.
+
+The chat handlers start a deadline when a turn begins (REQUEST_DEADLINE_S).
+It lives in a context variable like the request priority, so it follows
+asyncio tasks and asyncio.to_thread into every upstream call:
+
+    start_deadline()
+    ...
+    timeout = bounded(30.0)                   # min(30, time left)
+
+bounded() caps the configured timeouts of upstream calls: OpenAI and
+PostgREST (modules/upstream_clients.py), the SLM (modules/slm_client.py) and
+queueing for an upstream slot (modules/upstream_limiter.py). A call made when
+the budget is spent still gets MIN_TIMEOUT_S, so it fails fast instead of
+hanging.
+
+Optional stages (intent generation, profile and history lookups, the FAQ
+lookup for media links) only run when the remaining budget covers their
+typical cost plus the cost of the stages that must still follow; otherwise
+the handler uses a cheap default:
+
+    if stage_budget.allows("history", "generate_medical"):
+        history = get_last_messages(user_id, limit=5)
+    else:
+        history = []
+
+Typical costs start from STAGE_COSTS and follow the observed stage times
+(exponentially weighted); tracing.stage() feeds them.
+
+Metrics:
+- sakhi_stage_skipped_total{stage}        -> optional stages skipped for lack of budget
+- sakhi_stage_typical_seconds{stage}      -> current typical cost per stage
+"""
+
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from modules.metrics import counter, gauge, register_collector
+
+STAGE_SKIPPED = counter("sakhi_stage_skipped_total", "Optional stages skipped because the request budget was too low")
+STAGE_TYPICAL = gauge("sakhi_stage_typical_seconds", "Typical cost per stage used for budget decisions")
+
+# Shortest timeout handed to an upstream call, even past the deadline
+MIN_TIMEOUT_S = 0.5
+
+# stage -> initial typical cost (s); only these stages are tracked
+STAGE_COSTS = {
+    "profile": 0.3,
+    "history": 0.3,
+    "faq": 0.3,
+    "intent": 1.5,
+    "generate_smalltalk": 2.0,
+    "generate_medical": 5.0,
+}
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def start_deadline(seconds: Optional[float] = None, started: Optional[float] = None) -> None:
+    """
+    Start the budget of the current request (env REQUEST_DEADLINE_S, default 20; 0 disables).
+    Keeps an already running deadline, e.g. when a handler calls another one.
+
+    Args:
+        seconds: Budget length; defaults to REQUEST_DEADLINE_S
+        started: perf_counter() time the request arrived, when the turn runs later
+            (e.g. a queued webhook message); defaults to now
+    """
+    if _deadline.get() is not None:
+        return
+    if seconds is None:
+        seconds = float(os.getenv("REQUEST_DEADLINE_S", "20"))
+    if seconds > 0:
+        _deadline.set((time.perf_counter() if started is None else started) + seconds)
+
+
+def reset_deadline() -> None:
+    """
+    Drop the deadline inherited from the request, e.g. in a background task that
+    outlives it; call start_deadline() afterwards for a budget of its own.
+    """
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left before the deadline (may be negative), or None without a deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.perf_counter()
+
+
+def bounded(timeout: float) -> float:
+    """
+    The configured timeout, capped by the time left (at least MIN_TIMEOUT_S).
+    """
+    left = remaining()
+    if left is None or left >= timeout:
+        return timeout
+    return max(left, MIN_TIMEOUT_S)
+
+
+class StageBudget:
+    """
+    Typical stage costs and the skip decision for optional stages.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        """
+        Args:
+            alpha: Weight of the newest observation in the typical cost
+        """
+        self.alpha = alpha
+        self._costs: Dict[str, float] = dict(STAGE_COSTS)
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if stage not in self._costs:
+            return
+        with self._lock:
+            self._costs[stage] += self.alpha * (seconds - self._costs[stage])
+
+    def typical(self, stage: str) -> float:
+        return self._costs.get(stage, 0.0)
+
+    def allows(self, stage: str, *then: str) -> bool:
+        """
+        True if the time left covers `stage` and the stages that must run after it.
+        """
+        left = remaining()
+        if left is None:
+            return True
+        if left >= self.typical(stage) + sum(self.typical(s) for s in then):
+            return True
+        STAGE_SKIPPED.inc(stage=stage)
+        return False
+
+    def collect(self) -> None:
+        for stage, seconds in list(self._costs.items()):
+            STAGE_TYPICAL.set(round(seconds, 4), stage=stage)
+
+
+# Module-level singleton instance
+_stage_budget_instance = None
+
+
+def get_stage_budget() -> StageBudget:
+    """
+    Get or create a singleton StageBudget instance.
+
+    Returns:
+        StageBudget instance
+    """
+    global _stage_budget_instance
+    if _stage_budget_instance is None:
+        _stage_budget_instance = StageBudget()
+        register_collector(_stage_budget_instance.collect)
+    return _stage_budget_instance
@@ -0,0 +1,127 @@
+# modules/emergency.py
+"""
+Emergency fast lane for danger-sign messages ("severe bleeding", "baby not moving").
+
+When a message is close enough to one of ModelGateway.EMERGENCY_EXAMPLES
+(danger signs described as happening now, kept apart from the routing
+examples so that questions like "miscarriage signs" are not treated as
+emergencies), a pre-localized safety message goes out immediately, before classification,
+retrieval or generation. The detailed answer is then generated with high
+upstream priority, and the user's following messages stay high priority for
+a short window (EMERGENCY_PRIORITY_WINDOW_S).
+
+Tracked as sakhi_emergency_time_to_safety_seconds (request arrival -> safety
+message ready) and sakhi_emergency_messages_total.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from modules.metrics import counter, histogram
+
+TIME_TO_SAFETY = histogram(
+    "sakhi_emergency_time_to_safety_seconds",
+    "Time from request arrival to the safety message for emergency messages",
+)
+EMERGENCY_TOTAL = counter(
+    "sakhi_emergency_messages_total",
+    "Messages answered through the emergency lane",
+)
+
+SAFETY_MESSAGES = {
+    "en": (
+        "I'm worried about what you're describing, and your safety comes first. "
+        "Please contact your doctor right away or go to the nearest hospital emergency. "
+        "If you need an ambulance, call 108. I'm also preparing more guidance for you."
+    ),
+    "te": (
+        "మీరు చెబుతున్నది నాకు ఆందోళనగా ఉంది, మీ భద్రతే ముఖ్యం. "
+        "దయచేసి వెంటనే మీ డాక్టర్‌ను సంప్రదించండి లేదా దగ్గరలోని ఆసుపత్రి ఎమర్జెన్సీకి వెళ్ళండి. "
+        "అంబులెన్స్ కావాలంటే 108కి కాల్ చేయండి. మీ కోసం మరింత సమాచారం సిద్ధం చేస్తున్నాను."
+    ),
+    "tinglish": (
+        "Meeru cheptunnadi naaku aandolanaga undi, mee safety mukhyam. "
+        "Dayachesi ventane mee doctor ni contact cheyandi leda daggaralo unna hospital emergency ki vellandi. "
+        "Ambulance kavalante 108 ki call cheyandi. Mee kosam inka information ready chestunnanu."
+    ),
+    "hi": (
+        "आप जो बता रहे हैं उससे मुझे चिंता हो रही है, आपकी सुरक्षा सबसे ज़रूरी है। "
+        "कृपया तुरंत अपने डॉक्टर से संपर्क करें या नज़दीकी अस्पताल की इमरजेंसी में जाएँ। "
+        "एम्बुलेंस के लिए 108 पर कॉल करें। मैं आपके लिए और जानकारी तैयार कर रही हूँ।"
+    ),
+}
+
+# Language key -> label passed to the OpenAI prompt as target_lang
+LANGUAGE_LABELS = {"en": "English", "te": "Telugu", "tinglish": "Tinglish", "hi": "Hindi"}
+
+
+class EmergencyLane:
+    """
+    Threshold check, localized safety replies and per-user priority windows.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        threshold: Optional[float] = None,
+        priority_window: Optional[float] = None,
+    ):
+        """
+        Args:
+            enabled: Turn the lane on/off (env EMERGENCY_LANE_ENABLED, default on)
+            threshold: Similarity to an emergency example that triggers it (env EMERGENCY_SIMILARITY_THRESHOLD, default 0.70)
+            priority_window: Seconds the user's later messages stay high priority (env EMERGENCY_PRIORITY_WINDOW_S, default 600)
+        """
+        if enabled is None:
+            enabled = os.getenv("EMERGENCY_LANE_ENABLED", "1") == "1"
+        self.enabled = enabled
+        self.threshold = threshold or float(os.getenv("EMERGENCY_SIMILARITY_THRESHOLD", "0.70"))
+        self.priority_window = priority_window or float(os.getenv("EMERGENCY_PRIORITY_WINDOW_S", "600"))
+        self._priority_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def is_emergency(self, similarity: float) -> bool:
+        return self.enabled and similarity >= self.threshold
+
+    @staticmethod
+    def safety_message(language_key: str) -> str:
+        return SAFETY_MESSAGES.get(language_key, SAFETY_MESSAGES["en"])
+
+    def mark(self, user_id: str) -> None:
+        """
+        Give this user's upstream calls priority for the next priority_window seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._priority_until[user_id] = now + self.priority_window
+            # Drop expired users so the map stays small
+            for uid in [u for u, until in self._priority_until.items() if until <= now]:
+                del self._priority_until[uid]
+
+    def is_priority(self, user_id: str) -> bool:
+        until = self._priority_until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    @staticmethod
+    def record(request_started: float) -> None:
+        EMERGENCY_TOTAL.inc()
+        TIME_TO_SAFETY.observe(time.perf_counter() - request_started)
+
+
+# Module-level singleton instance
+_lane_instance = None
+
+
+def get_emergency_lane() -> EmergencyLane:
+    """
+    Get or create a singleton EmergencyLane instance.
+
+    Returns:
+        EmergencyLane instance
+    """
+    global _lane_instance
+    if _lane_instance is None:
+        _lane_instance = EmergencyLane()
+    return _lane_instance
@@ -0,0 +1,178 @@
+# modules/followup_prefetch.py
+"""
+Speculative pre-answering of suggested follow-up questions.
+
+Medical replies end with " Follow ups : " and three short questions, and users
+often tap or retype one of them as their next message. After each reply we
+compute the embedding and hierarchical retrieval for those questions in the
+background (and optionally a full answer), so a matching next message skips
+straight to generation.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from rag import generate_embedding
+from search_hierarchical import hierarchical_rag_query
+from modules.deadlines import reset_deadline, start_deadline
+from modules.text_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class FollowUpPrefetcher:
+    """
+    Bounded per-user cache of prefetched follow-up retrievals.
+
+    Each user keeps only the follow-ups from their latest reply; the least recently
+    active users are evicted once max_users is reached.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        max_users: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        prefetch_answers: Optional[bool] = None,
+    ):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            enabled: Turn prefetching on/off (env FOLLOWUP_PREFETCH_ENABLED, default off until hit rates are measured)
+            max_users: Users kept in the cache (env FOLLOWUP_CACHE_USERS, default 1000)
+            ttl_seconds: Entry lifetime (env FOLLOWUP_CACHE_TTL_SECONDS, default 900)
+            prefetch_answers: Also pre-generate answers (env FOLLOWUP_PREFETCH_ANSWERS, default off)
+        """
+        if enabled is None:
+            enabled = os.getenv("FOLLOWUP_PREFETCH_ENABLED", "0") == "1"
+        if prefetch_answers is None:
+            prefetch_answers = os.getenv("FOLLOWUP_PREFETCH_ANSWERS", "0") == "1"
+        self.enabled = enabled
+        self.prefetch_answers = prefetch_answers
+        self.max_users = max_users or int(os.getenv("FOLLOWUP_CACHE_USERS", "1000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("FOLLOWUP_CACHE_TTL_SECONDS", "900"))
+
+        self._cache: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"scheduled": 0, "prefetched": 0, "failed": 0, "hits": 0, "misses": 0}
+
+    def _count(self, name: str) -> None:
+        # Updated from executor threads and the event loop
+        with self._lock:
+            self.stats[name] += 1
+
+    def schedule(
+        self,
+        user_id: str,
+        follow_ups: List[str],
+        answer_fn: Optional[Callable[[str, List[dict]], str]] = None,
+    ) -> None:
+        """
+        Start background prefetching for a user's suggested follow-ups.
+
+        Must be called from within the event loop. Replaces the user's previous set.
+        The workers keep the request's context (priority, trace).
+
+        Args:
+            user_id: User the follow-ups were suggested to
+            follow_ups: Follow-up questions parsed from the reply
+            answer_fn: Optional callable (question, kb_results) -> answer, used when
+                prefetch_answers is enabled
+        """
+        if not self.enabled or not user_id or not follow_ups:
+            return
+
+        with self._lock:
+            self._cache[user_id] = {}
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+
+        loop = asyncio.get_running_loop()
+        for question in follow_ups:
+            self._count("scheduled")
+            fn = answer_fn if self.prefetch_answers else None
+            context = contextvars.copy_context()
+            loop.run_in_executor(None, context.run, self._prefetch_one, user_id, question, fn)
+
+    def _prefetch_one(
+        self,
+        user_id: str,
+        question: str,
+        answer_fn: Optional[Callable[[str, List[dict]], str]],
+    ) -> None:
+        # Runs after the reply was sent: a deadline of its own, not what was left of the request's
+        reset_deadline()
+        start_deadline()
+        try:
+            embedding = generate_embedding(question)
+            kb_results = hierarchical_rag_query(question, query_vector=embedding)
+            entry = {
+                "question": question,
+                "embedding": embedding,
+                "kb_results": kb_results,
+                "answer": None,
+                "created_at": time.monotonic(),
+            }
+            if answer_fn:
+                entry["answer"] = answer_fn(question, kb_results)
+        except Exception as e:
+            self._count("failed")
+            logger.warning("Follow-up prefetch failed for '%.50s': %s", question, e)
+            return
+
+        with self._lock:
+            # The user may have moved on (new reply) or been evicted meanwhile
+            bucket = self._cache.get(user_id)
+            if bucket is not None:
+                bucket[normalize_query(question)] = entry
+                self.stats["prefetched"] += 1
+
+    def lookup(self, user_id: str, message: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the prefetched entry if the message matches one of the user's follow-ups.
+        The entry is consumed: asking the same question again is answered afresh.
+
+        Returns:
+            Dict with "embedding", "kb_results" and optionally "answer", or None
+        """
+        if not self.enabled or not user_id:
+            return None
+
+        key = normalize_query(message)
+        with self._lock:
+            bucket = self._cache.get(user_id)
+            entry = bucket.pop(key, None) if bucket else None
+            if entry and time.monotonic() - entry["created_at"] > self.ttl_seconds:
+                entry = None
+
+        if entry:
+            self._count("hits")
+            logger.info("Follow-up prefetch hit for user %s", user_id)
+        else:
+            self._count("misses")
+        return entry
+
+
+# Module-level singleton instance
+_prefetcher_instance = None
+
+
+def get_followup_prefetcher() -> FollowUpPrefetcher:
+    """
+    Get or create a singleton FollowUpPrefetcher instance.
+
+    Returns:
+        FollowUpPrefetcher instance
+    """
+    global _prefetcher_instance
+    if _prefetcher_instance is None:
+        _prefetcher_instance = FollowUpPrefetcher()
+    return _prefetcher_instance
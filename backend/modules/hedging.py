@@ -0,0 +1,202 @@
+# modules/hedging.py
+"""
+Latency-SLO hedging between the SLM and the OpenAI path.
+
+The SLM call starts first. If it has not answered within the hedge delay
+(by default the observed p95 of recent SLM latencies), a backup request is
+sent through the equivalent OpenAI function and whichever finishes first
+wins. A failed SLM call triggers the backup immediately.
+
+The losing SLM request is cancelled (its HTTP request is aborted), and so
+are both requests when the caller is cancelled. The OpenAI client is
+synchronous and runs in a worker thread, so a losing backup cannot be
+interrupted; its result is dropped.
+
+Only the non-streaming SLM routes are hedged; streaming replies commit to
+one upstream once the first token is sent.
+
+Tuning signals:
+- sakhi_hedge_requests_total{route, outcome} -> hedge rate and who wins
+- sakhi_hedge_delay_seconds{route}           -> delay in use
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from modules.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+HEDGE_REQUESTS = counter(
+    "sakhi_hedge_requests_total",
+    "SLM calls by hedging outcome (primary_fast, primary_won, backup_won, primary_failed)",
+)
+HEDGE_DELAY = gauge(
+    "sakhi_hedge_delay_seconds",
+    "Current delay before a backup request is sent",
+)
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent SLM latencies per route.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, route: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(route, ()))
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(q * len(samples)))
+        return samples[idx]
+
+    def count(self, route: str) -> int:
+        return len(self._samples.get(route, ()))
+
+
+class Hedger:
+    """
+    Runs an async primary call with a threaded backup after the hedge delay.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        percentile: Optional[float] = None,
+        default_delay: Optional[float] = None,
+        min_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        min_samples: Optional[int] = None,
+    ):
+        """
+        Args:
+            enabled: Turn hedging on/off (env HEDGE_ENABLED, default on)
+            percentile: SLM latency percentile used as delay (env HEDGE_PERCENTILE, default 0.95)
+            default_delay: Delay until enough samples exist (env HEDGE_DEFAULT_DELAY_S, default 3)
+            min_delay / max_delay: Clamp on the delay (env HEDGE_MIN_DELAY_S=0.5, HEDGE_MAX_DELAY_S=10)
+            min_samples: Samples needed before using the percentile (env HEDGE_MIN_SAMPLES, default 20)
+        """
+        if enabled is None:
+            enabled = os.getenv("HEDGE_ENABLED", "1") == "1"
+        self.enabled = enabled
+        self.percentile = percentile or float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+        self.default_delay = default_delay or float(os.getenv("HEDGE_DEFAULT_DELAY_S", "3"))
+        self.min_delay = min_delay or float(os.getenv("HEDGE_MIN_DELAY_S", "0.5"))
+        self.max_delay = max_delay or float(os.getenv("HEDGE_MAX_DELAY_S", "10"))
+        self.min_samples = min_samples or int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+        self.latencies = LatencyTracker()
+
+    def delay_for(self, route: str) -> float:
+        observed = None
+        if self.latencies.count(route) >= self.min_samples:
+            observed = self.latencies.percentile(route, self.percentile)
+        delay = observed if observed is not None else self.default_delay
+        delay = min(max(delay, self.min_delay), self.max_delay)
+        HEDGE_DELAY.set(delay, route=route)
+        return delay
+
+    async def run(
+        self,
+        route: str,
+        primary: Callable[[], Awaitable[str]],
+        backup: Callable[[], str],
+    ) -> Tuple[str, str]:
+        """
+        Run primary (SLM coroutine factory); hedge with backup (blocking OpenAI call).
+
+        Returns:
+            (reply, winner) where winner is "primary" or "backup"
+        """
+        if not self.enabled:
+            return await primary(), "primary"
+
+        started = time.perf_counter()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = [primary_task]
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.delay_for(route))
+
+            if done and not primary_task.exception():
+                self.latencies.observe(route, time.perf_counter() - started)
+                HEDGE_REQUESTS.inc(route=route, outcome="primary_fast")
+                return primary_task.result(), "primary"
+
+            if done:
+                # SLM failed before the delay: fall back straight away
+                logger.warning("SLM %s failed, using OpenAI backup: %s", route, primary_task.exception())
+                HEDGE_REQUESTS.inc(route=route, outcome="primary_failed")
+                return await asyncio.to_thread(backup), "backup"
+
+            backup_task = asyncio.ensure_future(asyncio.to_thread(backup))
+            tasks.append(backup_task)
+            pending = {primary_task, backup_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception():
+                        continue
+                    if task is primary_task:
+                        self.latencies.observe(route, time.perf_counter() - started)
+                        HEDGE_REQUESTS.inc(route=route, outcome="primary_won")
+                        return task.result(), "primary"
+                    # Censored sample: the SLM took at least this long
+                    self.latencies.observe(route, time.perf_counter() - started)
+                    HEDGE_REQUESTS.inc(route=route, outcome="backup_won")
+                    return task.result(), "backup"
+
+            # Both failed; surface the backup error (the SLM one was already logged by the client)
+            HEDGE_REQUESTS.inc(route=route, outcome="primary_failed")
+            raise backup_task.exception()
+        finally:
+            # The loser, or both calls when the caller itself is cancelled (client
+            # disconnect, deadline): don't leave them running detached
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    def stats() -> Dict[str, Dict[str, float]]:
+        """
+        Hedge rate per route: share of SLM calls that needed a backup request.
+        """
+        out: Dict[str, Dict[str, float]] = {}
+        for key, value in HEDGE_REQUESTS.samples().items():
+            labels = dict(key)
+            route = out.setdefault(labels.get("route", ""), {})
+            route[labels.get("outcome", "")] = value
+        for route in out.values():
+            total = sum(route.values())
+            hedged = route.get("primary_won", 0) + route.get("backup_won", 0)
+            route["hedge_rate"] = hedged / total if total else 0.0
+        return out
+
+
+# Module-level singleton instance
+_hedger_instance = None
+
+
+def get_hedger() -> Hedger:
+    """
+    Get or create a singleton Hedger instance.
+
+    Returns:
+        Hedger instance
+    """
+    global _hedger_instance
+    if _hedger_instance is None:
+        _hedger_instance = Hedger()
+    return _hedger_instance
@@ -0,0 +1,209 @@
+# modules/idempotency.py
+"""
+Idempotency keys and duplicate-message suppression for chat turns.
+
+Client and platform retries replay the same ChatRequest. Without a key each
+replay saves the message again, re-runs classification, retrieval and
+generation and writes duplicate conversation rows. Chat turns therefore run
+through the store:
+
+    key = store.key_for(client_key, user_key(req.user_id, req.phone_number), req.message, req.language)
+    response, replayed = await store.run(key, lambda: handle(req))
+
+- Client keys (Idempotency-Key header, webhook message_id) are scoped to
+  the user and kept for IDEMPOTENCY_TTL_S.
+- Without a client key the turn is not deduplicated: users legitimately
+  repeat short answers ("yes", "ok", "1"). Deployments whose clients retry
+  without keys can opt in to derived keys (IDEMPOTENCY_DERIVED_KEYS=1): the
+  key is then derived from (user/phone, language, message hash) and kept for
+  IDEMPOTENCY_WINDOW_S, so an exact repeat within that window is treated as
+  a retry.
+- A replay of a finished turn returns the stored response without any
+  upstream work. A replay of a turn still in flight waits for it and
+  returns the same response.
+- Failed turns are not stored, so a retry after an error runs again.
+  Claimed webhook message IDs are released when the message could not be
+  queued or its turn failed.
+
+The store lives in memory per worker process (LRU-bounded by
+IDEMPOTENCY_MAX_ENTRIES) and is used from the event loop only.
+
+Metrics: sakhi_idempotency_requests_total{outcome="new"|"replay"|"joined"}
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from modules.metrics import counter
+
+IDEMPOTENCY_REQUESTS = counter(
+    "sakhi_idempotency_requests_total",
+    "Chat turns by idempotency outcome (new, replay of a stored response, joined an in-flight turn)",
+)
+
+
+class _Entry:
+    __slots__ = ("future", "expires")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.expires: Optional[float] = None  # set once the response is stored
+
+
+class IdempotencyStore:
+    """
+    TTL + LRU store of chat responses by idempotency key.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        window: Optional[float] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        derived_keys: Optional[bool] = None,
+    ):
+        """
+        Args:
+            enabled: Turn suppression on/off (env IDEMPOTENCY_ENABLED, default on)
+            derived_keys: Key turns without a client key by their content (env IDEMPOTENCY_DERIVED_KEYS, default off)
+            window: Lifetime of derived keys in seconds (env IDEMPOTENCY_WINDOW_S, default 30)
+            ttl: Lifetime of client-supplied keys in seconds (env IDEMPOTENCY_TTL_S, default 86400)
+            max_entries: Bound on stored responses (env IDEMPOTENCY_MAX_ENTRIES, default 10000)
+        """
+        if enabled is None:
+            enabled = os.getenv("IDEMPOTENCY_ENABLED", "1") == "1"
+        if derived_keys is None:
+            derived_keys = os.getenv("IDEMPOTENCY_DERIVED_KEYS", "0") == "1"
+        self.enabled = enabled
+        self.derived_keys = derived_keys
+        self.window = window or float(os.getenv("IDEMPOTENCY_WINDOW_S", "30"))
+        self.ttl = ttl or float(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+        self.max_entries = max_entries or int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def key_for(
+        self,
+        client_key: Optional[str],
+        identity: Optional[str],
+        message: str,
+        language: str = "",
+    ) -> Optional[Tuple[str, float]]:
+        """
+        (key, lifetime) for a chat turn, or None when the turn cannot be keyed.
+        """
+        if not self.enabled or identity is None:
+            return None
+        if client_key:
+            return f"client:{identity}:{client_key}", self.ttl
+        if not self.derived_keys:
+            return None
+        digest = hashlib.sha256(f"{language}\n{message.strip()}".encode("utf-8")).hexdigest()[:32]
+        return f"derived:{identity}:{digest}", self.window
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _evict(self) -> None:
+        # Oldest stored responses first; in-flight turns are never evicted
+        while len(self._entries) > self.max_entries:
+            for key, entry in self._entries.items():
+                if entry.expires is not None:
+                    del self._entries[key]
+                    break
+            else:
+                return
+
+    def claim(self, keyed: Optional[Tuple[str, float]]) -> bool:
+        """
+        Record a key without a response (e.g. an enqueued webhook message).
+        Returns False if the key was already seen within its lifetime.
+        """
+        if keyed is None:
+            return True
+        key, ttl = keyed
+        if self._lookup(key) is not None:
+            IDEMPOTENCY_REQUESTS.inc(outcome="replay")
+            return False
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        entry = self._entries[key] = _Entry(future)
+        entry.expires = time.monotonic() + ttl
+        self._evict()
+        IDEMPOTENCY_REQUESTS.inc(outcome="new")
+        return True
+
+    def release(self, keyed: Optional[Tuple[str, float]]) -> None:
+        """
+        Forget a claimed key whose message was not processed after all (queue
+        full, failed turn), so the platform's redelivery runs again.
+        """
+        if keyed is None:
+            return
+        entry = self._entries.get(keyed[0])
+        if entry is not None and entry.expires is not None:
+            del self._entries[keyed[0]]
+
+    async def run(
+        self,
+        keyed: Optional[Tuple[str, float]],
+        fn: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """
+        Run the turn once per key. Returns (response, replayed).
+        """
+        if keyed is None:
+            return await fn(), False
+        key, ttl = keyed
+
+        entry = self._lookup(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            outcome = "replay" if entry.future.done() else "joined"
+            IDEMPOTENCY_REQUESTS.inc(outcome=outcome)
+            return await asyncio.shield(entry.future), True
+
+        entry = self._entries[key] = _Entry(asyncio.get_running_loop().create_future())
+        IDEMPOTENCY_REQUESTS.inc(outcome="new")
+        try:
+            response = await fn()
+        except BaseException as e:
+            # Not stored: a retry after a failure runs again
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            if isinstance(e, Exception):
+                entry.future.set_exception(e)
+                # Nobody may be waiting; mark the exception as retrieved
+                entry.future.exception()
+            else:
+                entry.future.cancel()
+            raise
+        entry.future.set_result(response)
+        entry.expires = time.monotonic() + ttl
+        self._evict()
+        return response, False
+
+
+# Module-level singleton instance
+_store_instance = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """
+    Get or create a singleton IdempotencyStore instance.
+
+    Returns:
+        IdempotencyStore instance
+    """
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = IdempotencyStore()
+    return _store_instance
@@ -0,0 +1,197 @@
+# modules/logging_setup.py
+"""
+Process-wide logging: queue-backed, structured, with payload sampling.
+
+configure_logging() is called once by the application (main.py) and by
+scripts that want the same output. Request threads and the event loop only
+put the LogRecord on an in-memory queue; a background QueueListener thread
+does the message formatting, JSON encoding and the stdout write. A full
+queue drops the record (sakhi_log_records_dropped_total) rather than
+blocking a request.
+
+Use lazy %-style arguments so disabled levels cost nothing:
+
+    logger.debug("SLM request to %s", url)
+
+Large values go in the `payload` extra (or `context`, `answers`, `response`):
+
+    logger.info("Chat reply (route=%s)", route, extra={"payload": response})
+
+Such fields are only kept for a sample of records (LOG_PAYLOAD_SAMPLE_RATE);
+otherwise just their size is logged. Kept fields and messages are cut at
+LOG_MAX_FIELD_CHARS.
+
+Output is one JSON object per line with ts, level, logger, msg, trace_id
+(see modules/tracing.py) and any extras. LOG_FORMAT=text prints
+plain lines for local runs.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Any, Optional
+
+from modules.metrics import counter
+from modules.tracing import current_trace
+
+LOG_DROPPED = counter(
+    "sakhi_log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+)
+
+LARGE_FIELDS = ("payload", "context", "answers", "response")
+
+# LogRecord attributes that are not user-supplied extras
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "trace_id", "taskName",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(+{len(text) - limit} chars)"
+
+
+class SamplingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking QueueHandler that defers formatting to the listener thread.
+
+    On the calling thread it only stamps the trace ID and decides whether
+    large fields of this record are kept.
+    """
+
+    def __init__(self, log_queue: queue.Queue, payload_sample_rate: float):
+        super().__init__(log_queue)
+        self.payload_sample_rate = payload_sample_rate
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: hand the record over as-is; msg % args happens in the listener
+        trace = current_trace()
+        record.trace_id = trace.trace_id if trace is not None else None
+        for field in LARGE_FIELDS:
+            value = record.__dict__.get(field)
+            if value is not None and random.random() >= self.payload_sample_rate:
+                record.__dict__[field] = None
+                record.__dict__[f"{field}_chars"] = len(value) if isinstance(value, (str, bytes)) else len(str(value))
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record; long values are truncated.
+    """
+
+    def __init__(self, max_field_chars: int):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _truncate(record.getMessage(), self.max_field_chars),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        for key, value in record.__dict__.items():
+            if key in _RECORD_ATTRS or value is None:
+                continue
+            if not isinstance(value, (int, float, bool)):
+                value = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+                value = _truncate(value, self.max_field_chars)
+            entry[key] = value
+        if record.exc_info:
+            entry["exc"] = _truncate(self.formatException(record.exc_info), self.max_field_chars * 4)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable variant for local runs; extras are appended as key=value.
+    """
+
+    def __init__(self, max_field_chars: int):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extras = [
+            f"{key}={_truncate(str(value), self.max_field_chars)}"
+            for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS and value is not None
+        ]
+        return " ".join([line] + extras)
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    queue_size: Optional[int] = None,
+    max_field_chars: Optional[int] = None,
+    payload_sample_rate: Optional[float] = None,
+) -> None:
+    """
+    Install the queue handler on the root logger and start the writer thread.
+    Safe to call more than once; only the first call has an effect.
+
+    Args:
+        level: Root level (env LOG_LEVEL, default INFO)
+        fmt: "json" or "text" (env LOG_FORMAT, default json)
+        queue_size: Records buffered before dropping (env LOG_QUEUE_SIZE, default 10000)
+        max_field_chars: Cut-off for messages and fields (env LOG_MAX_FIELD_CHARS, default 2000)
+        payload_sample_rate: Share of records that keep large fields (env LOG_PAYLOAD_SAMPLE_RATE, default 0.01)
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    queue_size = queue_size or int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    max_field_chars = max_field_chars or int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+    if payload_sample_rate is None:
+        payload_sample_rate = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JsonFormatter(max_field_chars) if fmt == "json" else TextFormatter(max_field_chars))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(SamplingQueueHandler(log_queue, payload_sample_rate))
+    root.setLevel(level)
+    # Per-request HTTP client chatter
+    for name in ("httpx", "httpcore", "openai", "urllib3", "hpack"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """
+    Flush queued records and stop the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,104 @@
+# modules/memo_cache.py
+"""
+Bounded exact-match memo cache for near-deterministic LLM calls.
+
+Used for classify_message and for small-talk replies to context-free messages
+("hi", "ok", "thank you"), which recur constantly. Entries are keyed by the
+prompt version plus a normalized form of the message, expire after a TTL and
+are dropped in bulk when the prompt version changes.
+
+Hit rate: sakhi_memo_cache_requests_total{cache, outcome="hit"|"miss"}
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from modules.metrics import counter
+
+MEMO_REQUESTS = counter(
+    "sakhi_memo_cache_requests_total",
+    "Memo cache lookups by cache and outcome (hit or miss)",
+)
+
+
+class MemoCache:
+    """
+    LRU + TTL cache for model outputs. Thread-safe; used from worker threads.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Args:
+            name: Cache label used in metrics
+            max_entries: Bound on cached entries (env MEMO_CACHE_SIZE, default 2000)
+            ttl_seconds: Entry lifetime (env MEMO_CACHE_TTL_SECONDS, default 3600)
+            enabled: Turn caching on/off (env MEMO_CACHE_ENABLED, default on)
+        """
+        if enabled is None:
+            enabled = os.getenv("MEMO_CACHE_ENABLED", "1") == "1"
+        self.name = name
+        self.enabled = enabled
+        self.max_entries = max_entries or int(os.getenv("MEMO_CACHE_SIZE", "2000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("MEMO_CACHE_TTL_SECONDS", "3600"))
+        self._version: Optional[str] = None
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: str) -> None:
+        # Caller holds the lock. A new prompt version invalidates everything cached so far.
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version: str, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value for (version, key), or None.
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                MEMO_REQUESTS.inc(cache=self.name, outcome="hit")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        MEMO_REQUESTS.inc(cache=self.name, outcome="miss")
+        return None
+
+    def put(self, version: str, key: Hashable, value: Any) -> None:
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        hits = MEMO_REQUESTS.value(cache=self.name, outcome="hit")
+        misses = MEMO_REQUESTS.value(cache=self.name, outcome="miss")
+        total = hits + misses
+        return {
+            "entries": len(self._entries),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
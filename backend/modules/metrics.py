@@ -0,0 +1,248 @@
+# modules/metrics.py
+"""
+Lightweight in-process metrics registry (counters, gauges, histograms with labels).
+
+Modules register their metrics once at import time and update them on the hot path:
+
+    SPEC_TOTAL = counter("sakhi_speculative_retrievals_total", "Speculative retrievals by outcome")
+    SPEC_TOTAL.inc(outcome="used")
+
+render_prometheus() serves the registry in the Prometheus text format, or in
+OpenMetrics (which carries histogram exemplars such as trace IDs).
+"""
+
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """Value that can go up and down per label set."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+        # (label key, bucket index) -> latest (exemplar labels, value, timestamp)
+        self._exemplars: Dict[Tuple[LabelKey, int], Tuple[Dict[str, str], float, float]] = {}
+
+    def observe(self, value: float, exemplar: Optional[Dict[str, str]] = None, **labels) -> None:
+        """
+        Record a value. `exemplar` (e.g. {"trace_id": ...}) is kept as the latest
+        example for the bucket the value falls into.
+        """
+        key = _label_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[idx] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+            if exemplar:
+                self._exemplars[(key, idx)] = (exemplar, value, time.time())
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(_label_key(labels), []))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(_label_key(labels), 0.0)
+
+    def samples(self) -> Dict[LabelKey, Tuple[List[int], float]]:
+        with self._lock:
+            return {k: (list(v), self._sums[k]) for k, v in self._counts.items()}
+
+    def exemplars(self) -> Dict[Tuple[LabelKey, int], Tuple[Dict[str, str], float, float]]:
+        with self._lock:
+            return dict(self._exemplars)
+
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+_collectors: List[Callable[[], None]] = []
+
+
+def _get_or_create(cls, name: str, documentation: str, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, documentation, **kwargs)
+            _registry[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as {metric.kind}")
+        return metric
+
+
+def counter(name: str, documentation: str) -> Counter:
+    return _get_or_create(Counter, name, documentation)
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    return _get_or_create(Gauge, name, documentation)
+
+
+def histogram(name: str, documentation: str, buckets: Optional[Tuple[float, ...]] = None) -> Histogram:
+    return _get_or_create(Histogram, name, documentation, buckets=buckets or DEFAULT_BUCKETS)
+
+
+def register_collector(fn: Callable[[], None]) -> None:
+    """
+    Register a callback that refreshes gauges (e.g. pool state) right before metrics are read.
+    """
+    _collectors.append(fn)
+
+
+def collect() -> None:
+    for fn in list(_collectors):
+        try:
+            fn()
+        except Exception:
+            pass
+
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    """
+    Plain-dict view of all metrics, e.g. for a debug endpoint or a benchmark report.
+    """
+    collect()
+    out: Dict[str, Dict[str, object]] = {}
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        series = {}
+        for key, value in metric.samples().items():
+            label = ",".join(f"{k}={v}" for k, v in key) or "_"
+            if isinstance(metric, Histogram):
+                counts, total = value
+                series[label] = {"count": sum(counts), "sum": round(total, 6)}
+            else:
+                series[label] = value
+        out[metric.name] = {"type": metric.kind, "series": series}
+    return out
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(openmetrics: bool = False) -> str:
+    """
+    Exposition of every registered metric.
+
+    Args:
+        openmetrics: Use the OpenMetrics format (application/openmetrics-text),
+            which includes histogram exemplars; otherwise Prometheus text 0.0.4.
+    """
+    collect()
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+
+    lines: List[str] = []
+    for metric in metrics:
+        family = metric.name
+        om_counter = openmetrics and metric.kind == "counter"
+        if om_counter and family.endswith("_total"):
+            # OpenMetrics names the counter family without the _total suffix
+            family = family[: -len("_total")]
+        help_text = metric.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        if openmetrics:
+            help_text = help_text.replace('"', '\\"')
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {metric.kind}")
+
+        if isinstance(metric, Histogram):
+            exemplars = metric.exemplars() if openmetrics else {}
+            for key, (counts, total) in sorted(metric.samples().items()):
+                cumulative = 0
+                bounds = list(metric.buckets) + [math.inf]
+                for idx, (bound, count) in enumerate(zip(bounds, counts)):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(bound) else repr(float(bound))
+                    line = f"{family}_bucket{_format_labels(key, (('le', le),))} {cumulative}"
+                    exemplar = exemplars.get((key, idx))
+                    if exemplar:
+                        ex_labels, ex_value, ex_time = exemplar
+                        line += f" # {_format_labels(_label_key(ex_labels))} {_format_value(ex_value)} {ex_time:.3f}"
+                    lines.append(line)
+                lines.append(f"{family}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{family}_count{_format_labels(key)} {sum(counts)}")
+        else:
+            sample = family + "_total" if om_counter else metric.name
+            for key, value in sorted(metric.samples().items()):
+                lines.append(f"{sample}{_format_labels(key)} {_format_value(value)}")
+
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
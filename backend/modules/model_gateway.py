@@ -1,13 +1,12 @@
 # modules/model_gateway.py
 import logging
+import threading
 from enum import Enum
-from typing import List
+from typing import List, Optional
 import numpy as np
 
-from rag import generate_embedding
+from rag import generate_embedding, generate_embeddings
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -16,6 +15,7 @@ class Route(Enum):
     SLM_DIRECT = "slm_direct"  # Small talk, no RAG needed
     SLM_RAG = "slm_rag"  # Simple medical, RAG + SLM
     OPENAI_RAG = "openai_rag"  # Complex medical, RAG + OpenAI
+    FACILITY_INFO = "facility_info"  # Clinic address/phone/timings, directory lookup
 
 
 class ModelGateway:
@@ -219,6 +219,39 @@ class ModelGateway:
         "miscarriage signs",
     ]
     
+    # Danger signs, terse or described as happening now, for the emergency lane
+    # only (not routing). Informational questions about the same topics
+    # ("miscarriage signs", "preeclampsia symptoms") are left to MEDICAL_COMPLEX routing.
+    EMERGENCY_EXAMPLES = [
+        "severe bleeding",
+        "heavy bleeding in pregnancy",
+        "baby not moving",
+        "sharp abdominal pain",
+        "sudden severe headache",
+        "chest pain difficulty breathing",
+        "I am bleeding heavily",
+        "heavy bleeding, soaking a pad every hour",
+        "bleeding with clots and severe cramps",
+        "my baby is not moving since morning",
+        "I can't feel the baby kicking anymore",
+        "severe pain in my stomach right now",
+        "unbearable pain on one side of my abdomen",
+        "I fainted just now",
+        "I feel dizzy and about to pass out",
+        "my water broke",
+        "fluid is leaking and I am only 30 weeks",
+        "terrible headache and my vision is blurred",
+        "my face and hands suddenly swelled up and my head hurts",
+        "I had a fit",
+        "chest pain and I can't breathe",
+        "high fever and shivering after delivery",
+        "vomiting everything, can't even keep water down",
+        "severe belly swelling and breathlessness after egg retrieval",
+        "I have thoughts of hurting myself or my baby",
+        "chala bleeding avutundi",
+        "baby kadalatledu",
+    ]
+    
     FACILITY_INFO_EXAMPLES = [
         "what is the phone number for vijayawada branch",
         "address of hyderabad clinic",
@@ -248,30 +281,46 @@ class ModelGateway:
     FACILITY_INFO_THRESHOLD = 0.50  # Lower threshold for facility/location queries to catch more
     
     def __init__(self):
-        """Initialize the gateway by computing anchor vectors."""
-        logger.info("Initializing ModelGateway with anchor vectors...")
-        
-        # Compute mean anchor vectors for each category
-        self.small_talk_anchor = self._compute_mean_vector(self.SMALL_TALK_EXAMPLES)
-        self.medical_simple_anchor = self._compute_mean_vector(self.MEDICAL_SIMPLE_EXAMPLES)
-        self.medical_complex_anchor = self._compute_mean_vector(self.MEDICAL_COMPLEX_EXAMPLES)
-        self.facility_info_anchor = self._compute_mean_vector(self.FACILITY_INFO_EXAMPLES)
-        
-        logger.info("ModelGateway initialized successfully")
+        """Create the gateway. Anchor vectors are computed by warm_up() or on first use."""
+        self.ready = False
+        self._warm_up_lock = threading.Lock()
     
-    def _compute_mean_vector(self, examples: List[str]) -> np.ndarray:
+    def warm_up(self) -> None:
         """
-        Compute the mean embedding vector for a list of example texts.
-        
-        Args:
-            examples: List of example texts for a category
-            
-        Returns:
-            Mean embedding vector as numpy array
+        Compute the anchor vectors for every category with one batched embeddings
+        request. Idempotent; concurrent callers wait for the first one.
         """
-        embeddings = [generate_embedding(example) for example in examples]
-        mean_vector = np.mean(embeddings, axis=0)
-        return mean_vector
+        if self.ready:
+            return
+        with self._warm_up_lock:
+            if self.ready:
+                return
+            logger.info("Initializing ModelGateway with anchor vectors...")
+            
+            groups = [
+                list(self.SMALL_TALK_EXAMPLES),
+                list(self.MEDICAL_SIMPLE_EXAMPLES),
+                list(self.MEDICAL_COMPLEX_EXAMPLES),
+                list(self.FACILITY_INFO_EXAMPLES),
+                list(self.EMERGENCY_EXAMPLES),
+            ]
+            vectors = generate_embeddings([example for group in groups for example in group])
+            per_group = []
+            offset = 0
+            for group in groups:
+                per_group.append(np.array(vectors[offset:offset + len(group)]))
+                offset += len(group)
+            
+            # Mean anchor vector for each category
+            self.small_talk_anchor = np.mean(per_group[0], axis=0)
+            self.medical_simple_anchor = np.mean(per_group[1], axis=0)
+            self.medical_complex_vectors = per_group[2]
+            self.medical_complex_anchor = np.mean(self.medical_complex_vectors, axis=0)
+            self.facility_info_anchor = np.mean(per_group[3], axis=0)
+            self.emergency_vectors = per_group[4]
+            self.ready = True
+            
+            logger.info("ModelGateway initialized successfully")
     
     def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """
@@ -293,18 +342,45 @@ class ModelGateway:
         
         return dot_product / (norm1 * norm2)
     
-    def decide_route(self, user_text: str) -> Route:
+    def emergency_similarity(self, embedding: List[float]) -> float:
+        """
+        Highest cosine similarity between a query and any single EMERGENCY example.
+        
+        A mean anchor would blur distinct danger signs together, so the emergency
+        lane compares against each example instead.
+        
+        Args:
+            embedding: Embedding of the user's message
+            
+        Returns:
+            Maximum similarity score
+        """
+        self.warm_up()
+        user_vector = np.array(embedding)
+        norm = np.linalg.norm(user_vector)
+        if norm == 0:
+            return 0.0
+        norms = np.linalg.norm(self.emergency_vectors, axis=1)
+        sims = self.emergency_vectors @ user_vector / (np.where(norms == 0, 1, norms) * norm)
+        return float(np.max(sims))
+    
+    def decide_route(self, user_text: str, embedding: Optional[List[float]] = None) -> Route:
         """
         Determine the appropriate route for a user query based on semantic similarity.
         
         Args:
             user_text: User's input message
+            embedding: Precomputed embedding of user_text, if already available
             
         Returns:
             Route enum indicating which model to use
         """
+        self.warm_up()
+        
         # Generate embedding for user input
-        user_vector = np.array(generate_embedding(user_text))
+        if embedding is None:
+            embedding = generate_embedding(user_text)
+        user_vector = np.array(embedding)
         
         # Calculate similarities to each anchor
         small_talk_sim = self._cosine_similarity(user_vector, self.small_talk_anchor)
@@ -313,35 +389,38 @@ class ModelGateway:
         facility_info_sim = self._cosine_similarity(user_vector, self.facility_info_anchor)
         
         # Log similarity scores for debugging
-        logger.info(f"Query: '{user_text[:50]}...'")
-        logger.info(f"Similarity scores - Small Talk: {small_talk_sim:.3f}, "
-                   f"Medical Simple: {medical_simple_sim:.3f}, "
-                   f"Medical Complex: {medical_complex_sim:.3f}, "
-                   f"Facility Info: {facility_info_sim:.3f}")
+        logger.debug(
+            "Similarity scores - Small Talk: %.3f, Medical Simple: %.3f, Medical Complex: %.3f, Facility Info: %.3f",
+            small_talk_sim,
+            medical_simple_sim,
+            medical_complex_sim,
+            facility_info_sim,
+        )
         
         # Routing logic based on thresholds and highest similarity
         if small_talk_sim >= self.SMALL_TALK_THRESHOLD:
-            logger.info(f"→ Routing to: SLM_DIRECT (small talk detected)")
+            logger.debug("→ Routing to: SLM_DIRECT (small talk detected)")
             return Route.SLM_DIRECT
         
-        # Check for facility/location queries FIRST - route to SLM since it has this info
+        # Check for facility/location queries FIRST - answered from the clinic directory
+        # (falls back to SLM_RAG when the directory has no match)
         # This takes priority over medical queries to ensure clinic info is retrieved
         if facility_info_sim >= self.FACILITY_INFO_THRESHOLD:
-            logger.info(f"→ Routing to: SLM_RAG (facility/location info query)")
-            return Route.SLM_RAG
+            logger.debug("→ Routing to: FACILITY_INFO (facility/location info query)")
+            return Route.FACILITY_INFO
         
         # Only check medical queries if it's not a facility query
         if medical_complex_sim >= medical_simple_sim:
             # Complex medical or default to safest option
-            logger.info(f"→ Routing to: OPENAI_RAG (complex medical or default)")
+            logger.debug("→ Routing to: OPENAI_RAG (complex medical or default)")
             return Route.OPENAI_RAG
         
         if medical_simple_sim >= self.MEDICAL_SIMPLE_THRESHOLD:
-            logger.info(f"→ Routing to: SLM_RAG (simple medical query)")
+            logger.debug("→ Routing to: SLM_RAG (simple medical query)")
             return Route.SLM_RAG
         
         # Default to OpenAI for safety when confidence is low
-        logger.info(f"→ Routing to: OPENAI_RAG (low confidence, defaulting to safe option)")
+        logger.debug("→ Routing to: OPENAI_RAG (low confidence, defaulting to safe option)")
         return Route.OPENAI_RAG
     
     def get_intent_description(self, user_text: str, route: Route) -> str:
@@ -423,6 +502,9 @@ class ModelGateway:
             else:
                 return "We're here to listen and support you with warmth and understanding, no matter what's on your mind."
         
+        elif route == Route.FACILITY_INFO:
+            return "We want to make it easy for you to connect with us, so here's the information you need to reach our care team."
+        
         elif route == Route.SLM_RAG:
             # Check for facility/location queries
             facility_keywords = ["clinic", "address", "location", "phone", "contact", "branch", "vizag", "hyderabad", "vijayawada", "where", "timing"]
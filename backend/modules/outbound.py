@@ -0,0 +1,103 @@
+# modules/outbound.py
+"""
+Outbound reply delivery for webhook-ingested messages.
+
+The webhook worker pool (modules/webhook_ingest.py) hands every finished
+reply to the configured sender:
+
+    await get_outbound_sender().send(recipient, payload, message_id)
+
+Senders:
+- HttpSender: POSTs {"to", "message_id", "reply": payload} as JSON to
+  OUTBOUND_URL (bearer OUTBOUND_TOKEN), e.g. a WhatsApp gateway
+- LogSender: local stub used when OUTBOUND_URL is not set; logs the reply and
+  keeps the most recent deliveries in memory (`sent`) for tests and benchmarks
+
+Other platforms plug in by subclassing OutboundSender and calling
+set_outbound_sender() at startup.
+"""
+
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from modules.upstream_clients import get_outbound_http_client
+from modules.upstream_limiter import async_upstream_slot
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundSendError(Exception):
+    """
+    The platform did not accept the reply.
+    """
+
+
+class OutboundSender:
+    """
+    Delivers a reply payload (the /sakhi/chat response body) to a recipient.
+    """
+
+    async def send(self, recipient: str, payload: Dict[str, Any], message_id: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+
+class LogSender(OutboundSender):
+    """
+    Local stub: logs each reply and remembers the last `keep` deliveries.
+    """
+
+    def __init__(self, keep: int = 1000):
+        self.sent: Deque[Tuple[str, Optional[str], Dict[str, Any]]] = deque(maxlen=keep)
+
+    async def send(self, recipient: str, payload: Dict[str, Any], message_id: Optional[str] = None) -> None:
+        self.sent.append((recipient, message_id, payload))
+        logger.info("Outbound reply to %s (message_id=%s)", recipient, message_id, extra={"payload": payload})
+
+
+class HttpSender(OutboundSender):
+    """
+    POSTs the reply to a platform gateway over the shared outbound pool.
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None):
+        self.url = url
+        self.token = token
+
+    async def send(self, recipient: str, payload: Dict[str, Any], message_id: Optional[str] = None) -> None:
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        async with async_upstream_slot("outbound"):
+            response = await get_outbound_http_client().post(
+                self.url,
+                json={"to": recipient, "message_id": message_id, "reply": payload},
+                headers=headers,
+            )
+        if response.status_code >= 300:
+            raise OutboundSendError(f"Outbound send failed: {response.status_code} - {response.text[:200]}")
+
+
+# Module-level singleton instance
+_sender_instance: Optional[OutboundSender] = None
+
+
+def get_outbound_sender() -> OutboundSender:
+    """
+    Get or create the configured sender (HttpSender when OUTBOUND_URL is set, else LogSender).
+
+    Returns:
+        OutboundSender instance
+    """
+    global _sender_instance
+    if _sender_instance is None:
+        url = os.getenv("OUTBOUND_URL")
+        _sender_instance = HttpSender(url, os.getenv("OUTBOUND_TOKEN")) if url else LogSender()
+    return _sender_instance
+
+
+def set_outbound_sender(sender: OutboundSender) -> None:
+    """
+    Replace the sender (custom platforms, tests).
+    """
+    global _sender_instance
+    _sender_instance = sender
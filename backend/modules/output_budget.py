@@ -0,0 +1,138 @@
+# modules/output_budget.py
+"""
+Per-route output budgets enforced at generation time.
+
+Each OpenAI call gets max_tokens (and stop sequences where the format allows
+one) instead of generating freely and cutting the text afterwards.
+truncate_response stays in place only as a safety net.
+
+The medical route's max_tokens is the reply allowance plus a follow-up
+allowance. Only that sum is enforced: the split between the two is advisory.
+The prompt asks for a main reply within the reply allowance (as a word count),
+but a model that ignores the hint can still spend the follow-up tokens on the
+answer; the follow-up section is then cut short or missing, which the
+budget-hit counter shows. The medical format ends with FOLLOW_UPS_END after
+the last question, and that is the stop sequence, so nothing generated after
+the follow-ups is billed or shown.
+
+Budget hits (finish_reason == "length") are counted in
+sakhi_output_budget_hits_total{route}; compare with
+sakhi_output_budget_completions_total{route} to tune the limits.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from modules.metrics import counter
+from modules.text_utils import FOLLOW_UPS_END, FOLLOW_UPS_MARKER
+
+BUDGET_COMPLETIONS = counter(
+    "sakhi_output_budget_completions_total",
+    "Chat completions generated under an output budget, by route",
+)
+BUDGET_HITS = counter(
+    "sakhi_output_budget_hits_total",
+    "Chat completions cut off by their output budget (finish_reason=length), by route",
+)
+
+# Rough English ratio; Telugu / Tinglish use more tokens per word, so the hint errs low.
+WORDS_PER_TOKEN = 0.6
+
+
+class OutputBudget:
+    """
+    Token budget for one route.
+    """
+
+    def __init__(
+        self,
+        route: str,
+        reply_tokens: int,
+        follow_up_tokens: int = 0,
+        stop: Optional[List[str]] = None,
+    ):
+        self.route = route
+        self.reply_tokens = reply_tokens
+        self.follow_up_tokens = follow_up_tokens
+        self.stop = stop or None
+
+    @property
+    def max_tokens(self) -> int:
+        return self.reply_tokens + self.follow_up_tokens
+
+    @property
+    def reply_word_limit(self) -> int:
+        """
+        Word count to ask for in the prompt so the reply fits its own allowance.
+        A hint only; max_tokens is the sole hard limit.
+        """
+        return int(self.reply_tokens * WORDS_PER_TOKEN)
+
+    def completion_kwargs(self) -> Dict[str, object]:
+        """
+        Keyword arguments for client.chat.completions.create.
+        """
+        kwargs: Dict[str, object] = {"max_tokens": self.max_tokens}
+        if self.stop:
+            kwargs["stop"] = self.stop
+        return kwargs
+
+    def record(self, finish_reason: Optional[str]) -> bool:
+        """
+        Count one completion; returns True when it ran into the budget.
+        """
+        BUDGET_COMPLETIONS.inc(route=self.route)
+        if finish_reason == "length":
+            BUDGET_HITS.inc(route=self.route)
+            return True
+        return False
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+_budgets: Dict[str, OutputBudget] = {}
+
+
+def _build_budgets() -> Dict[str, OutputBudget]:
+    return {
+        # Small talk never carries follow-ups; stop if the model starts a section anyway.
+        "smalltalk": OutputBudget(
+            "smalltalk",
+            reply_tokens=_env_int("OUTPUT_TOKENS_SMALLTALK", 250),
+            stop=[FOLLOW_UPS_MARKER.rstrip()],
+        ),
+        # The format ends with an explicit marker after the third follow-up question.
+        "medical": OutputBudget(
+            "medical",
+            reply_tokens=_env_int("OUTPUT_TOKENS_MEDICAL", 500),
+            follow_up_tokens=_env_int("OUTPUT_TOKENS_FOLLOW_UPS", 100),
+            stop=[FOLLOW_UPS_END],
+        ),
+        # "Identified Language: ...\n\nGeneral Output:\n[SIGNAL]: YES"
+        "classifier": OutputBudget("classifier", reply_tokens=_env_int("OUTPUT_TOKENS_CLASSIFIER", 40)),
+        "intent": OutputBudget("intent", reply_tokens=_env_int("OUTPUT_TOKENS_INTENT", 100)),
+    }
+
+
+def get_output_budget(route: str) -> OutputBudget:
+    """
+    Budget for a route ("smalltalk", "medical", "classifier", "intent").
+    Limits are read from the environment once.
+    """
+    if not _budgets:
+        _budgets.update(_build_budgets())
+    return _budgets[route]
+
+
+def budget_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Hit rate per route.
+    """
+    stats = {}
+    for key, total in BUDGET_COMPLETIONS.samples().items():
+        route = dict(key).get("route", "")
+        hits = BUDGET_HITS.value(route=route)
+        stats[route] = {"completions": total, "hits": hits, "hit_rate": hits / total if total else 0.0}
+    return stats
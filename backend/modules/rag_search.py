@@ -1,19 +1,21 @@
 # modules/rag_search.py
-import os
+import logging
 from typing import List, Dict
 
 import supabase_client  # ensures .env is loaded once
-from openai import OpenAI
 
 from supabase_client import supabase_rpc, supabase_insert
+from modules.circuit_breaker import get_breaker
+from modules.rate_limiter import estimate_tokens, get_rate_limiter
+from modules.upstream_clients import get_openai_client
+from modules.upstream_limiter import upstream_slot
 
-EMBEDDING_MODEL = "text-embedding-3-small"
+logger = logging.getLogger(__name__)
 
-_api_key = os.getenv("OPENAI_API_KEY")
-if not _api_key:
-    raise Exception("OPENAI_API_KEY missing")
+EMBEDDING_MODEL = "text-embedding-3-small"
 
-_client = OpenAI(api_key=_api_key)
+_rate_limiter = get_rate_limiter()
+_openai_breaker = get_breaker("openai")
 
 
 def _clean_text(text: str) -> str:
@@ -22,7 +24,11 @@ def _clean_text(text: str) -> str:
 
 def _generate_embedding(text: str) -> List[float]:
     cleaned = _clean_text(text)
-    resp = _client.embeddings.create(model=EMBEDDING_MODEL, input=cleaned)
+    reserved = estimate_tokens(cleaned)
+    _rate_limiter.acquire("embeddings", reserved)
+    with _openai_breaker.guard(), upstream_slot("embeddings"):
+        resp = get_openai_client("embeddings").embeddings.create(model=EMBEDDING_MODEL, input=cleaned)
+    _rate_limiter.settle("embeddings", reserved, getattr(getattr(resp, "usage", None), "total_tokens", None))
     return resp.data[0].embedding
 
 
@@ -53,7 +59,7 @@ def search_sakhi_kb(text: str, limit: int = 3) -> List[dict]:
 
     merged.sort(key=lambda r: r.get("similarity", 0), reverse=True)
     top = merged[:limit]
-    print(f"RAG: Found {len(top)} merged results")
+    logger.debug("RAG: Found %d merged results", len(top))
     return top
 
 
@@ -0,0 +1,205 @@
+# modules/rate_limiter.py
+"""
+Cross-process token-bucket limiter for OpenAI requests and tokens.
+
+All uvicorn workers and the ingest / backfill scripts share one
+OPENAI_API_KEY, so the RPM and TPM budgets have to be shared too. Bucket
+state lives in a small SQLite file (OPENAI_RATE_DB) that every process
+updates inside a write transaction.
+
+Each call reserves one request plus its estimated tokens up front. The
+bucket may go into debt; the caller then sleeps until the debt would have
+been refilled, so bursts are spread evenly over the minute instead of
+hitting 429s and retrying together. Once the real usage is known the
+difference to the estimate is settled back into the bucket.
+
+If the wait would exceed OPENAI_RATE_MAX_WAIT_S the reservation is
+refunded and the call is shed with a 503 (UpstreamOverloaded).
+
+acquire() sleeps and touches SQLite, so it must run in a worker thread
+(the OpenAI clients are sync and called through asyncio.to_thread); on the
+event loop thread it raises RuntimeError.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from modules.metrics import counter, histogram
+from modules.upstream_limiter import PRIORITY_HIGH, UpstreamOverloaded, ensure_worker_thread, request_priority
+
+logger = logging.getLogger(__name__)
+
+RATE_WAIT = histogram(
+    "sakhi_openai_rate_wait_seconds",
+    "Time spent pacing OpenAI calls to stay within RPM/TPM",
+)
+RATE_REJECTED = counter(
+    "sakhi_openai_rate_rejected_total",
+    "OpenAI calls shed because the pacing wait exceeded the maximum",
+)
+
+# bucket -> (RPM env, default RPM, TPM env, default TPM)
+BUCKET_LIMITS = {
+    "chat": ("OPENAI_CHAT_RPM", 500, "OPENAI_CHAT_TPM", 200000),
+    "embeddings": ("OPENAI_EMBEDDINGS_RPM", 3000, "OPENAI_EMBEDDINGS_TPM", 1000000),
+}
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Cheap token estimate (about 4 characters per token) used for reservations.
+    """
+    return max(1, math.ceil(len(text or "") / CHARS_PER_TOKEN))
+
+
+def estimate_chat_tokens(messages: Iterable[Dict[str, str]], max_tokens: Optional[int]) -> int:
+    """
+    Estimated prompt tokens plus the completion budget.
+    """
+    prompt = sum(estimate_tokens(m.get("content")) + 4 for m in messages)
+    return prompt + (max_tokens or 0)
+
+
+class TokenBucketLimiter:
+    """
+    RPM + TPM token buckets persisted in SQLite and shared across processes.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        enabled: Optional[bool] = None,
+        max_wait: Optional[float] = None,
+    ):
+        """
+        Args:
+            db_path: Shared state file (env OPENAI_RATE_DB, default <tmp>/sakhi_openai_rate.sqlite3)
+            enabled: Turn pacing on/off (env OPENAI_RATE_LIMIT_ENABLED, default on)
+            max_wait: Longest acceptable pacing delay (env OPENAI_RATE_MAX_WAIT_S, default 20)
+        """
+        if enabled is None:
+            enabled = os.getenv("OPENAI_RATE_LIMIT_ENABLED", "1") == "1"
+        self.enabled = enabled
+        self.db_path = db_path or os.getenv(
+            "OPENAI_RATE_DB", os.path.join(tempfile.gettempdir(), "sakhi_openai_rate.sqlite3")
+        )
+        self.max_wait = max_wait or float(os.getenv("OPENAI_RATE_MAX_WAIT_S", "20"))
+        self.limits: Dict[str, Tuple[float, float]] = {
+            name: (float(os.getenv(rpm_env, str(rpm))), float(os.getenv(tpm_env, str(tpm))))
+            for name, (rpm_env, rpm, tpm_env, tpm) in BUCKET_LIMITS.items()
+        }
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _update(self, bucket: str, requests: float, tokens: float) -> Tuple[float, float]:
+        """
+        Refill the bucket to now, add the given deltas and return the resulting levels.
+        """
+        rpm, tpm = self.limits[bucket]
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT requests, tokens, updated FROM buckets WHERE name = ?", (bucket,)
+            ).fetchone()
+            if row is None:
+                level_r, level_t = rpm, tpm
+            else:
+                elapsed = max(0.0, now - row[2])
+                level_r = min(rpm, row[0] + elapsed * rpm / 60.0)
+                level_t = min(tpm, row[1] + elapsed * tpm / 60.0)
+            level_r = min(rpm, level_r + requests)
+            level_t = min(tpm, level_t + tokens)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                (bucket, level_r, level_t, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return level_r, level_t
+
+    def acquire(self, bucket: str, tokens: int) -> float:
+        """
+        Reserve one request and `tokens` tokens, sleeping as long as needed to stay
+        within the limits. Returns the time waited. Fails open if the state file is unusable.
+        Blocking: raises RuntimeError on the event loop thread (use asyncio.to_thread).
+        """
+        ensure_worker_thread("TokenBucketLimiter.acquire")
+        if not self.enabled:
+            return 0.0
+        rpm, tpm = self.limits[bucket]
+        try:
+            level_r, level_t = self._update(bucket, -1, -tokens)
+        except sqlite3.Error as e:
+            logger.warning("Rate limiter state unavailable, not pacing: %s", e)
+            return 0.0
+
+        wait = max(0.0, -level_r * 60.0 / rpm, -level_t * 60.0 / tpm)
+        if request_priority() == PRIORITY_HIGH:
+            # Emergency traffic is not paced; its reservation still counts, so
+            # normal traffic absorbs the debt
+            wait = 0.0
+        if wait > self.max_wait:
+            self.refund(bucket, tokens, requests=1)
+            RATE_REJECTED.inc(bucket=bucket)
+            raise UpstreamOverloaded(f"openai-{bucket}", math.ceil(wait))
+        if wait > 0:
+            time.sleep(wait)
+        RATE_WAIT.observe(wait, bucket=bucket)
+        return wait
+
+    def refund(self, bucket: str, tokens: int, requests: int = 0) -> None:
+        if not self.enabled or (tokens == 0 and requests == 0):
+            return
+        try:
+            self._update(bucket, requests, tokens)
+        except sqlite3.Error as e:
+            logger.warning("Rate limiter state unavailable: %s", e)
+
+    def settle(self, bucket: str, reserved_tokens: int, actual_tokens: Optional[int]) -> None:
+        """
+        Give back the part of a reservation that the call did not use
+        (or charge the overrun when the estimate was too low).
+        """
+        if actual_tokens is None:
+            return
+        self.refund(bucket, reserved_tokens - actual_tokens)
+
+
+# Module-level singleton instance
+_limiter_instance = None
+
+
+def get_rate_limiter() -> TokenBucketLimiter:
+    """
+    Get or create a singleton TokenBucketLimiter instance.
+
+    Returns:
+        TokenBucketLimiter instance
+    """
+    global _limiter_instance
+    if _limiter_instance is None:
+        _limiter_instance = TokenBucketLimiter()
+    return _limiter_instance
@@ -1,20 +1,46 @@
 # modules/response_builder.py
-import os
-from typing import List, Optional, Dict, Tuple
+from typing import Iterator, List, Optional, Dict, Tuple
 
 import supabase_client  # ensures .env is loaded once
-from openai import OpenAI
 
+from modules.circuit_breaker import get_breaker
 from modules.rag_search import add_kb_entry
-from modules.text_utils import truncate_response
+from modules.memo_cache import MemoCache
+from modules.output_budget import get_output_budget
+from modules.rate_limiter import estimate_chat_tokens, get_rate_limiter
+from modules.single_flight import SingleFlight
+from modules.sakhi_prompt import (
+    PROMPT_VERSION,
+    friendly_name,
+    get_prompt_builder,
+    prompt_version,
+    record_usage,
+)
+from modules.text_utils import normalize_query, truncate_response
+from modules.upstream_clients import get_openai_client
+from modules.upstream_limiter import upstream_slot
 # Import from root (assuming running from main.py)
 from search_hierarchical import hierarchical_rag_query, format_hierarchical_context
 
-_api_key = os.getenv("OPENAI_API_KEY")
-if not _api_key:
-    raise Exception("OPENAI_API_KEY missing")
+rate_limiter = get_rate_limiter()
+openai_breaker = get_breaker("openai")
 
-client = OpenAI(api_key=_api_key)
+
+def _create_completion(**kwargs):
+    """
+    Non-streaming chat completion, paced by the shared RPM/TPM buckets
+    and run through the "chat" upstream pool and the OpenAI circuit breaker.
+    """
+    reserved = estimate_chat_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+    rate_limiter.acquire("chat", reserved)
+    try:
+        with openai_breaker.guard(), upstream_slot("chat"):
+            completion = get_openai_client("chat").chat.completions.create(**kwargs)
+    except Exception:
+        rate_limiter.refund("chat", reserved)
+        raise
+    rate_limiter.settle("chat", reserved, getattr(completion.usage, "total_tokens", None))
+    return completion
 
 # Classifier system prompt (must be exact)
 CLASSIFIER_PROMPT = """
@@ -40,19 +66,39 @@ General Output:
 [SIGNAL]: YES or NO
 """
 
+CLASSIFIER_VERSION = prompt_version(CLASSIFIER_PROMPT)
+
+# Exact-match caches for near-deterministic calls on short, recurring messages
+classifier_cache = MemoCache("classifier")
+smalltalk_cache = MemoCache("smalltalk")
+# Identical messages in flight at the same time share one classifier call
+classifier_flight = SingleFlight("classify_message")
+
 
 def classify_message(message: str) -> Dict[str, str]:
     """
     Run the classifier prompt and parse out language and signal.
     """
-    completion = client.chat.completions.create(
+    cache_key = normalize_query(message)
+    cached = classifier_cache.get(CLASSIFIER_VERSION, cache_key)
+    if cached is not None:
+        return dict(cached)
+    return dict(classifier_flight.do(cache_key, lambda: _classify(message, cache_key)))
+
+
+def _classify(message: str, cache_key: str) -> Dict[str, str]:
+    budget = get_output_budget("classifier")
+    completion = _create_completion(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": CLASSIFIER_PROMPT},
             {"role": "user", "content": message},
         ],
         temperature=0.2,
+        **budget.completion_kwargs(),
     )
+    record_usage("classifier", completion.usage)
+    budget.record(completion.choices[0].finish_reason)
 
     content = completion.choices[0].message.content
     language = ""
@@ -69,38 +115,66 @@ def classify_message(message: str) -> Dict[str, str]:
             if len(parts) == 2:
                 signal = parts[1].strip().upper()
 
-    return {
+    result = {
         "language": language or "en",
         "signal": signal or "NO",
     }
+    classifier_cache.put(CLASSIFIER_VERSION, cache_key, dict(result))
+    return result
 
 
-def _friendly_name(name: Optional[str]) -> Optional[str]:
-    if not name:
-        return None
-    trimmed = name.strip()
-    if not trimmed:
-        return None
-    lowered = trimmed.lower()
-    if lowered in {"null", "none", "user", "test", "unknown"}:
+def _smalltalk_cache_key(prompt: str, target_lang: str, history, user_name: Optional[str]):
+    """
+    Key for context-free small talk (no history); None when the reply depends on history.
+    The reply greets the user by name, so the name is part of the key.
+    """
+    if history:
         return None
-    # shorten if very long
-    parts = trimmed.split()
-    candidate = parts[0]
-    if len(candidate) > 14:
-        candidate = candidate[:14]
-    return candidate
+    return (normalize_query(prompt), (target_lang or "").lower(), friendly_name(user_name))
+
 
+prompt_builder = get_prompt_builder()
 
-def _build_history_block(history: Optional[List[Dict[str, str]]]) -> str:
-    if not history:
-        return "### Conversation History:\nNone."
-    lines = ["### Conversation History:"]
-    for msg in history:
-        role = msg.get("role", "user").capitalize()
-        content = msg.get("content", "")
-        lines.append(f"{role}: {content}")
-    return "\n".join(lines)
+
+def _stream_completion(kind: str, messages: List[Dict[str, str]]) -> Iterator[str]:
+    """
+    Yield content deltas from a streaming chat completion.
+
+    Callers that stop early must close() the generator to release the upstream
+    slot; the usage is then unknown and the token reservation stays charged.
+    """
+    budget = get_output_budget(kind)
+    reserved = estimate_chat_tokens(messages, budget.max_tokens)
+    rate_limiter.acquire("chat", reserved)
+    settled = False
+    try:
+        # The slot is held until the stream is fully consumed or closed
+        with openai_breaker.guard(), upstream_slot("chat"):
+            stream = get_openai_client("chat_stream").chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.4,
+                stream=True,
+                stream_options={"include_usage": True},
+                **budget.completion_kwargs(),
+            )
+            with stream:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        record_usage(kind, chunk.usage)
+                        rate_limiter.settle("chat", reserved, chunk.usage.total_tokens)
+                        settled = True
+                    if not chunk.choices:
+                        continue
+                    if chunk.choices[0].finish_reason:
+                        budget.record(chunk.choices[0].finish_reason)
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+    except Exception:
+        if not settled:
+            rate_limiter.refund("chat", reserved)
+        raise
 
 
 def generate_smalltalk_response(
@@ -110,133 +184,137 @@ def generate_smalltalk_response(
     user_name: Optional[str] = None,
     store_to_kb: bool = False,
 ) -> str:
-    user_name = _friendly_name(user_name)
-    history_block = _build_history_block(history)
-    has_history = bool(history)
-    name_line = f"User name: {user_name}" if user_name else "User name: Not provided"
-    greeting_rule = (
-        "If this is the first turn, start with a warm greeting and the name (e.g., 'Hi <name>,'). "
-        "If this is a follow-up, do NOT say 'Hi' again; instead give a brief caring acknowledgement with the name (e.g., '<name>, I'm here for you.'). "
-        "If no usable name, use a gentle greeting without a name."
-    )
-    system_content = (
-        "You are Sakhi, an emotional south indian companion.\n"
-        "User is NOT asking medical questions.\n"
-        "Give a warm, supportive, friendly, empathetic reply.\n"
-        "Avoid medical or fertility information completely.\n"
-        f"{greeting_rule}\n"
-        "Match the language of the user prompt: respond ONLY in target_lang. "
-        "If target_lang is Tinglish, write Telugu words using Roman letters; do not switch to English.\n"
-        "Keep sentences short, clear, and grammatically simple. For Tinglish, use natural, easy-to-read Roman Telugu (no awkward transliterations).\n"
-        "Keep the tone conversational like two people chatting; avoid headings or bullet labels. Use full stops/commas naturally.\n"
-        f"{name_line}\n"
-        "Address the user by name when available; if the name is long, use a shorter friendly form.\n"
-        "Maintain continuity using the conversation history.\n"
-        f"{history_block}"
+    cache_key = _smalltalk_cache_key(prompt, target_lang, history, user_name)
+    if cache_key is not None:
+        cached = smalltalk_cache.get(PROMPT_VERSION, cache_key)
+        if cached is not None:
+            return cached
+
+    budget = get_output_budget("smalltalk")
+    messages = prompt_builder.messages(
+        "smalltalk", prompt, target_lang, history, user_name, reply_word_limit=budget.reply_word_limit
     )
 
-    completion = client.chat.completions.create(
+    completion = _create_completion(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": prompt},
-        ],
+        messages=messages,
         temperature=0.4,
+        **budget.completion_kwargs(),
     )
+    record_usage("smalltalk", completion.usage)
+    budget.record(completion.choices[0].finish_reason)
 
     final_text = completion.choices[0].message.content
     
-    # Truncate response to maximum 2000 characters
+    # Safety net only; length is bounded by the output budget at generation time
     final_text = truncate_response(final_text)
 
+    if cache_key is not None:
+        smalltalk_cache.put(PROMPT_VERSION, cache_key, final_text)
     return final_text
 
 
+def stream_smalltalk_response(
+    prompt: str,
+    target_lang: str,
+    history: Optional[List[Dict[str, str]]],
+    user_name: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_smalltalk_response. Yields raw tokens;
+    the caller applies truncate_response to the joined text.
+    """
+    cache_key = _smalltalk_cache_key(prompt, target_lang, history, user_name)
+    if cache_key is not None:
+        cached = smalltalk_cache.get(PROMPT_VERSION, cache_key)
+        if cached is not None:
+            return iter([cached])
+
+    budget = get_output_budget("smalltalk")
+    messages = prompt_builder.messages(
+        "smalltalk", prompt, target_lang, history, user_name, reply_word_limit=budget.reply_word_limit
+    )
+    tokens = _stream_completion("smalltalk", messages)
+    if cache_key is None:
+        return tokens
+    return _caching_stream(tokens, cache_key)
+
+
+def _caching_stream(tokens: Iterator[str], cache_key) -> Iterator[str]:
+    """
+    Pass tokens through and cache the full reply once the stream completes.
+    """
+    parts = []
+    try:
+        for token in tokens:
+            parts.append(token)
+            yield token
+    finally:
+        tokens.close()
+    smalltalk_cache.put(PROMPT_VERSION, cache_key, truncate_response("".join(parts)))
+
+
 def generate_medical_response(
     prompt: str,
     target_lang: str,
     history: Optional[List[Dict[str, str]]],
     user_name: Optional[str] = None,
+    kb_results: Optional[List[dict]] = None,
 ) -> Tuple[str, List[dict]]:
     """
     Medical path: RAG + history.
+    Pass kb_results to reuse an earlier (e.g. prefetched) retrieval.
     Returns (final_text, kb_results)
     """
     # Use Hierarchical RAG
-    kb_results = hierarchical_rag_query(prompt)
+    if kb_results is None:
+        kb_results = hierarchical_rag_query(prompt)
     context_text = format_hierarchical_context(kb_results)
-    
-    history_block = _build_history_block(history)
-
-    user_name = _friendly_name(user_name)
-    name_line = f"User name: {user_name}" if user_name else "User name: Not provided"
-    has_history = bool(history)
-    greeting_rule = (
-        "If this is the first turn, start with a warm greeting and the name (e.g., 'Hi <name>,'). "
-        "If this is a follow-up, do NOT say 'Hi' again; instead give a brief caring acknowledgement with the name (e.g., '<name>, I understand.'). "
-        "If no usable name, use a gentle greeting without a name."
-    )
-    system_content = (
-        "You are Sakhi, a warm emotional south indian companion but medically safe.\n"
-        "Use retrieved knowledge when available. If none is retrieved, you may give general, high-level, medically safe guidance.\n"
-        "Be conservative and clearly state when guidance is general; advise consulting a doctor for specifics.\n"
-        f"{greeting_rule}\n"
-        "Match the language of the user prompt: respond ONLY in target_lang. "
-        "If target_lang is Tinglish, write Telugu words using Roman letters; do not switch to English.\n"
-        "Keep sentences short, clear, and grammatically simple. For Tinglish, use natural, easy-to-read Roman Telugu (no awkward transliterations).\n"
-        "\n"
-        "MANDATORY RESPONSE STRUCTURE:\n"
-        "1. Write your main conversational reply with caring tone. If a usable name is available, open with it naturally.\n"
-        "2. After the main reply, add EXACTLY two newline characters.\n"
-        "3. Write ' Follow ups : ' (space before 'Follow', space after 'ups', space after colon).\n"
-        "4. Immediately after the colon and space (NO extra newlines), write the first question.\n"
-        "5. Each subsequent question goes on a new line.\n"
-        "\n"
-        "EXACT FORMAT TO FOLLOW:\n"
-        "[Your main reply here, ending with punctuation.]\n"
-        "\n"
-        " Follow ups : What is your first question?\n"
-        "What is your second question?\n"
-        "What is your third question?\n"
-        "\n"
-        "CRITICAL: Do NOT add blank lines after ' Follow ups : ' - the first question must appear immediately.\n"
-        "IMPORTANT: Each follow-up question MUST be under 65 characters long.\n"
-        f"Always answer in {target_lang}.\n"
-        f"{name_line}\n"
-        "Address the user by name when available; if the name is long, use a shorter friendly form.\n"
-        "Maintain continuity using the conversation history.\n"
-        f"{history_block}"
-    )
 
-    if context_text:
-        system_content += f"\n\n{context_text}"
-        system_content += (
-            "\nUse the above knowledge directly. If something is unclear, stay conservative and safe."
-        )
-    else:
-        system_content += (
-            "\n\n### Retrieved Knowledge:\nNone."
-            "\nNo KB retrieved. Provide general, high-level, medically safe guidance."
-            "\nState clearly that advice is general and suggest consulting a doctor for specifics."
-        )
+    budget = get_output_budget("medical")
+    messages = prompt_builder.messages(
+        "medical", prompt, target_lang, history, user_name, context_text, reply_word_limit=budget.reply_word_limit
+    )
 
-    completion = client.chat.completions.create(
+    completion = _create_completion(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": prompt},
-        ],
+        messages=messages,
         temperature=0.4,
+        **budget.completion_kwargs(),
     )
+    record_usage("medical", completion.usage)
+    budget.record(completion.choices[0].finish_reason)
 
     final_text = completion.choices[0].message.content
     
-    # Truncate response to maximum 2000 characters
+    # Safety net only; length is bounded by the output budget at generation time
     final_text = truncate_response(final_text)
 
     return final_text, kb_results
 
 
+def stream_medical_response(
+    prompt: str,
+    target_lang: str,
+    history: Optional[List[Dict[str, str]]],
+    user_name: Optional[str] = None,
+    kb_results: Optional[List[dict]] = None,
+) -> Tuple[Iterator[str], List[dict]]:
+    """
+    Streaming variant of generate_medical_response.
+    Retrieval runs eagerly; returns (token_iterator, kb_results).
+    """
+    if kb_results is None:
+        kb_results = hierarchical_rag_query(prompt)
+    context_text = format_hierarchical_context(kb_results)
+
+    budget = get_output_budget("medical")
+    messages = prompt_builder.messages(
+        "medical", prompt, target_lang, history, user_name, context_text, reply_word_limit=budget.reply_word_limit
+    )
+    return _stream_completion("medical", messages), kb_results
+
+
 # Intent generation system prompt
 INTENT_GENERATOR_PROMPT = """You are generating intent for a patient-facing fertility care application.
 
@@ -268,15 +346,18 @@ def generate_intent(query: str) -> str:
         A single warm, empathetic intent sentence
     """
     try:
-        completion = client.chat.completions.create(
+        budget = get_output_budget("intent")
+        completion = _create_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": INTENT_GENERATOR_PROMPT},
                 {"role": "user", "content": f"Patient's question: {query}"},
             ],
             temperature=0.7,
-            max_tokens=100,
+            **budget.completion_kwargs(),
         )
+        record_usage("intent", completion.usage)
+        budget.record(completion.choices[0].finish_reason)
         
         intent = completion.choices[0].message.content.strip()
         # Remove any quotes if present
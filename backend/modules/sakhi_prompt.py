@@ -1,4 +1,9 @@
 # modules/sakhi_prompt.py
+import hashlib
+from typing import Dict, List, Optional
+
+from modules.metrics import counter
+
 
 def build_sakhi_prompt(
     user_message: str,
@@ -70,3 +75,238 @@ def build_sakhi_prompt(
     """
 
     return prompt
+
+
+# ---------------------------------------------------------------------------
+# Chat prompt assembly (OpenAI smalltalk / medical routes)
+#
+# Static persona and format rules are compiled once at import time and always
+# sent as the first system message, byte-for-byte identical across users.
+# Per-request parts (target language, name, history, retrieved knowledge) are
+# appended afterwards in a second system message.
+#
+# OpenAI only caches prompt prefixes of 1024+ tokens. SMALLTALK_STATIC
+# (~270 tokens) and MEDICAL_STATIC (~550 tokens) are well below that, so
+# today these prompts get no provider-side caching and
+# sakhi_prompt_cached_tokens_total stays at 0 for them. The split keeps the
+# prefix stable should it grow past the threshold; keep static text in front
+# of anything that varies.
+# ---------------------------------------------------------------------------
+
+_LANGUAGE_RULES = (
+    "Match the language of the user prompt: respond ONLY in target_lang. "
+    "If target_lang is Tinglish, write Telugu words using Roman letters; do not switch to English.\n"
+    "Keep sentences short, clear, and grammatically simple. For Tinglish, use natural, easy-to-read Roman Telugu (no awkward transliterations).\n"
+)
+
+_CONTINUITY_RULES = (
+    "Address the user by name when available; if the name is long, use a shorter friendly form.\n"
+    "Maintain continuity using the conversation history given in the session details below.\n"
+)
+
+SMALLTALK_STATIC = (
+    "You are Sakhi, an emotional south indian companion.\n"
+    "User is NOT asking medical questions.\n"
+    "Give a warm, supportive, friendly, empathetic reply.\n"
+    "Avoid medical or fertility information completely.\n"
+    "If this is the first turn, start with a warm greeting and the name (e.g., 'Hi <name>,'). "
+    "If this is a follow-up, do NOT say 'Hi' again; instead give a brief caring acknowledgement with the name (e.g., '<name>, I'm here for you.'). "
+    "If no usable name, use a gentle greeting without a name.\n"
+    + _LANGUAGE_RULES
+    + "Keep the tone conversational like two people chatting; avoid headings or bullet labels. Use full stops/commas naturally.\n"
+    + _CONTINUITY_RULES
+)
+
+MEDICAL_STATIC = (
+    "You are Sakhi, a warm emotional south indian companion but medically safe.\n"
+    "Use retrieved knowledge when available. If none is retrieved, you may give general, high-level, medically safe guidance.\n"
+    "Be conservative and clearly state when guidance is general; advise consulting a doctor for specifics.\n"
+    "If this is the first turn, start with a warm greeting and the name (e.g., 'Hi <name>,'). "
+    "If this is a follow-up, do NOT say 'Hi' again; instead give a brief caring acknowledgement with the name (e.g., '<name>, I understand.'). "
+    "If no usable name, use a gentle greeting without a name.\n"
+    + _LANGUAGE_RULES
+    + "\n"
+    "MANDATORY RESPONSE STRUCTURE:\n"
+    "1. Write your main conversational reply with caring tone. If a usable name is available, open with it naturally.\n"
+    "2. After the main reply, add EXACTLY two newline characters.\n"
+    "3. Write ' Follow ups : ' (space before 'Follow', space after 'ups', space after colon).\n"
+    "4. Immediately after the colon and space (NO extra newlines), write the first question.\n"
+    "5. Each subsequent question goes on a new line.\n"
+    "6. After the third question, write '[[END]]' on its own line and stop.\n"
+    "\n"
+    "EXACT FORMAT TO FOLLOW:\n"
+    "[Your main reply here, ending with punctuation.]\n"
+    "\n"
+    " Follow ups : What is your first question?\n"
+    "What is your second question?\n"
+    "What is your third question?\n"
+    "[[END]]\n"
+    "\n"
+    "CRITICAL: Do NOT add blank lines after ' Follow ups : ' - the first question must appear immediately.\n"
+    "IMPORTANT: Each follow-up question MUST be under 65 characters long.\n"
+    + _CONTINUITY_RULES
+    + "If retrieved knowledge is provided, use it directly. If something is unclear, stay conservative and safe.\n"
+    "If no knowledge is retrieved, provide general, high-level, medically safe guidance, "
+    "state clearly that advice is general and suggest consulting a doctor for specifics.\n"
+)
+
+STATIC_BLOCKS: Dict[str, str] = {
+    "smalltalk": SMALLTALK_STATIC,
+    "medical": MEDICAL_STATIC,
+}
+
+
+
+def prompt_version(*texts: str) -> str:
+    """
+    Short stable hash of prompt text; used to key caches of model output.
+    """
+    return hashlib.sha1("\x00".join(texts).encode("utf-8")).hexdigest()[:12]
+
+
+# Changes whenever any static block changes.
+PROMPT_VERSION = prompt_version(*(STATIC_BLOCKS[k] for k in sorted(STATIC_BLOCKS)))
+
+PROMPT_TOKENS = counter("sakhi_prompt_tokens_total", "Prompt tokens billed, by prompt kind")
+PROMPT_CACHED_TOKENS = counter("sakhi_prompt_cached_tokens_total", "Prompt tokens served from the provider prefix cache, by prompt kind")
+COMPLETION_TOKENS = counter("sakhi_completion_tokens_total", "Completion tokens billed, by prompt kind")
+
+
+def friendly_name(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    trimmed = name.strip()
+    if not trimmed:
+        return None
+    lowered = trimmed.lower()
+    if lowered in {"null", "none", "user", "test", "unknown"}:
+        return None
+    # shorten if very long
+    parts = trimmed.split()
+    candidate = parts[0]
+    if len(candidate) > 14:
+        candidate = candidate[:14]
+    return candidate
+
+
+def build_history_block(history: Optional[List[Dict[str, str]]]) -> str:
+    if not history:
+        return "### Conversation History:\nNone."
+    lines = ["### Conversation History:"]
+    for msg in history:
+        role = msg.get("role", "user").capitalize()
+        content = msg.get("content", "")
+        lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    """
+    Assembles chat messages as [static prefix, session details, user prompt].
+    """
+
+    def __init__(self, static_blocks: Optional[Dict[str, str]] = None):
+        self.static_blocks = dict(static_blocks or STATIC_BLOCKS)
+        # Precompiled once; every request reuses the same dict for the prefix.
+        self._prefix_messages = {
+            kind: {"role": "system", "content": text} for kind, text in self.static_blocks.items()
+        }
+
+    def session_block(
+        self,
+        kind: str,
+        target_lang: str,
+        history: Optional[List[Dict[str, str]]],
+        user_name: Optional[str],
+        context_text: Optional[str] = None,
+        reply_word_limit: Optional[int] = None,
+    ) -> str:
+        name = friendly_name(user_name)
+        parts = [
+            "### Session:",
+            f"target_lang: {target_lang}",
+            f"Always answer in {target_lang}.",
+            f"User name: {name}" if name else "User name: Not provided",
+            build_history_block(history),
+        ]
+        if reply_word_limit:
+            limit = f"Keep the main reply under {reply_word_limit} words"
+            parts.insert(3, limit + (", not counting the follow ups." if kind == "medical" else "."))
+        if kind == "medical":
+            parts.append(f"\n{context_text}" if context_text else "\n### Retrieved Knowledge:\nNone.")
+        return "\n".join(parts)
+
+    def messages(
+        self,
+        kind: str,
+        prompt: str,
+        target_lang: str,
+        history: Optional[List[Dict[str, str]]],
+        user_name: Optional[str] = None,
+        context_text: Optional[str] = None,
+        reply_word_limit: Optional[int] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Build the message list for one chat completion.
+
+        Args:
+            kind: "smalltalk" or "medical"
+            prompt: The user's message
+            target_lang: Reply language
+            history: Recent conversation as [{"role", "content"}]
+            user_name: Profile name (shortened / dropped if unusable)
+            context_text: Formatted retrieval context (medical only)
+            reply_word_limit: Length hint matching the route's output budget
+        """
+        return [
+            self._prefix_messages[kind],
+            {"role": "system", "content": self.session_block(kind, target_lang, history, user_name, context_text, reply_word_limit)},
+            {"role": "user", "content": prompt},
+        ]
+
+
+def record_usage(kind: str, usage) -> None:
+    """
+    Record prompt / cached / completion token counts from an API usage object.
+    Missing fields (older models, stream without usage) are ignored.
+    """
+    if usage is None:
+        return
+    PROMPT_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, prompt=kind)
+    COMPLETION_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, prompt=kind)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    PROMPT_CACHED_TOKENS.inc(cached or 0, prompt=kind)
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Cached-token ratio per prompt kind, e.g. for /debug/metrics.
+    """
+    stats = {}
+    for key, total in PROMPT_TOKENS.samples().items():
+        kind = dict(key).get("prompt", "")
+        cached = PROMPT_CACHED_TOKENS.value(prompt=kind)
+        stats[kind] = {
+            "prompt_tokens": total,
+            "cached_tokens": cached,
+            "cached_ratio": cached / total if total else 0.0,
+        }
+    return stats
+
+
+# Module-level singleton instance
+_builder_instance = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """
+    Get or create a singleton PromptBuilder instance.
+
+    Returns:
+        PromptBuilder instance
+    """
+    global _builder_instance
+    if _builder_instance is None:
+        _builder_instance = PromptBuilder()
+    return _builder_instance
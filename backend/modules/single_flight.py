@@ -0,0 +1,96 @@
+# modules/single_flight.py
+"""
+Single-flight coalescing of identical concurrent calls.
+
+When a broadcast goes out, many users send the same message within seconds.
+Concurrent calls with the same (operation, key) share one execution: the
+first caller runs the function, the others block until it finishes and get
+the same result (or the same exception).
+
+    _flight = SingleFlight("classify_message")
+    result = _flight.do(normalize_query(message), lambda: _classify(message))
+
+Nothing is cached: once the call returns, the next caller runs it again
+(MemoCache does the caching where results may be reused). Results are
+shared between callers and must be treated as read-only.
+
+Followers wait at most SINGLE_FLIGHT_WAIT_S, capped by their own request
+deadline, and then raise TimeoutError rather than hang behind a stuck leader.
+
+Coalescing: sakhi_single_flight_calls_total{operation, outcome="leader"|"coalesced"}
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from modules.deadlines import bounded
+from modules.metrics import counter
+
+FLIGHT_CALLS = counter(
+    "sakhi_single_flight_calls_total",
+    "Calls by operation that ran (leader) or joined an identical in-flight call (coalesced)",
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Per-operation table of in-flight calls. Thread-safe; used from worker threads.
+    """
+
+    def __init__(self, operation: str, enabled: Optional[bool] = None, wait_timeout: Optional[float] = None):
+        """
+        Args:
+            operation: Label used in metrics
+            enabled: Turn coalescing on/off (env SINGLE_FLIGHT_ENABLED, default on)
+            wait_timeout: Longest wait for the leader's result (env SINGLE_FLIGHT_WAIT_S, default 30)
+        """
+        if enabled is None:
+            enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+        self.operation = operation
+        self.enabled = enabled
+        self.wait_timeout = wait_timeout or float(os.getenv("SINGLE_FLIGHT_WAIT_S", "30"))
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn() unless an identical call (same key) is in flight; then wait for its result.
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            FLIGHT_CALLS.inc(operation=self.operation, outcome="coalesced")
+            if not call.done.wait(bounded(self.wait_timeout)):
+                raise TimeoutError(f"{self.operation}: identical call still in flight")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        FLIGHT_CALLS.inc(operation=self.operation, outcome="leader")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
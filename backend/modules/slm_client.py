@@ -1,28 +1,56 @@
 # modules/slm_client.py
+import asyncio
+import json
 import logging
 import os
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Set, Tuple
 import httpx
 from fastapi import HTTPException
 
+from modules.circuit_breaker import get_breaker
+from modules.deadlines import bounded
+from modules.metrics import gauge, histogram, register_collector
 from modules.text_utils import truncate_response
+from modules.upstream_clients import close_slm_http_client, connection_stats, get_slm_http_client, pool_config
+from modules.upstream_limiter import async_upstream_slot
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SLM_POOL = gauge("sakhi_slm_pool", "SLM HTTP pool utilization (in_flight, active/idle connections)")
+SLM_BATCH_SIZE = histogram(
+    "sakhi_slm_batch_size",
+    "Requests per micro-batch sent to the SLM endpoint",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class SLMUpstreamError(HTTPException):
+    """
+    502 raised when the SLM endpoint answers with an error status.
+    Keeps the upstream status code for callers that branch on it; the circuit
+    breaker counts only upstream 5xx answers as failures.
+    """
+    
+    def __init__(self, upstream_status: int):
+        super().__init__(status_code=502, detail=f"SLM API error: {upstream_status}")
+        self.upstream_status = upstream_status
+
 
 class SLMClient:
     """
     Client for interacting with a Small Language Model (SLM).
     
-    This is a mock implementation that returns placeholder responses.
-    Replace with actual API calls when SLM endpoint is available.
+    Returns mock placeholder responses when no SLM endpoint is configured.
     
     To enable real SLM:
     1. Set environment variable: SLM_ENDPOINT_URL
     2. Optionally set: SLM_API_KEY, SLM_MODEL_NAME
-    3. Replace mock methods with actual HTTP calls (using httpx or similar)
+    3. Optionally tune the pool: SLM_MAX_CONNECTIONS, SLM_MAX_KEEPALIVE,
+       SLM_KEEPALIVE_EXPIRY, SLM_HTTP2 and per-route SLM_*_TIMEOUT values
+       (capped by the request's deadline, see modules/deadlines.py)
+    
+    All requests share the pooled httpx.AsyncClient from modules/upstream_clients.py
+    (created in startup(), closed in aclose()) so connections are kept alive across calls.
     """
     
     def __init__(
@@ -42,9 +70,32 @@ class SLMClient:
         self.endpoint_url = endpoint_url or os.getenv("SLM_ENDPOINT_URL")
         self.api_key = api_key or os.getenv("SLM_API_KEY")
         self.model_name = model_name or os.getenv("SLM_MODEL_NAME", "default-slm")
+        # Endpoint streams tokens when sent {"stream": true} (SSE "data:" lines or raw chunks)
+        self.supports_streaming = os.getenv("SLM_STREAMING", "0") == "1"
+        
+        # Per-route timeouts (seconds)
+        self.connect_timeout = float(os.getenv("SLM_CONNECT_TIMEOUT", "5"))
+        self.pool_timeout = float(os.getenv("SLM_POOL_TIMEOUT", "5"))
+        self.chat_timeout = float(os.getenv("SLM_CHAT_TIMEOUT", "30"))
+        self.rag_timeout = float(os.getenv("SLM_RAG_TIMEOUT", "30"))
+        self.stream_timeout = float(os.getenv("SLM_STREAM_TIMEOUT", "30"))
+        
+        self._in_flight = 0
+        register_collector(self._collect_pool_metrics)
+        # Open after repeated failures; the chat handlers then use the OpenAI route
+        self.breaker = get_breaker("slm")
+        
+        # Optional micro-batching for self-hosted servers that accept JSON arrays
+        self.batcher: Optional["SLMBatchDispatcher"] = None
+        if self.endpoint_url and os.getenv("SLM_BATCH_ENABLED", "0") == "1":
+            self.batcher = SLMBatchDispatcher(
+                self,
+                window_ms=float(os.getenv("SLM_BATCH_WINDOW_MS", "5")),
+                max_batch_size=int(os.getenv("SLM_BATCH_MAX_SIZE", "16")),
+            )
         
         if self.endpoint_url:
-            logger.info(f"SLMClient initialized with endpoint: {self.endpoint_url}")
+            logger.info("SLMClient initialized with endpoint: %s", self.endpoint_url)
         else:
             logger.warning("SLMClient running in MOCK mode (no endpoint configured)")
     
@@ -65,56 +116,21 @@ class SLMClient:
         Returns:
             Generated response text
         """
-        logger.info(f"SLM generate_chat called - Message: '{message[:50]}...', Language: {language}")
+        logger.debug("SLM generate_chat called (language=%s, message_chars=%d)", language, len(message))
         
         if self.endpoint_url:
             # Real API call to SLM endpoint
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    # Prepare request payload matching SLM API format
-                    payload = {
-                        "question": message,  # SLM expects "question" not "message"
-                        "chat_history": "",   # Empty for direct chat
-                    }
-                    
-                    # Prepare headers
-                    headers = {"Content-Type": "application/json"}
-                    if self.api_key and self.api_key != "your-api-key-if-needed":
-                        headers["Authorization"] = f"Bearer {self.api_key}"
-                    
-                    logger.info(f"Sending request to SLM endpoint: {self.endpoint_url}")
-                    logger.info(f"Payload: {payload}")
-                    
-                    response = await client.post(
-                        self.endpoint_url,
-                        json=payload,
-                        headers=headers,
-                    )
-                    
-                    response.raise_for_status()
-                    result = response.json()
-                    
-                    # Extract response text (SLM returns {"reply": "..."})
-                    if isinstance(result, dict):
-                        response_text = result.get("reply") or result.get("response") or result.get("text") or result.get("message") or str(result)
-                    else:
-                        response_text = str(result)
-                    
-                    # Truncate response to maximum 2000 characters
-                    response_text = truncate_response(response_text)
-                    
-                    logger.info(f"SLM response received: {response_text[:100]}...")
-                    return response_text
-                    
-            except httpx.HTTPStatusError as e:
-                logger.error(f"SLM API error: {e.response.status_code} - {e.response.text}")
-                raise HTTPException(status_code=502, detail=f"SLM API error: {e.response.status_code}")
-            except httpx.TimeoutException:
-                logger.error("SLM API timeout")
-                raise HTTPException(status_code=504, detail="SLM API timeout")
-            except Exception as e:
-                logger.error(f"Error calling SLM API: {e}")
-                raise HTTPException(status_code=500, detail=f"Error calling SLM: {str(e)}")
+            # Prepare request payload matching SLM API format
+            payload = {
+                "question": message,  # SLM expects "question" not "message"
+                "chat_history": "",   # Empty for direct chat
+            }
+            
+            logger.debug("Sending request to SLM endpoint: %s", self.endpoint_url, extra={"payload": payload})
+            
+            response_text = await self._send(payload, timeout=self.chat_timeout)
+            logger.debug("SLM response received (%d chars)", len(response_text))
+            return response_text
         
         # Mock implementation (fallback if no endpoint)
         greeting = f"Hi {user_name}! " if user_name else "Hi! "
@@ -128,7 +144,7 @@ class SLMClient:
         # Truncate response to maximum 2000 characters
         mock_response = truncate_response(mock_response)
         
-        logger.info(f"SLM mock response: {mock_response[:100]}...")
+        logger.debug("SLM mock response (%d chars)", len(mock_response))
         return mock_response
     
     async def generate_rag_response(
@@ -150,60 +166,28 @@ class SLMClient:
         Returns:
             Generated response text incorporating the context
         """
-        logger.info(f"SLM generate_rag_response called - Message: '{message[:50]}...', Language: {language}")
-        logger.info(f"Context length: {len(context)} characters")
+        logger.debug(
+            "SLM generate_rag_response called (language=%s, message_chars=%d, context_chars=%d)",
+            language,
+            len(message),
+            len(context),
+        )
         
         if self.endpoint_url:
             # Real API call to SLM endpoint for RAG
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    # Prepare request payload matching SLM API format
-                    # For RAG, include context in the question or as separate context field
-                    payload = {
-                        "question": message,
-                        "chat_history": "",  # Empty for now, could include context here
-                        "context": context,   # Additional context field
-                    }
-                    
-                    # Prepare headers
-                    headers = {"Content-Type": "application/json"}
-                    if self.api_key and self.api_key != "your-api-key-if-needed":
-                        headers["Authorization"] = f"Bearer {self.api_key}"
-                    
-                    logger.info(f"Sending RAG request to SLM endpoint: {self.endpoint_url}")
-                    logger.info(f"Question: {message[:100]}...")
-                    logger.info(f"Context length: {len(context)} characters")
-                    
-                    response = await client.post(
-                        self.endpoint_url,
-                        json=payload,
-                        headers=headers,
-                    )
-                    
-                    response.raise_for_status()
-                    result = response.json()
-                    
-                    # Extract response text (SLM returns {"reply": "..."})
-                    if isinstance(result, dict):
-                        response_text = result.get("reply") or result.get("response") or result.get("text") or result.get("message") or str(result)
-                    else:
-                        response_text = str(result)
-                    
-                    # Truncate response to maximum 2000 characters
-                    response_text = truncate_response(response_text)
-                    
-                    logger.info(f"SLM RAG response received: {response_text[:100]}...")
-                    return response_text
-                    
-            except httpx.HTTPStatusError as e:
-                logger.error(f"SLM API error: {e.response.status_code} - {e.response.text}")
-                raise HTTPException(status_code=502, detail=f"SLM API error: {e.response.status_code}")
-            except httpx.TimeoutException:
-                logger.error("SLM API timeout")
-                raise HTTPException(status_code=504, detail="SLM API timeout")
-            except Exception as e:
-                logger.error(f"Error calling SLM API: {e}")
-                raise HTTPException(status_code=500, detail=f"Error calling SLM: {str(e)}")
+            # Prepare request payload matching SLM API format
+            # For RAG, include context in the question or as separate context field
+            payload = {
+                "question": message,
+                "chat_history": "",  # Empty for now, could include context here
+                "context": context,   # Additional context field
+            }
+            
+            logger.debug("Sending RAG request to SLM endpoint: %s", self.endpoint_url, extra={"payload": payload})
+            
+            response_text = await self._send(payload, timeout=self.rag_timeout)
+            logger.debug("SLM RAG response received (%d chars)", len(response_text))
+            return response_text
         
         # Mock implementation (fallback if no endpoint)
         greeting = f"Hello {user_name}, " if user_name else "Hello, "
@@ -218,9 +202,226 @@ class SLMClient:
         # Truncate response to maximum 2000 characters
         mock_response = truncate_response(mock_response)
         
-        logger.info(f"SLM mock RAG response: {mock_response[:100]}...")
+        logger.debug("SLM mock RAG response (%d chars)", len(mock_response))
         return mock_response
     
+    async def stream_chat(
+        self,
+        message: str,
+        language: str = "en",
+        user_name: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a direct chat response token by token.
+        
+        Falls back to a single chunk from generate_chat when the endpoint
+        does not stream (or in mock mode).
+        """
+        if not (self.endpoint_url and self.supports_streaming):
+            yield await self.generate_chat(message, language=language, user_name=user_name)
+            return
+        
+        payload = {
+            "question": message,
+            "chat_history": "",
+        }
+        async for token in self._stream(payload):
+            yield token
+    
+    async def stream_rag_response(
+        self,
+        context: str,
+        message: str,
+        language: str = "en",
+        user_name: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a RAG-enhanced response token by token.
+        
+        Falls back to a single chunk from generate_rag_response when the endpoint
+        does not stream (or in mock mode).
+        """
+        if not (self.endpoint_url and self.supports_streaming):
+            yield await self.generate_rag_response(context, message, language=language, user_name=user_name)
+            return
+        
+        payload = {
+            "question": message,
+            "chat_history": "",
+            "context": context,
+        }
+        async for token in self._stream(payload):
+            yield token
+    
+    async def _stream(self, payload: dict) -> AsyncIterator[str]:
+        """
+        POST the payload with stream=true and yield text deltas.
+        
+        Accepts SSE ("data: {...}" / "data: [DONE]") or plain chunked text.
+        """
+        with self.breaker.guard():
+            async with async_upstream_slot("slm"):
+                client = self._get_client()
+                self._in_flight += 1
+                try:
+                    async with client.stream(
+                        "POST",
+                        self.endpoint_url,
+                        json={**payload, "stream": True},
+                        headers=self._headers(),
+                        timeout=self._timeout(bounded(self.stream_timeout)),
+                    ) as response:
+                        response.raise_for_status()
+                        is_sse = "text/event-stream" in response.headers.get("content-type", "")
+                        if not is_sse:
+                            async for chunk in response.aiter_text():
+                                if chunk:
+                                    yield chunk
+                            return
+                
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if not data or data == "[DONE]":
+                                continue
+                            try:
+                                event = json.loads(data)
+                            except ValueError:
+                                yield data
+                                continue
+                            if isinstance(event, dict):
+                                token = event.get("token") or event.get("delta") or event.get("text") or event.get("reply") or ""
+                            else:
+                                token = str(event)
+                            if token:
+                                yield token
+                        
+                except httpx.HTTPStatusError as e:
+                    logger.error("SLM API error: %s", e.response.status_code)
+                    raise SLMUpstreamError(e.response.status_code)
+                except httpx.TimeoutException:
+                    logger.error("SLM API timeout")
+                    raise HTTPException(status_code=504, detail="SLM API timeout")
+                finally:
+                    self._in_flight -= 1
+    
+    async def _send(self, payload: dict, timeout: float) -> str:
+        """
+        Route a request through the micro-batching dispatcher when enabled.
+        The timeout is capped by the request's deadline here, in the caller's context.
+        """
+        timeout = bounded(timeout)
+        if self.batcher is not None:
+            return await self.batcher.submit(payload, timeout)
+        return await self._post(payload, timeout)
+    
+    async def _post(self, payload: dict, timeout: float) -> str:
+        """
+        Send one request over the pooled client and return the truncated reply text.
+        """
+        result = await self._post_json(payload, timeout)
+        
+        # Extract response text (SLM returns {"reply": "..."})
+        response_text = self._extract_text(result)
+        
+        # Truncate response to maximum 2000 characters
+        return truncate_response(response_text)
+    
+    async def _post_json(self, body, timeout: float):
+        """
+        POST a JSON body (object or batch array) and return the decoded JSON response.
+        Errors are mapped to HTTPException (502 API error, 504 timeout, 500 otherwise);
+        a full "slm" upstream queue raises UpstreamOverloaded (503).
+        
+        Each call is one result for the "slm" circuit breaker, so a micro-batch
+        counts once and takes a single half-open probe.
+        """
+        with self.breaker.guard():
+            async with async_upstream_slot("slm"):
+                client = self._get_client()
+                self._in_flight += 1
+                try:
+                    response = await client.post(
+                        self.endpoint_url,
+                        json=body,
+                        headers=self._headers(),
+                        timeout=self._timeout(timeout),
+                    )
+                
+                    response.raise_for_status()
+                    return response.json()
+                
+                except httpx.HTTPStatusError as e:
+                    logger.error("SLM API error: %s", e.response.status_code, extra={"response": e.response.text})
+                    raise SLMUpstreamError(e.response.status_code)
+                except httpx.TimeoutException:
+                    logger.error("SLM API timeout")
+                    raise HTTPException(status_code=504, detail="SLM API timeout")
+                except Exception as e:
+                    logger.error("Error calling SLM API: %s", e)
+                    raise HTTPException(status_code=500, detail=f"Error calling SLM: {str(e)}")
+                finally:
+                    self._in_flight -= 1
+    
+    @staticmethod
+    def _extract_text(result) -> str:
+        if isinstance(result, dict):
+            return result.get("reply") or result.get("response") or result.get("text") or result.get("message") or str(result)
+        return str(result)
+    
+    def _headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key and self.api_key != "your-api-key-if-needed":
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+    
+    def _timeout(self, read_timeout: float) -> httpx.Timeout:
+        return httpx.Timeout(read_timeout, connect=self.connect_timeout, pool=self.pool_timeout)
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        # Normally created in startup(); created lazily for scripts that never call it
+        return get_slm_http_client()
+    
+    async def startup(self) -> None:
+        """
+        Create the pooled HTTP client. Called once from the application startup hook.
+        """
+        if self.endpoint_url:
+            self._get_client()
+            config = pool_config("slm")
+            logger.info(
+                "SLM connection pool ready (max=%s, keepalive=%s, retries=%s)",
+                config.max_connections,
+                config.max_keepalive,
+                config.max_retries,
+            )
+    
+    async def aclose(self) -> None:
+        """
+        Close the pooled HTTP client (recreated on next use).
+        """
+        await close_slm_http_client()
+    
+    def pool_stats(self) -> dict:
+        """
+        Connection pool utilization: in-flight requests plus active/idle pooled connections.
+        """
+        pool = connection_stats().get("slm", {})
+        return {
+            "in_flight": self._in_flight,
+            "max_connections": pool_config("slm").max_connections,
+            "active_connections": pool.get("active", 0),
+            "idle_connections": pool.get("idle", 0),
+        }
+    
+    def _collect_pool_metrics(self) -> None:
+        stats = self.pool_stats()
+        SLM_POOL.set(stats["in_flight"], state="in_flight")
+        SLM_POOL.set(stats["active_connections"], state="active")
+        SLM_POOL.set(stats["idle_connections"], state="idle")
+        SLM_POOL.set(stats["max_connections"], state="max")
+    
     def is_mock(self) -> bool:
         """
         Check if client is running in mock mode.
@@ -231,6 +432,115 @@ class SLMClient:
         return self.endpoint_url is None
 
 
+class SLMBatchDispatcher:
+    """
+    Collects concurrent SLM requests for a few milliseconds and sends them as one
+    batched call (a JSON array of payloads), then fans the replies back out.
+    
+    The endpoint must answer an array request with an array of replies in the same
+    order. If it rejects arrays (HTTP 4xx), batching is switched off and the batch
+    is resent as individual requests.
+    """
+    
+    def __init__(self, client: SLMClient, window_ms: float = 5.0, max_batch_size: int = 16):
+        """
+        Args:
+            client: SLMClient whose pooled connection is used
+            window_ms: How long to wait for more requests after the first one arrives
+            max_batch_size: Flush immediately once this many requests are queued
+        """
+        self.client = client
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.enabled = True
+        self._pending: List[Tuple[dict, float, "asyncio.Future"]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to running tasks
+        self._batch_tasks: Set["asyncio.Task"] = set()
+    
+    async def submit(self, payload: dict, timeout: float) -> str:
+        """
+        Queue a request and wait for its reply.
+        """
+        if not self.enabled:
+            return await self.client._post(payload, timeout)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((payload, timeout, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _send_batch(self, batch: List[Tuple[dict, float, "asyncio.Future"]]) -> None:
+        SLM_BATCH_SIZE.observe(len(batch))
+        
+        if len(batch) == 1:
+            payload, timeout, future = batch[0]
+            await self._resolve(future, self.client._post(payload, timeout))
+            return
+        
+        timeout = max(t for _, t, _ in batch)
+        try:
+            results = await self.client._post_json([p for p, _, _ in batch], timeout)
+            if not isinstance(results, list) or len(results) != len(batch):
+                raise ValueError("batched SLM response does not match request count")
+        except SLMUpstreamError as e:
+            if 400 <= e.upstream_status < 500 and self.enabled:
+                # Endpoint probably does not accept arrays: stop batching, resend singly
+                logger.warning("SLM endpoint rejected a batched request; disabling micro-batching")
+                self.enabled = False
+                await asyncio.gather(*(
+                    self._resolve(future, self.client._post(payload, t))
+                    for payload, t, future in batch
+                ))
+                return
+            self._fail(batch, e)
+            return
+        except HTTPException as e:
+            self._fail(batch, e)
+            return
+        except Exception as e:
+            logger.error("SLM batch failed: %s", e)
+            self._fail(batch, HTTPException(status_code=500, detail=f"Error calling SLM: {str(e)}"))
+            return
+        
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(truncate_response(SLMClient._extract_text(result)))
+    
+    @staticmethod
+    async def _resolve(future: "asyncio.Future", coro) -> None:
+        try:
+            result = await coro
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+    
+    @staticmethod
+    def _fail(batch, error: Exception) -> None:
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
 # Module-level singleton instance
 _slm_client_instance = None
 
@@ -0,0 +1,144 @@
+# modules/speculative_retrieval.py
+"""
+Speculative retrieval that runs in parallel with routing and classification.
+
+Most chat traffic ends up on a RAG route, so once the query embedding is known
+we start hierarchical_rag_query immediately instead of waiting for decide_route
+and classify_message. If the request ends up not needing retrieval (small talk,
+facility lookup) the result is discarded.
+
+Tuning signals:
+- sakhi_speculative_retrievals_total{outcome="used"|"discarded"} -> wasted-work ratio
+- sakhi_speculative_latency_saved_seconds -> retrieval time hidden behind routing
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from search_hierarchical import hierarchical_rag_query
+from modules.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_TOTAL = counter(
+    "sakhi_speculative_retrievals_total",
+    "Speculative retrievals by outcome (used or discarded)",
+)
+SPECULATIVE_SAVED = histogram(
+    "sakhi_speculative_latency_saved_seconds",
+    "Retrieval time overlapped with routing/classification on used speculations",
+)
+SPECULATIVE_WASTED = histogram(
+    "sakhi_speculative_wasted_seconds",
+    "Retrieval time spent on discarded speculations",
+)
+
+
+class SpeculationHandle:
+    """
+    One in-flight speculative retrieval. Exactly one of result() / discard() should be called.
+    """
+
+    def __init__(self, future: "asyncio.Future", started_at: float):
+        self._future = future
+        self._started_at = started_at
+        self._settled = False
+
+    async def result(self) -> List[Dict[str, Any]]:
+        """
+        Wait for the retrieval and record how much of it was hidden behind routing.
+        """
+        wait_started = time.perf_counter()
+        kb_results = await self._future
+        finished = time.perf_counter()
+        if not self._settled:
+            self._settled = True
+            total = finished - self._started_at
+            waited = finished - wait_started
+            SPECULATIVE_TOTAL.inc(outcome="used")
+            SPECULATIVE_SAVED.observe(max(total - waited, 0.0))
+        return kb_results
+
+    def discard(self) -> None:
+        """
+        Drop the speculation (route needs no retrieval). The worker thread cannot be
+        interrupted, so its cost is recorded when it finishes.
+        """
+        if self._settled:
+            return
+        self._settled = True
+        SPECULATIVE_TOTAL.inc(outcome="discarded")
+        started_at = self._started_at
+
+        def _record(fut: "asyncio.Future") -> None:
+            SPECULATIVE_WASTED.observe(time.perf_counter() - started_at)
+            if not fut.cancelled() and fut.exception():
+                logger.debug("Discarded speculative retrieval failed: %s", fut.exception())
+
+        self._future.add_done_callback(_record)
+
+
+class SpeculativeRetriever:
+    """
+    Starts hierarchical retrieval as soon as an embedding is available.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        """
+        Args:
+            enabled: Turn speculation on/off (env SPECULATIVE_RETRIEVAL, default off)
+        """
+        if enabled is None:
+            enabled = os.getenv("SPECULATIVE_RETRIEVAL", "0") == "1"
+        self.enabled = enabled
+
+    def start(self, message: str, embedding: List[float]) -> Optional[SpeculationHandle]:
+        """
+        Kick off retrieval in a worker thread. Must be called from within the event loop;
+        the task copies the caller's context (deadline, priority, trace).
+
+        Returns:
+            SpeculationHandle, or None when speculation is disabled
+        """
+        if not self.enabled:
+            return None
+        future = asyncio.create_task(
+            asyncio.to_thread(hierarchical_rag_query, message, query_vector=embedding)
+        )
+        return SpeculationHandle(future, time.perf_counter())
+
+    @staticmethod
+    def stats() -> Dict[str, float]:
+        """
+        Summary used to tune the mode: wasted-work ratio and mean latency saved.
+        """
+        used = SPECULATIVE_TOTAL.value(outcome="used")
+        discarded = SPECULATIVE_TOTAL.value(outcome="discarded")
+        total = used + discarded
+        saved_count = SPECULATIVE_SAVED.count()
+        return {
+            "used": used,
+            "discarded": discarded,
+            "wasted_ratio": discarded / total if total else 0.0,
+            "mean_latency_saved_s": SPECULATIVE_SAVED.sum() / saved_count if saved_count else 0.0,
+        }
+
+
+# Module-level singleton instance
+_retriever_instance = None
+
+
+def get_speculative_retriever() -> SpeculativeRetriever:
+    """
+    Get or create a singleton SpeculativeRetriever instance.
+
+    Returns:
+        SpeculativeRetriever instance
+    """
+    global _retriever_instance
+    if _retriever_instance is None:
+        _retriever_instance = SpeculativeRetriever()
+    return _retriever_instance
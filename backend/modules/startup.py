@@ -0,0 +1,123 @@
+# modules/startup.py
+"""
+Startup lifecycle: warm-up of heavy resources and readiness reporting.
+
+Importing main.py only defines routes. Upstream clients and the routing
+anchors (one batched embeddings request) are created from the FastAPI
+lifespan hook by a WarmUp:
+
+    warm_up = WarmUp([("openai_client", get_openai_client), ...])
+    await warm_up.start()   # lifespan startup
+    await warm_up.stop()    # lifespan shutdown
+
+Steps run in order in a worker thread. With WARMUP_IN_BACKGROUND=1 (default)
+the server accepts connections immediately and failed steps are retried
+every WARMUP_RETRY_S seconds; with WARMUP_IN_BACKGROUND=0 startup waits for
+the first pass. Requests that arrive before warm-up finished still work:
+every resource is also created lazily on first use.
+
+/healthz answers as soon as the process serves requests (liveness);
+/readyz answers 503 with per-step status until every step succeeded
+(readiness), e.g. while configuration is missing or OpenAI is unreachable.
+
+Metrics:
+- sakhi_ready                     -> 1 once every warm-up step succeeded
+- sakhi_warm_up_seconds{step}     -> duration of the last attempt of each step
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+READY = gauge("sakhi_ready", "1 once startup warm-up has completed")
+WARM_UP_SECONDS = gauge("sakhi_warm_up_seconds", "Duration of the last attempt of each warm-up step")
+
+
+class WarmUp:
+    """
+    Runs named warm-up steps once at startup and tracks their status.
+    """
+
+    def __init__(
+        self,
+        steps: List[Tuple[str, Callable[[], object]]],
+        background: Optional[bool] = None,
+        retry_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            steps: (name, blocking callable) pairs, run in order
+            background: Serve before warm-up finished (env WARMUP_IN_BACKGROUND, default on)
+            retry_interval: Seconds between attempts of failed steps (env WARMUP_RETRY_S, default 5)
+        """
+        if background is None:
+            background = os.getenv("WARMUP_IN_BACKGROUND", "1") == "1"
+        self.background = background
+        self.retry_interval = retry_interval or float(os.getenv("WARMUP_RETRY_S", "5"))
+        self.steps = steps
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self._status: Dict[str, str] = {name: "pending" for name, _ in steps}
+        self._task: Optional[asyncio.Task] = None
+        READY.set(0)
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def _run_pending(self) -> None:
+        """
+        One pass over the steps that have not succeeded yet (blocking).
+        """
+        for name, step in self.steps:
+            if self._status[name] == "ok":
+                continue
+            started = time.perf_counter()
+            try:
+                step()
+                self._status[name] = "ok"
+            except Exception as e:
+                self._status[name] = f"error: {e}"
+                logger.warning("Warm-up step %s failed: %s", name, e)
+            WARM_UP_SECONDS.set(time.perf_counter() - started, step=name)
+
+        if all(status == "ok" for status in self._status.values()):
+            self.ready_at = time.perf_counter()
+            READY.set(1)
+            logger.info("Warm-up complete in %.0f ms", (self.ready_at - self.started_at) * 1000)
+
+    async def _run(self, first_pass_done: bool) -> None:
+        if not first_pass_done:
+            await asyncio.to_thread(self._run_pending)
+        while not self.ready:
+            await asyncio.sleep(self.retry_interval)
+            await asyncio.to_thread(self._run_pending)
+
+    async def start(self) -> None:
+        """
+        Called from the lifespan hook before the server accepts requests.
+        """
+        self.started_at = time.perf_counter()
+        first_pass_done = False
+        if not self.background:
+            await asyncio.to_thread(self._run_pending)
+            first_pass_done = True
+        if not self.ready:
+            self._task = asyncio.create_task(self._run(first_pass_done))
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, object]:
+        return {"ready": self.ready, "steps": dict(self._status)}
@@ -0,0 +1,64 @@
+# modules/streaming.py
+"""
+Helpers for the Server-Sent Events chat endpoint.
+"""
+
+import asyncio
+import contextvars
+import json
+import threading
+from typing import Any, AsyncIterator, Iterator
+
+from modules.metrics import histogram
+
+TIME_TO_FIRST_TOKEN = histogram(
+    "sakhi_chat_time_to_first_token_seconds",
+    "Time from request arrival to the first streamed reply token",
+)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # disable proxy buffering (nginx)
+}
+
+_END = object()
+
+
+def sse_event(event: str, data: Any) -> str:
+    """
+    Format one SSE frame. Data is JSON encoded so multi-line text stays on one line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def iterate_in_thread(iterator: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Consume a blocking iterator (e.g. an OpenAI stream) without blocking the event loop.
+
+    Closing this generator early (client disconnect) also closes the iterator, so a
+    generator releases what it holds, such as an upstream slot. The close runs in a
+    worker thread once a next() still in flight there has returned.
+    """
+    lock = threading.Lock()
+    exhausted = False
+
+    def step():
+        with lock:
+            return next(iterator, _END)
+
+    def close():
+        with lock:
+            iterator.close()
+
+    try:
+        while True:
+            item = await asyncio.to_thread(step)
+            if item is _END:
+                exhausted = True
+                return
+            yield item
+    finally:
+        if not exhausted and hasattr(iterator, "close"):
+            # Not awaited: the consumer may be cancelled; the executor runs it regardless
+            asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, close)
@@ -2,8 +2,13 @@
 """
 Utility functions for text processing.
 """
+import re
+from typing import List, Tuple
 
 MAX_RESPONSE_LENGTH = 2000
+FOLLOW_UPS_MARKER = " Follow ups : "
+# Written by the model after the last follow-up question; used as a stop sequence, never shown
+FOLLOW_UPS_END = "[[END]]"
 
 
 def truncate_response(text: str, max_length: int = MAX_RESPONSE_LENGTH) -> str:
@@ -24,7 +29,7 @@ def truncate_response(text: str, max_length: int = MAX_RESPONSE_LENGTH) -> str:
         return text
     
     # Check if response contains follow-up questions
-    follow_ups_marker = " Follow ups : "
+    follow_ups_marker = FOLLOW_UPS_MARKER
     
     if follow_ups_marker in text:
         # Split into main reply and follow-ups
@@ -78,3 +83,43 @@ def _truncate_text(text: str, max_length: int) -> str:
         truncated += "..."
     
     return truncated
+
+
+_FOLLOW_UPS_SPLIT = re.compile(r"\s*follow[\s-]*ups?\s*:\s*", re.IGNORECASE)
+_LIST_PREFIX = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def split_follow_ups(text: str, max_items: int = 5) -> Tuple[str, List[str]]:
+    """
+    Split a reply into the main text and its suggested follow-up questions.
+    
+    Args:
+        text: Full reply, possibly ending with " Follow ups : q1\nq2\nq3"
+        max_items: Maximum number of follow-up questions to return
+    
+    Returns:
+        (main_reply, follow_ups) - follow_ups is empty when the reply has none
+    """
+    if not text:
+        return text, []
+    
+    parts = _FOLLOW_UPS_SPLIT.split(text, maxsplit=1)
+    if len(parts) < 2:
+        return text, []
+    
+    main_reply, tail = parts
+    follow_ups = []
+    for line in tail.splitlines():
+        question = _LIST_PREFIX.sub("", line).strip()
+        if question and question != FOLLOW_UPS_END:
+            follow_ups.append(question)
+    
+    return main_reply.rstrip(), follow_ups[:max_items]
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a user message for exact-match lookups (case, punctuation, whitespace).
+    """
+    cleaned = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return re.sub(r"\s+", " ", cleaned).strip()
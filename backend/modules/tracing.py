@@ -0,0 +1,226 @@
+# modules/tracing.py
+"""
+Per-request traces with stage and upstream spans.
+
+TracingMiddleware opens a trace for every HTTP request. Handlers mark their
+stages and annotate the chat route once it is known:
+
+    with stage("classify"):
+        classification = classify_message(message)
+    set_trace_route("openai_rag")
+
+upstream_slot() records a span for every outbound call (embeddings, chat,
+slm, postgrest, rpc). The trace lives in a context variable, so stages run in
+worker threads (asyncio.to_thread, sync endpoints) and stream generators
+land in the right trace.
+
+When the request ends, spans are exported as histograms carrying the trace
+ID as exemplar:
+
+- sakhi_request_seconds{path, route}            -> whole request
+- sakhi_stage_seconds{route, stage}             -> handler stages
+- sakhi_upstream_call_seconds{route, upstream}  -> outbound calls (excluding queueing)
+
+With DEBUG_STAGE_TIMINGS=1 responses carry an X-Stage-Timings header in
+Server-Timing syntax ("classify;dur=48.2, upstream.chat;dur=301.0;count=2").
+For streamed responses it covers the stages finished before the first byte.
+Every response carries X-Trace-Id.
+
+Stages outside a request (background tasks that outlive it) are recorded
+immediately with route="background". Queued work that is processed later
+(see modules/webhook_ingest.py) opens its own trace with traced(path).
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from modules.deadlines import get_stage_budget
+from modules.metrics import histogram
+
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_SECONDS = histogram("sakhi_request_seconds", "End-to-end request time by path and chat route", buckets=_BUCKETS)
+STAGE_SECONDS = histogram("sakhi_stage_seconds", "Wall time spent in each request stage", buckets=_BUCKETS)
+UPSTREAM_CALL_SECONDS = histogram(
+    "sakhi_upstream_call_seconds",
+    "Outbound call time per upstream, after admission",
+    buckets=_BUCKETS,
+)
+
+# Paths that are not traced (scrapes and probes)
+UNTRACED_PATHS = {"/metrics", "/debug/metrics", "/healthz", "/readyz"}
+
+STAGE = "stage"
+UPSTREAM = "upstream"
+
+
+class Trace:
+    """
+    Spans of one request. Appended to from the event loop and worker threads.
+    """
+
+    def __init__(self, path: str):
+        self.trace_id = os.urandom(16).hex()
+        self.path = path
+        self.route = "-"
+        self.started = time.perf_counter()
+        self.finished = False
+        self.spans: List[Tuple[str, str, float]] = []  # (kind, name, seconds)
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, name: str, seconds: float) -> bool:
+        """
+        Record a span; returns False if the trace was already exported.
+        """
+        with self._lock:
+            if self.finished:
+                return False
+            self.spans.append((kind, name, seconds))
+            return True
+
+    def timings_header(self) -> str:
+        """
+        Server-Timing style summary of the spans so far, aggregated by name.
+        """
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for kind, name, seconds in spans:
+            key = name if kind == STAGE else f"upstream.{name}"
+            entry = totals.setdefault(key, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+        parts = []
+        for key, (seconds, count) in totals.items():
+            part = f"{key};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f";count={count}"
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def finish(self, status: int) -> None:
+        """
+        Export the spans to the histograms (once).
+        """
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            spans = list(self.spans)
+        exemplar = {"trace_id": self.trace_id}
+        for kind, name, seconds in spans:
+            _observe(kind, name, seconds, self.route, exemplar)
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - self.started,
+            exemplar=exemplar,
+            path=self.path,
+            route=self.route if status < 500 else f"{self.route}:error",
+        )
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("sakhi_trace", default=None)
+
+
+def _observe(kind: str, name: str, seconds: float, route: str, exemplar: Optional[Dict[str, str]] = None) -> None:
+    if kind == STAGE:
+        STAGE_SECONDS.observe(seconds, exemplar=exemplar, route=route, stage=name)
+    else:
+        UPSTREAM_CALL_SECONDS.observe(seconds, exemplar=exemplar, route=route, upstream=name)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def set_trace_route(route: str) -> None:
+    """
+    Label the current request with its chat route (slm_direct, openai_rag, emergency, ...).
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.route = route
+
+
+def record_span(kind: str, name: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is None or not trace.add(kind, name, seconds):
+        _observe(kind, name, seconds, "background")
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the enclosed block as one stage of the current request. Failed stages are recorded too.
+    The time also updates the stage's typical cost (modules/deadlines.py).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        record_span(STAGE, name, seconds)
+        get_stage_budget().observe(name, seconds)
+
+
+@contextmanager
+def traced(path: str):
+    """
+    Trace a unit of work outside an HTTP request (e.g. a queued webhook turn).
+    Yields the trace; it is exported as `path` when the block ends.
+    """
+    trace = Trace(path)
+    token = _current_trace.set(trace)
+    status = 500
+    try:
+        yield trace
+        status = 200
+    finally:
+        trace.finish(status)
+        _current_trace.reset(token)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: opens a trace per request, adds X-Trace-Id (and
+    X-Stage-Timings in debug mode) and exports the spans when the response is done.
+    """
+
+    def __init__(self, app, debug_timings: Optional[bool] = None):
+        self.app = app
+        if debug_timings is None:
+            debug_timings = os.getenv("DEBUG_STAGE_TIMINGS", "0") == "1"
+        self.debug_timings = debug_timings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNTRACED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["path"])
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace.trace_id.encode()))
+                if self.debug_timings:
+                    headers.append((b"x-stage-timings", trace.timings_header().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            # Label unmatched paths together so 404 scans do not grow the series
+            if scope.get("route") is None and status == 404:
+                trace.path = "unmatched"
+            trace.finish(status)
+            _current_trace.reset(token)
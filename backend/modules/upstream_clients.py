@@ -0,0 +1,365 @@
+# modules/upstream_clients.py
+"""
+Process-wide HTTP clients for every upstream, with bounded connection pools.
+
+    get_openai_client("embeddings")        -> openai.OpenAI for that call type
+    get_async_openai_client("chat")        -> openai.AsyncOpenAI
+    get_postgrest_session()                -> requests.Session for Supabase PostgREST (tables and RPC)
+    get_slm_http_client()                  -> httpx.AsyncClient used by SLMClient
+    get_outbound_http_client()             -> httpx.AsyncClient for outbound replies (modules/outbound.py)
+
+    session.get(url, timeout=call_timeout("postgrest_read"))
+
+Each client is created on first use and shared by all callers, so a worker
+holds one pool per upstream. Pool sizes come from <PREFIX>_MAX_CONNECTIONS,
+<PREFIX>_MAX_KEEPALIVE, <PREFIX>_KEEPALIVE_EXPIRY and <PREFIX>_MAX_RETRIES
+with the prefixes OPENAI_HTTP, POSTGREST_HTTP, SLM and OUTBOUND_HTTP. The defaults cover the
+upstream_limiter concurrency, which is what actually caps in-flight calls.
+
+Retries:
+- OpenAI: the SDK's backoff on connection errors, 408/409/429 and 5xx
+- PostgREST: connection errors on every call; 502/503/504 and read errors on GET only
+- SLM and outbound replies: connection errors only
+
+Read timeouts per call type come from UPSTREAM_TIMEOUT_<CALL>_S (see
+CALL_TIMEOUTS); connecting is bounded by UPSTREAM_CONNECT_TIMEOUT_S. SLM
+routes keep their SLM_*_TIMEOUT settings (see modules/slm_client.py). Inside
+a request both are capped by the time left before its deadline
+(modules/deadlines.py).
+
+Metrics:
+- sakhi_http_connections{client, state}  -> active, idle and max connections per pool
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modules.deadlines import bounded
+from modules.metrics import gauge, register_collector
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECTIONS = gauge("sakhi_http_connections", "Pooled upstream connections by client and state (active, idle, max)")
+
+# client -> (env prefix, max connections, max keep-alive, keep-alive expiry s, max retries)
+POOL_DEFAULTS = {
+    "openai": ("OPENAI_HTTP", 32, 32, 30.0, 2),
+    "postgrest": ("POSTGREST_HTTP", 48, 48, 30.0, 2),
+    "slm": ("SLM", 100, 20, 30.0, 0),
+    "outbound": ("OUTBOUND_HTTP", 16, 16, 30.0, 2),
+}
+
+# call type -> default read timeout (s)
+CALL_TIMEOUTS = {
+    "embeddings": 10.0,
+    "chat": 30.0,
+    "chat_stream": 60.0,
+    "postgrest_read": 10.0,
+    "postgrest_write": 10.0,
+    "rpc": 20.0,
+    "outbound": 10.0,
+}
+
+
+class PoolConfig:
+    """
+    Connection pool settings of one upstream client.
+    """
+
+    def __init__(self, name: str):
+        prefix, connections, keepalive, expiry, retries = POOL_DEFAULTS[name]
+        self.max_connections = int(os.getenv(f"{prefix}_MAX_CONNECTIONS", str(connections)))
+        self.max_keepalive = int(os.getenv(f"{prefix}_MAX_KEEPALIVE", str(keepalive)))
+        self.keepalive_expiry = float(os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", str(expiry)))
+        self.max_retries = int(os.getenv(f"{prefix}_MAX_RETRIES", str(retries)))
+
+    def httpx_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+_configs: Dict[str, PoolConfig] = {}
+
+
+def pool_config(name: str) -> PoolConfig:
+    config = _configs.get(name)
+    if config is None:
+        config = _configs[name] = PoolConfig(name)
+    return config
+
+
+def connect_timeout() -> float:
+    return float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_S", "5"))
+
+
+def _read_timeout(call: str) -> float:
+    return float(os.getenv(f"UPSTREAM_TIMEOUT_{call.upper()}_S", str(CALL_TIMEOUTS[call])))
+
+
+def call_timeout(call: str) -> Tuple[float, float]:
+    """
+    (connect, read) timeout for a call type, in the form requests expects,
+    capped by the current request's deadline.
+    """
+    return bounded(connect_timeout()), bounded(_read_timeout(call))
+
+
+def _httpx_timeout(call: str) -> httpx.Timeout:
+    connect, read = call_timeout(call)
+    return httpx.Timeout(read, connect=connect)
+
+
+def _configured_timeout(call: str) -> httpx.Timeout:
+    # Without the deadline cap, for clients that are cached or outlive the request
+    return httpx.Timeout(_read_timeout(call), connect=connect_timeout())
+
+
+_lock = threading.Lock()
+_openai_http: Optional[httpx.Client] = None
+_openai_clients: Dict[str, object] = {}  # call type -> OpenAI with that timeout
+_async_openai_http: Optional[httpx.AsyncClient] = None
+_async_openai_clients: Dict[str, object] = {}
+_postgrest_session: Optional[requests.Session] = None
+_slm_http: Optional[httpx.AsyncClient] = None
+_outbound_http: Optional[httpx.AsyncClient] = None
+
+
+def _openai_api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise Exception("OPENAI_API_KEY missing")
+    return api_key
+
+
+def get_openai_client(call: str = "chat"):
+    """
+    Shared OpenAI client configured with the timeout of the given call type
+    (embeddings, chat, chat_stream), capped by the current request's deadline.
+    All call types share one connection pool.
+
+    Raises:
+        Exception: OPENAI_API_KEY is not set
+    """
+    client = _openai_clients.get(call)
+    if client is None:
+        client = _create_openai_client(call)
+    return _within_deadline(client, call)
+
+
+def _within_deadline(client, call: str):
+    # Cached clients carry the configured timeout; a short budget gets a copy with less
+    timeout = _httpx_timeout(call)
+    if timeout.read < client.timeout.read:
+        return client.with_options(timeout=timeout)
+    return client
+
+
+def _create_openai_client(call: str):
+    global _openai_http
+    with _lock:
+        if call not in _openai_clients:
+            if _openai_http is None:
+                api_key = _openai_api_key()
+                from openai import OpenAI
+
+                config = pool_config("openai")
+                _openai_http = httpx.Client(limits=config.httpx_limits(), follow_redirects=True)
+                _openai_clients["_base"] = OpenAI(
+                    api_key=api_key, http_client=_openai_http, max_retries=config.max_retries
+                )
+            _openai_clients[call] = _openai_clients["_base"].with_options(timeout=_configured_timeout(call))
+        return _openai_clients[call]
+
+
+def get_async_openai_client(call: str = "chat"):
+    """
+    Async counterpart of get_openai_client, with its own pool (same limits).
+
+    Raises:
+        Exception: OPENAI_API_KEY is not set
+    """
+    global _async_openai_http
+    client = _async_openai_clients.get(call)
+    if client is not None and _async_openai_http is not None and not _async_openai_http.is_closed:
+        return _within_deadline(client, call)
+    with _lock:
+        if _async_openai_http is None or _async_openai_http.is_closed:
+            api_key = _openai_api_key()
+            from openai import AsyncOpenAI
+
+            config = pool_config("openai")
+            _async_openai_http = httpx.AsyncClient(limits=config.httpx_limits(), follow_redirects=True)
+            _async_openai_clients.clear()
+            _async_openai_clients["_base"] = AsyncOpenAI(
+                api_key=api_key, http_client=_async_openai_http, max_retries=config.max_retries
+            )
+        if call not in _async_openai_clients:
+            _async_openai_clients[call] = _async_openai_clients["_base"].with_options(timeout=_configured_timeout(call))
+        return _within_deadline(_async_openai_clients[call], call)
+
+
+def get_postgrest_session() -> requests.Session:
+    """
+    Shared requests.Session for PostgREST. Up to max keep-alive connections are
+    kept open; calls beyond that open a connection that is closed afterwards.
+    """
+    global _postgrest_session
+    if _postgrest_session is not None:
+        return _postgrest_session
+    with _lock:
+        if _postgrest_session is None:
+            config = pool_config("postgrest")
+            retry = Retry(
+                total=config.max_retries,
+                backoff_factor=0.2,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.max_keepalive, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _postgrest_session = session
+        return _postgrest_session
+
+
+def get_slm_http_client(http2: Optional[bool] = None) -> httpx.AsyncClient:
+    """
+    Shared httpx.AsyncClient for the SLM endpoint; recreated after close_clients().
+
+    Args:
+        http2: Use HTTP/2 when the h2 package is installed (env SLM_HTTP2, default off)
+    """
+    global _slm_http
+    if _slm_http is not None and not _slm_http.is_closed:
+        return _slm_http
+    with _lock:
+        if _slm_http is None or _slm_http.is_closed:
+            if http2 is None:
+                http2 = os.getenv("SLM_HTTP2", "0") == "1"
+            if http2:
+                try:
+                    import h2  # noqa: F401  (httpx needs the optional h2 package for HTTP/2)
+                except ImportError:
+                    logger.warning("SLM_HTTP2=1 but the 'h2' package is not installed; using HTTP/1.1")
+                    http2 = False
+            config = pool_config("slm")
+            _slm_http = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(
+                    limits=config.httpx_limits(), http2=http2, retries=config.max_retries
+                ),
+            )
+        return _slm_http
+
+
+def get_outbound_http_client() -> httpx.AsyncClient:
+    """
+    Shared httpx.AsyncClient for delivering replies to the messaging platform.
+    """
+    global _outbound_http
+    if _outbound_http is not None and not _outbound_http.is_closed:
+        return _outbound_http
+    with _lock:
+        if _outbound_http is None or _outbound_http.is_closed:
+            config = pool_config("outbound")
+            _outbound_http = httpx.AsyncClient(
+                timeout=_configured_timeout("outbound"),
+                transport=httpx.AsyncHTTPTransport(limits=config.httpx_limits(), retries=config.max_retries),
+            )
+        return _outbound_http
+
+
+async def close_slm_http_client() -> None:
+    global _slm_http
+    with _lock:
+        client, _slm_http = _slm_http, None
+    if client is not None:
+        await client.aclose()
+
+
+async def close_clients() -> None:
+    """
+    Close every pool. Called from the application shutdown hook.
+    """
+    global _openai_http, _async_openai_http, _postgrest_session, _slm_http, _outbound_http
+    with _lock:
+        openai_http, async_openai_http = _openai_http, _async_openai_http
+        session, slm_http, outbound_http = _postgrest_session, _slm_http, _outbound_http
+        _openai_http = _async_openai_http = _postgrest_session = _slm_http = _outbound_http = None
+        _openai_clients.clear()
+        _async_openai_clients.clear()
+    for client in (async_openai_http, slm_http, outbound_http):
+        if client is not None:
+            await client.aclose()
+    if openai_http is not None:
+        openai_http.close()
+    if session is not None:
+        session.close()
+
+
+def _httpx_stats(client) -> Dict[str, int]:
+    stats = {"active": 0, "idle": 0}
+    # httpx does not expose pool state publicly; read httpcore's pool when available
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    for conn in getattr(pool, "connections", None) or []:
+        if conn.is_idle():
+            stats["idle"] += 1
+        elif not conn.is_closed():
+            stats["active"] += 1
+    return stats
+
+
+def _requests_stats(session: requests.Session) -> Dict[str, int]:
+    stats = {"active": 0, "idle": 0}
+    pools = session.get_adapter("https://").poolmanager.pools
+    for key in list(pools.keys()):
+        try:
+            pool = pools[key]
+        except KeyError:
+            continue
+        # urllib3 keeps a LIFO queue of maxsize slots: None = free slot, else an idle connection
+        slots = getattr(pool, "pool", None)
+        if slots is None:
+            continue
+        queued = list(slots.queue)
+        stats["idle"] += sum(1 for conn in queued if conn is not None)
+        stats["active"] += slots.maxsize - len(queued)
+    return stats
+
+
+def connection_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Active / idle connections of every pool created so far.
+    """
+    stats = {}
+    for name, client, kind in (
+        ("openai", _openai_http, "openai"),
+        ("openai_async", _async_openai_http, "openai"),
+        ("slm", _slm_http, "slm"),
+        ("outbound", _outbound_http, "outbound"),
+    ):
+        if client is not None and not client.is_closed:
+            stats[name] = {**_httpx_stats(client), "max": pool_config(kind).max_connections}
+    if _postgrest_session is not None:
+        stats["postgrest"] = {**_requests_stats(_postgrest_session), "max": pool_config("postgrest").max_keepalive}
+    return stats
+
+
+def _collect() -> None:
+    for name, stats in connection_stats().items():
+        for state, value in stats.items():
+            HTTP_CONNECTIONS.set(value, client=name, state=state)
+
+
+register_collector(_collect)
@@ -0,0 +1,301 @@
+# modules/upstream_limiter.py
+"""
+Per-upstream concurrency limits with bounded queues and fast load shedding.
+
+Every outbound call takes a slot from the pool for its upstream:
+
+    with upstream_slot("chat"):
+        client.chat.completions.create(...)
+
+    async with async_upstream_slot("slm"):
+        await http.post(...)
+
+upstream_slot() blocks and refuses to run on the event loop thread (it
+raises RuntimeError); sync clients are called through asyncio.to_thread.
+
+Pools: embeddings, chat, slm, postgrest, rpc, outbound. When a pool is at its
+concurrency limit callers wait in a bounded queue, served in priority order
+(see request_priority) and FIFO within a priority; when the queue is
+full (or the wait exceeds the queue timeout, or the time left before the
+request's deadline) the call fails immediately with
+UpstreamOverloaded, a 503 carrying Retry-After, instead of piling more
+requests onto an upstream that is already returning 429s.
+
+Metrics:
+- sakhi_upstream_queue_seconds{pool}      -> time spent waiting for a slot
+- sakhi_upstream_in_flight{pool}          -> calls holding a slot
+- sakhi_upstream_queued{pool}             -> calls waiting
+- sakhi_upstream_shed_total{pool, reason} -> rejected calls (queue_full, queue_timeout)
+
+The time a call holds its slot is recorded as an upstream span of the
+current request trace (see modules/tracing.py).
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from modules.deadlines import bounded
+from modules.metrics import counter, gauge, histogram
+from modules.tracing import UPSTREAM, record_span
+
+QUEUE_SECONDS = histogram(
+    "sakhi_upstream_queue_seconds",
+    "Time spent waiting for an upstream slot",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+IN_FLIGHT = gauge("sakhi_upstream_in_flight", "Calls currently holding an upstream slot")
+QUEUED = gauge("sakhi_upstream_queued", "Calls waiting for an upstream slot")
+SHED = counter("sakhi_upstream_shed_total", "Upstream calls rejected by admission control")
+
+# pool -> (max concurrency, max queued)
+DEFAULT_LIMITS = {
+    "embeddings": (16, 64),
+    "chat": (16, 64),
+    "slm": (32, 128),
+    "postgrest": (32, 128),
+    "rpc": (16, 64),
+    "outbound": (16, 64),
+}
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+# Priority of upstream calls made on behalf of the current request. Context
+# variables follow asyncio tasks and asyncio.to_thread, so setting it once in
+# a handler covers every call the request makes.
+_request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("upstream_priority", default=PRIORITY_NORMAL)
+
+
+def set_request_priority(priority: int) -> None:
+    _request_priority.set(priority)
+
+
+def request_priority() -> int:
+    return _request_priority.get()
+
+
+class UpstreamOverloaded(HTTPException):
+    """
+    Raised when an upstream pool cannot admit a call. Maps to 503 + Retry-After.
+    """
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Upstream '{pool}' is overloaded, please retry",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+def ensure_worker_thread(what: str) -> None:
+    """
+    Raise RuntimeError when called on a thread that runs an event loop.
+    Blocking waits there would stall every request on the loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError(f"{what} blocks; call it via asyncio.to_thread or use the async variant")
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted", "abandoned")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+        self.abandoned = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._set_future)
+
+    def _set_future(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class UpstreamPool:
+    """
+    Counting limiter shared by threads (sync clients) and the event loop (async clients).
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._waiters: list = []  # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._queued = 0
+        self._lock = threading.Lock()
+
+    def _try_enter(self, waiter_factory) -> Optional[_Waiter]:
+        """
+        Take a free slot (returns None) or enqueue a waiter. Raises when the queue is full.
+        """
+        with self._lock:
+            if self._active < self.max_concurrency and not self._queued:
+                self._active += 1
+                self._publish()
+                return None
+            priority = request_priority()
+            # High-priority calls may overfill the queue rather than be shed
+            if self._queued >= self.max_queue and priority != PRIORITY_HIGH:
+                SHED.inc(pool=self.name, reason="queue_full")
+                raise UpstreamOverloaded(self.name, self.retry_after)
+            waiter = waiter_factory()
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            self._queued += 1
+            self._publish()
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Give up waiting. Returns True if the slot was granted in the meantime (caller owns it).
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            self._queued -= 1
+            self._publish()
+        SHED.inc(pool=self.name, reason="queue_timeout")
+        return False
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if waiter.abandoned:
+                    continue
+                # Hand the slot over directly; _active stays the same
+                waiter.granted = True
+                self._queued -= 1
+                self._publish()
+                waiter.wake()
+                return
+            self._active -= 1
+            self._publish()
+
+    def acquire(self) -> None:
+        """
+        Blocking acquire for sync clients in worker threads. Raises RuntimeError
+        on the event loop thread; async callers use acquire_async.
+        """
+        ensure_worker_thread(f"UpstreamPool({self.name}).acquire")
+        started = time.perf_counter()
+        waiter = self._try_enter(_Waiter)
+        if waiter is not None:
+            waiter.event.wait(bounded(self.queue_timeout))
+            if not self._abandon(waiter):
+                raise UpstreamOverloaded(self.name, self.retry_after)
+        QUEUE_SECONDS.observe(time.perf_counter() - started, pool=self.name)
+
+    async def acquire_async(self) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        waiter = self._try_enter(lambda: _Waiter(loop))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), bounded(self.queue_timeout))
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise UpstreamOverloaded(self.name, self.retry_after)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self.release()
+                raise
+        QUEUE_SECONDS.observe(time.perf_counter() - started, pool=self.name)
+
+    def _publish(self) -> None:
+        IN_FLIGHT.set(self._active, pool=self.name)
+        QUEUED.set(self._queued, pool=self.name)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self._active,
+            "queued": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+
+_pools: Dict[str, UpstreamPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> UpstreamPool:
+    """
+    Pool for an upstream, created on first use. Limits come from
+    UPSTREAM_<NAME>_CONCURRENCY / UPSTREAM_<NAME>_QUEUE, plus the shared
+    UPSTREAM_QUEUE_TIMEOUT_S and UPSTREAM_RETRY_AFTER_S.
+    """
+    pool = _pools.get(name)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        if name not in _pools:
+            concurrency, queue = DEFAULT_LIMITS.get(name, (16, 64))
+            prefix = f"UPSTREAM_{name.upper()}"
+            _pools[name] = UpstreamPool(
+                name,
+                max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+                max_queue=int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+                queue_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_S", "10")),
+                retry_after=int(os.getenv("UPSTREAM_RETRY_AFTER_S", "2")),
+            )
+        return _pools[name]
+
+
+@contextmanager
+def upstream_slot(name: str):
+    """
+    Hold a slot of the named pool for the duration of a blocking call.
+    """
+    pool = get_pool(name)
+    pool.acquire()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        pool.release()
+        record_span(UPSTREAM, name, time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def async_upstream_slot(name: str):
+    """
+    Async variant of upstream_slot for httpx-based clients.
+    """
+    pool = get_pool(name)
+    await pool.acquire_async()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        pool.release()
+        record_span(UPSTREAM, name, time.perf_counter() - started)
+
+
+def limiter_stats() -> Dict[str, Dict[str, int]]:
+    return {name: pool.stats() for name, pool in _pools.items()}
@@ -0,0 +1,171 @@
+# modules/user_locks.py
+"""
+Per-user ordering of chat turns with full parallelism across users.
+
+A user who sends several messages quickly would otherwise have them handled
+concurrently: the name/gender/location onboarding updates race and history
+reads and writes interleave. The chat handlers hold the user's lock for the
+whole turn; other users are not affected.
+
+    async with user_locks.hold(user_key(req.user_id, req.phone_number)):
+        ...
+
+Waiters are served in arrival order (asyncio.Lock is FIFO). A lock entry
+exists only while the user has a turn running or queued. Locks are
+per worker process; run a single worker per user (e.g. sticky routing on
+phone number) when several workers serve the same users.
+
+A turn that waits longer than USER_LOCK_TIMEOUT_S is answered with 429 +
+Retry-After instead of queueing indefinitely.
+
+Metrics:
+- sakhi_user_lock_wait_seconds        -> time a turn waited for the user's previous turns
+- sakhi_user_lock_timeouts_total      -> turns rejected after waiting too long
+- sakhi_user_lock_waiting             -> turns currently queued behind another turn of the same user
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from modules.metrics import counter, gauge, histogram
+from modules.tracing import stage
+
+LOCK_WAIT = histogram(
+    "sakhi_user_lock_wait_seconds",
+    "Time a chat turn waited for the same user's earlier turns",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+LOCK_TIMEOUTS = counter("sakhi_user_lock_timeouts_total", "Chat turns rejected after waiting too long for the user's lock")
+LOCK_WAITING = gauge("sakhi_user_lock_waiting", "Chat turns queued behind another turn of the same user")
+
+
+def user_key(user_id: Optional[str], phone_number: Optional[str]) -> Optional[str]:
+    """
+    Lock key for a chat request (phone number for users that may not exist yet).
+    """
+    if user_id:
+        return f"user:{user_id}"
+    if phone_number:
+        return f"phone:{phone_number}"
+    return None
+
+
+class _Entry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # turns holding or waiting for the lock
+
+
+class UserLocks:
+    """
+    Keyed asyncio locks, created on demand and dropped when idle. Event loop only.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, timeout: Optional[float] = None):
+        """
+        Args:
+            enabled: Serialize turns per user (env USER_LOCK_ENABLED, default on)
+            timeout: Longest wait before answering 429 (env USER_LOCK_TIMEOUT_S, default 30)
+        """
+        if enabled is None:
+            enabled = os.getenv("USER_LOCK_ENABLED", "1") == "1"
+        self.enabled = enabled
+        self.timeout = timeout or float(os.getenv("USER_LOCK_TIMEOUT_S", "30"))
+        self._entries: Dict[str, _Entry] = {}
+        self._waiting = 0
+
+    def _release_entry(self, key: str, entry: _Entry) -> None:
+        entry.users -= 1
+        if entry.users == 0:
+            del self._entries[key]
+
+    async def acquire(self, key: Optional[str]) -> "UserLease":
+        """
+        Wait for the user's lock. The returned lease must be released exactly
+        once; release() is idempotent so it can be wired to several exit paths.
+        """
+        if not self.enabled or key is None:
+            return UserLease(None, None, None)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        entry.users += 1
+
+        started = time.perf_counter()
+        contended = entry.lock.locked()
+        if contended:
+            self._waiting += 1
+            LOCK_WAITING.set(self._waiting)
+        try:
+            with stage("user_lock"):
+                await asyncio.wait_for(entry.lock.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._release_entry(key, entry)
+            LOCK_TIMEOUTS.inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Your previous message is still being answered, please retry",
+                headers={"Retry-After": "5"},
+            )
+        except BaseException:
+            self._release_entry(key, entry)
+            raise
+        finally:
+            if contended:
+                self._waiting -= 1
+                LOCK_WAITING.set(self._waiting)
+        LOCK_WAIT.observe(time.perf_counter() - started)
+        return UserLease(self, key, entry)
+
+    @asynccontextmanager
+    async def hold(self, key: Optional[str]):
+        lease = await self.acquire(key)
+        try:
+            yield
+        finally:
+            lease.release()
+
+
+class UserLease:
+    """
+    A held user lock.
+    """
+
+    __slots__ = ("_owner", "_key", "_entry")
+
+    def __init__(self, owner: Optional[UserLocks], key: Optional[str], entry: Optional[_Entry]):
+        self._owner = owner
+        self._key = key
+        self._entry = entry
+
+    def release(self) -> None:
+        if self._entry is None:
+            return
+        entry, self._entry = self._entry, None
+        entry.lock.release()
+        self._owner._release_entry(self._key, entry)
+
+
+# Module-level singleton instance
+_user_locks_instance = None
+
+
+def get_user_locks() -> UserLocks:
+    """
+    Get or create a singleton UserLocks instance.
+
+    Returns:
+        UserLocks instance
+    """
+    global _user_locks_instance
+    if _user_locks_instance is None:
+        _user_locks_instance = UserLocks()
+    return _user_locks_instance
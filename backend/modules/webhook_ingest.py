@@ -0,0 +1,164 @@
+# modules/webhook_ingest.py
+"""
+Immediate-ack webhook ingestion with a bounded worker pool.
+
+Messaging platforms time out webhooks after a few seconds and retry, while a
+medical turn (classification, retrieval, generation, intent) often takes
+longer. POST /webhook/message therefore only validates and enqueues the
+message and answers 202 right away; a fixed pool of workers runs the chat
+turn and hands the reply to the outbound sender (modules/outbound.py).
+
+    webhook_ingest = WebhookIngest(handler=turn)   # turn(request, received)
+    await webhook_ingest.start()            # lifespan startup
+    job = webhook_ingest.submit(req, recipient, message_id, received)
+    await webhook_ingest.stop()             # lifespan shutdown, drains the queue
+
+The queue is bounded (WEBHOOK_QUEUE_SIZE); when it is full the webhook
+answers 503 + Retry-After so the platform retries later. Each turn runs in
+its own task and trace (path "webhook_worker"), so the request priority of
+one turn never leaks into the next one. The handler gets the perf_counter()
+time the webhook arrived, so the turn's deadline (modules/deadlines.py)
+includes the time spent queued. Per-user ordering comes from the
+handler's user lock (modules/user_locks.py).
+
+Metrics:
+- sakhi_webhook_queue_depth                       -> messages waiting for a worker
+- sakhi_webhook_workers_busy                      -> workers running a turn
+- sakhi_webhook_messages_total{outcome}           -> accepted, rejected (queue full), sent, failed
+- sakhi_webhook_end_to_end_seconds{outcome}       -> webhook received -> reply handed to the sender
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from modules.metrics import counter, gauge, histogram
+from modules.outbound import get_outbound_sender
+from modules.tracing import traced
+from modules.upstream_limiter import UpstreamOverloaded
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = gauge("sakhi_webhook_queue_depth", "Webhook messages waiting for a worker")
+WORKERS_BUSY = gauge("sakhi_webhook_workers_busy", "Webhook workers running a chat turn")
+MESSAGES = counter("sakhi_webhook_messages_total", "Webhook messages by outcome (accepted, rejected, sent, failed)")
+END_TO_END = histogram(
+    "sakhi_webhook_end_to_end_seconds",
+    "Time from webhook receipt until the reply was handed to the outbound sender",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+
+
+class WebhookJob:
+    __slots__ = ("request", "recipient", "message_id", "received")
+
+    def __init__(self, request: Any, recipient: str, message_id: str, received: Optional[float] = None):
+        self.request = request
+        self.recipient = recipient
+        self.message_id = message_id
+        self.received = time.perf_counter() if received is None else received
+
+
+class WebhookIngest:
+    """
+    Bounded queue plus worker tasks that run the chat handler for each message.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any, float], Awaitable[Any]],
+        on_failure: Optional[Callable[[WebhookJob], None]] = None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        drain_timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            handler: Chat turn coroutine, called with (request, received); its result is the reply payload
+            on_failure: Called with the job when its turn or delivery fails (e.g. to forget its message ID)
+            workers: Concurrent turns (env WEBHOOK_WORKERS, default 16)
+            queue_size: Messages buffered before answering 503 (env WEBHOOK_QUEUE_SIZE, default 1000)
+            drain_timeout: Seconds to finish queued turns on shutdown (env WEBHOOK_DRAIN_TIMEOUT_S, default 20)
+        """
+        self.handler = handler
+        self.on_failure = on_failure
+        self.workers = workers or int(os.getenv("WEBHOOK_WORKERS", "16"))
+        self.queue_size = queue_size or int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+        self.drain_timeout = drain_timeout or float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_S", "20"))
+        self.retry_after = int(os.getenv("WEBHOOK_RETRY_AFTER_S", "5"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        QUEUE_DEPTH.set(0)
+        WORKERS_BUSY.set(0)
+
+    async def stop(self) -> None:
+        """
+        Let the workers finish what is queued (up to drain_timeout), then cancel them.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook queue not drained on shutdown (%d messages dropped)", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, request: Any, recipient: str, message_id: str, received: Optional[float] = None) -> WebhookJob:
+        """
+        Enqueue a validated message. Raises UpstreamOverloaded (503) when the queue is full.
+        `received` is the perf_counter() time the webhook arrived (defaults to now).
+        """
+        if self._queue is None:
+            raise UpstreamOverloaded("webhook", self.retry_after)
+        job = WebhookJob(request, recipient, message_id, received)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            MESSAGES.inc(outcome="rejected")
+            raise UpstreamOverloaded("webhook", self.retry_after)
+        MESSAGES.inc(outcome="accepted")
+        QUEUE_DEPTH.set(self._queue.qsize())
+        return job
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            QUEUE_DEPTH.set(self._queue.qsize())
+            self._busy += 1
+            WORKERS_BUSY.set(self._busy)
+            try:
+                # Own task, so context variables set by the turn (priority, trace) end with it
+                await asyncio.create_task(self._process(job))
+            finally:
+                self._busy -= 1
+                WORKERS_BUSY.set(self._busy)
+                self._queue.task_done()
+
+    async def _process(self, job: WebhookJob) -> None:
+        outcome = "failed"
+        try:
+            with traced("webhook_worker"):
+                payload = await self.handler(job.request, job.received)
+                await get_outbound_sender().send(job.recipient, payload, job.message_id)
+            outcome = "sent"
+        except Exception:
+            logger.exception("Webhook turn failed for %s (message_id=%s)", job.recipient, job.message_id)
+            if self.on_failure is not None:
+                self.on_failure(job)
+        finally:
+            MESSAGES.inc(outcome=outcome)
+            END_TO_END.observe(time.perf_counter() - job.received, outcome=outcome)
@@ -0,0 +1,135 @@
+# modules/write_behind.py
+"""
+Write-behind queue for conversation rows while PostgREST writes are down.
+
+When the postgrest_write circuit breaker is open (modules/circuit_breaker.py)
+a chat turn cannot save its messages. Rather than failing the turn, the rows
+are kept here and inserted in order once writes work again:
+
+    try:
+        supabase_insert("sakhi_conversations", payload)
+    except CircuitOpen:
+        if not get_write_behind().enqueue("sakhi_conversations", payload):
+            raise
+
+A background task (started in the app lifespan) retries every
+WRITE_BEHIND_FLUSH_S; its first insert is the breaker's half-open probe. Rows
+carry their own created_at, so history ordering is kept. The queue is in
+memory per worker and bounded by WRITE_BEHIND_MAX_ROWS; rows beyond that are
+refused (the turn then fails as before), and rows still queued at shutdown
+are lost after one final flush attempt.
+
+Metrics:
+- sakhi_write_behind_depth                   -> rows waiting to be written
+- sakhi_write_behind_rows_total{outcome}     -> queued, written, refused
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from modules.metrics import counter, gauge
+from supabase_client import supabase_insert
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_DEPTH = gauge("sakhi_write_behind_depth", "Rows waiting in the write-behind queue")
+WRITE_BEHIND_ROWS = counter("sakhi_write_behind_rows_total", "Write-behind rows by outcome (queued, written, refused)")
+
+
+class WriteBehindQueue:
+    """
+    Bounded FIFO of pending inserts, flushed by a background task. Thread-safe.
+    """
+
+    def __init__(self, max_rows: Optional[int] = None, flush_interval: Optional[float] = None):
+        """
+        Args:
+            max_rows: Rows kept before refusing more (env WRITE_BEHIND_MAX_ROWS, default 10000)
+            flush_interval: Seconds between flush attempts (env WRITE_BEHIND_FLUSH_S, default 5)
+        """
+        self.max_rows = max_rows or int(os.getenv("WRITE_BEHIND_MAX_ROWS", "10000"))
+        self.flush_interval = flush_interval or float(os.getenv("WRITE_BEHIND_FLUSH_S", "5"))
+        self._rows: Deque[Tuple[str, Dict[str, Any]]] = deque()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, table: str, payload: Dict[str, Any]) -> bool:
+        """
+        Keep a row for later. Returns False when the queue is full.
+        """
+        with self._lock:
+            if len(self._rows) >= self.max_rows:
+                WRITE_BEHIND_ROWS.inc(outcome="refused")
+                return False
+            self._rows.append((table, payload))
+            WRITE_BEHIND_DEPTH.set(len(self._rows))
+        WRITE_BEHIND_ROWS.inc(outcome="queued")
+        return True
+
+    def depth(self) -> int:
+        return len(self._rows)
+
+    def flush(self) -> int:
+        """
+        Insert queued rows in order until one fails. Returns the number written. Blocking.
+        """
+        written = 0
+        while True:
+            with self._lock:
+                if not self._rows:
+                    break
+                table, payload = self._rows.popleft()
+            try:
+                supabase_insert(table, payload)
+            except Exception as e:
+                with self._lock:
+                    self._rows.appendleft((table, payload))
+                logger.debug("Write-behind flush paused: %s", e)
+                break
+            written += 1
+            WRITE_BEHIND_ROWS.inc(outcome="written")
+        WRITE_BEHIND_DEPTH.set(len(self._rows))
+        return written
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._rows:
+            await asyncio.to_thread(self.flush)
+            if self._rows:
+                logger.warning("Write-behind queue not drained on shutdown (%d rows dropped)", len(self._rows))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._rows:
+                written = await asyncio.to_thread(self.flush)
+                if written:
+                    logger.info("Write-behind flushed %d rows (%d left)", written, len(self._rows))
+
+
+# Module-level singleton instance
+_write_behind_instance = None
+
+
+def get_write_behind() -> WriteBehindQueue:
+    """
+    Get or create a singleton WriteBehindQueue instance.
+
+    Returns:
+        WriteBehindQueue instance
+    """
+    global _write_behind_instance
+    if _write_behind_instance is None:
+        _write_behind_instance = WriteBehindQueue()
+    return _write_behind_instance
@@ -0,0 +1,120 @@
+"""
+Cold-start profile of the backend: import time, lifespan startup and time to ready.
+
+Runs `import main` in a fresh interpreter with `-X importtime`, then enters
+the app lifespan and polls /readyz. By default the stand-in servers
+(see stubs/) are started first so that warm-up talks to something; use
+--no-stubs to profile against the current environment instead.
+
+Usage:
+    python profile_startup.py [--budget-ms 1500] [--top 15] [--no-stubs]
+
+Exits with status 1 when `import main` takes longer than --budget-ms, so it
+can guard the cold-start budget in CI.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+RESULT_MARKER = "STARTUP_PROFILE "
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    serving = time.perf_counter()
+    deadline = serving + {ready_timeout}
+    while client.get("/readyz").status_code != 200 and time.perf_counter() < deadline:
+        time.sleep(0.02)
+    ready = time.perf_counter()
+    status = client.get("/readyz").json()
+print({marker!r} + json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "lifespan_ms": (serving - imported) * 1000,
+    "ready_ms": (ready - imported) * 1000 if status["ready"] else None,
+    "readyz": status,
+}}), flush=True)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self us, cumulative us) for the modules imported directly by main.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+
+    direct = []
+    for depth, name, self_us, cumulative_us in rows:
+        if depth == 1:
+            direct.append((name, self_us, cumulative_us))
+        elif depth == 0 and name == "main":
+            return direct
+        elif depth == 0:
+            direct = []  # imported before main (site, encodings, ...)
+    return direct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="maximum acceptable `import main` time")
+    parser.add_argument("--top", type=int, default=15, help="slowest direct imports to list")
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--no-stubs", action="store_true", help="use the current environment instead of the stand-in servers")
+    parser.add_argument("--stub-port", type=int, default=8921, help="first of three consecutive stub ports")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not args.no_stubs:
+        from stubs.__main__ import start_stubs
+
+        env.update(start_stubs(args.stub_port, args.stub_port + 1, args.stub_port + 2, seed_paths=()))
+    env.setdefault("LOG_LEVEL", "WARNING")
+
+    code = CHILD.format(ready_timeout=args.ready_timeout, marker=RESULT_MARKER)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+    if proc.returncode != 0 or not lines:
+        print(proc.stdout[-2000:])
+        print("\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))[-4000:])
+        sys.exit(f"startup failed (exit code {proc.returncode})")
+    result = json.loads(lines[-1][len(RESULT_MARKER):])
+
+    direct = sorted(parse_importtime(proc.stderr), key=lambda row: -row[2])
+    print(f"{'direct import of main':<40}{'self ms':>10}{'cumulative ms':>15}")
+    for name, self_us, cumulative_us in direct[: args.top]:
+        print(f"{name:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>15.1f}")
+
+    ready = f"{result['ready_ms']:.0f} ms" if result["ready_ms"] is not None else "not ready"
+    print(f"\nimport main      {result['import_ms']:8.0f} ms  (budget {args.budget_ms:.0f} ms)")
+    print(f"lifespan startup {result['lifespan_ms']:8.0f} ms")
+    print(f"ready after      {ready:>11}  (since import, includes warm-up)")
+    for step, status in result["readyz"]["steps"].items():
+        print(f"  {step:<20}{status}")
+
+    if result["import_ms"] > args.budget_ms:
+        sys.exit(f"import main exceeded the cold-start budget ({result['import_ms']:.0f} > {args.budget_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
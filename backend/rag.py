@@ -1,27 +1,57 @@
 # rag.py
-import os
+from typing import List
 
 import supabase_client  # ensures .env is loaded once
-from openai import OpenAI
 
-EMBEDDING_MODEL = "text-embedding-3-small"  # 1536 dimensions
+from modules.circuit_breaker import get_breaker
+from modules.rate_limiter import estimate_tokens, get_rate_limiter
+from modules.single_flight import SingleFlight
+from modules.upstream_clients import get_openai_client
+from modules.upstream_limiter import upstream_slot
 
-_api_key = os.getenv("OPENAI_API_KEY")
-if not _api_key:
-    raise Exception("OPENAI_API_KEY missing")
+EMBEDDING_MODEL = "text-embedding-3-small"  # 1536 dimensions
 
-client = OpenAI(api_key=_api_key)
+rate_limiter = get_rate_limiter()
+openai_breaker = get_breaker("openai")
+# Keyed by the exact text sent, since the vector feeds routing thresholds
+embedding_flight = SingleFlight("generate_embedding")
 
 
 def generate_embedding(text: str):
     """
     Converts text into a 1536-dimensional embedding vector using OpenAI.
+    Identical concurrent requests share one API call.
     """
     cleaned = text.strip().replace("\n", " ")
+    return embedding_flight.do(cleaned, lambda: _embed(cleaned))
 
-    resp = client.embeddings.create(
-        model=EMBEDDING_MODEL,
-        input=cleaned
-    )
+
+def _embed(cleaned: str):
+    reserved = estimate_tokens(cleaned)
+    rate_limiter.acquire("embeddings", reserved)
+    with openai_breaker.guard(), upstream_slot("embeddings"):
+        resp = get_openai_client("embeddings").embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=cleaned
+        )
+    rate_limiter.settle("embeddings", reserved, getattr(getattr(resp, "usage", None), "total_tokens", None))
 
     return resp.data[0].embedding
+
+
+def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embeds several texts with a single API request (same order as the input).
+    """
+    cleaned = [text.strip().replace("\n", " ") for text in texts]
+
+    reserved = sum(estimate_tokens(text) for text in cleaned)
+    rate_limiter.acquire("embeddings", reserved)
+    with openai_breaker.guard(), upstream_slot("embeddings"):
+        resp = get_openai_client("embeddings").embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=cleaned
+        )
+    rate_limiter.settle("embeddings", reserved, getattr(getattr(resp, "usage", None), "total_tokens", None))
+
+    return [item.embedding for item in sorted(resp.data, key=lambda item: item.index)]
@@ -1,19 +1,54 @@
-from typing import List, Dict, Any
+import logging
+from typing import List, Dict, Any, Optional
 from supabase_client import supabase_rpc
+from modules.circuit_breaker import CircuitOpen
+from modules.deadlines import get_stage_budget
 from rag import generate_embedding
+from modules.single_flight import SingleFlight
+from modules.text_utils import normalize_query
+from modules.tracing import stage
 
-def hierarchical_rag_query(user_question: str, match_threshold: float = 0.3, match_count: int = 4) -> List[Dict[str, Any]]:
+logger = logging.getLogger(__name__)
+
+# Identical questions in flight at the same time share one search
+retrieval_flight = SingleFlight("hierarchical_rag_query")
+stage_budget = get_stage_budget()
+
+
+def hierarchical_rag_query(
+    user_question: str,
+    match_threshold: float = 0.3,
+    match_count: int = 4,
+    query_vector: Optional[List[float]] = None,
+) -> List[Dict[str, Any]]:
     """
     Performs a hierarchical search:
-    1. Embeds the user question.
+    1. Embeds the user question (skipped when query_vector is already known).
     2. Searches 'section_chunks' for matches (Hierarchical) -> Primary Source for Answer.
     3. Searches 'faq' table for matches (FAQ) -> Primary Source for YouTube Link.
+       Skipped when the request's remaining budget is needed for generation.
     4. Merges and returns results.
+
+    Concurrent calls for the same normalized question share one search; the
+    returned list is shared with them and must not be modified.
     """
-    print(f"Querying: {user_question}...")
+    return retrieval_flight.do(
+        (normalize_query(user_question), match_threshold, match_count),
+        lambda: _hierarchical_search(user_question, match_threshold, match_count, query_vector),
+    )
+
+
+def _hierarchical_search(
+    user_question: str,
+    match_threshold: float,
+    match_count: int,
+    query_vector: Optional[List[float]],
+) -> List[Dict[str, Any]]:
+    logger.debug("Hierarchical query (%d chars)", len(user_question))
     
     # 1. Embed user query
-    query_vector = generate_embedding(user_question)
+    if query_vector is None:
+        query_vector = generate_embedding(user_question)
     
     # 2. Call Supabase RPC functions
     params = {
@@ -31,10 +66,17 @@ def hierarchical_rag_query(user_question: str, match_threshold: float = 0.3, mat
             for item in doc_results:
                 item["source_type"] = "DOCUMENT"
                 merged_results.append(item)
+    except CircuitOpen:
+        # Breaker open: answer without document context
+        pass
     except Exception as e:
-        print(f"Hierarchical search failed: {e}")
+        logger.warning("Hierarchical search failed: %s", e)
 
     # B. Search FAQ (For YouTube Link)
+    # Optional: the answer comes from the documents, the FAQ only adds media links
+    if not stage_budget.allows("faq", "generate_medical"):
+        return merged_results
+
     # We only need the top match to find a relevant video
     # match_faq likely only accepts query_embedding and match_count
     faq_params = {
@@ -43,7 +85,8 @@ def hierarchical_rag_query(user_question: str, match_threshold: float = 0.3, mat
     }
     
     try:
-        faq_results = supabase_rpc("match_faq", faq_params)
+        with stage("faq"):
+            faq_results = supabase_rpc("match_faq", faq_params)
         if faq_results:
             for item in faq_results:
                 # Only add if it has a YouTube link or if we have no other results
@@ -54,8 +97,11 @@ def hierarchical_rag_query(user_question: str, match_threshold: float = 0.3, mat
                         item["infographic_url"] = None 
 
                     merged_results.append(item)
+    except CircuitOpen:
+        # Breaker open: no FAQ match (and no video link)
+        pass
     except Exception as e:
-        print(f"FAQ search failed: {e}")
+        logger.warning("FAQ search failed: %s", e)
     
     return merged_results
 
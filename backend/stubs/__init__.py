@@ -0,0 +1,10 @@
+"""
+Deterministic local stand-ins for the backend's upstreams.
+
+- fake_openai:    OpenAI-compatible /v1/embeddings and /v1/chat/completions
+- fake_postgrest: in-memory PostgREST (tables + the RPCs the code calls)
+- fake_slm:       SLM endpoint speaking {"question", "chat_history", "context"}
+
+Start all three with `python -m stubs` and point the backend at them with the
+environment variables it prints (see stubs/__main__.py).
+"""
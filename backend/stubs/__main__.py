@@ -0,0 +1,101 @@
+"""
+Run the stand-in OpenAI, PostgREST and SLM servers on one machine.
+
+Usage:
+    python -m stubs [--openai-port 8901] [--postgrest-port 8902] [--slm-port 8903]
+                    [--chat-latency-ms 300] [--embed-latency-ms 50] [--slm-pass-ms 200]
+                    [--seed emotional_data.json]
+
+Then start the backend with the printed environment, e.g.:
+    OPENAI_BASE_URL=http://127.0.0.1:8901/v1 OPENAI_API_KEY=stub \
+    SUPABASE_URL=http://127.0.0.1:8902 SUPABASE_SERVICE_ROLE_KEY=stub \
+    SLM_ENDPOINT_URL=http://127.0.0.1:8903/slm uvicorn main:app --port 8100
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import uvicorn
+
+from stubs import fake_openai, fake_postgrest, fake_slm
+
+
+def serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def stub_environment(openai_port: int, postgrest_port: int, slm_port: int) -> dict:
+    """
+    Environment that points the backend (and the openai / supabase clients) at the stubs.
+    """
+    return {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "SUPABASE_URL": f"http://127.0.0.1:{postgrest_port}",
+        "SUPABASE_SERVICE_ROLE_KEY": "stub",
+        "SLM_ENDPOINT_URL": f"http://127.0.0.1:{slm_port}/slm",
+    }
+
+
+def start_stubs(
+    openai_port: int = 8901,
+    postgrest_port: int = 8902,
+    slm_port: int = 8903,
+    chat_latency_ms: float = 300.0,
+    embed_latency_ms: float = 50.0,
+    slm_pass_ms: float = 200.0,
+    seed_paths=("emotional_data.json",),
+) -> dict:
+    """
+    Start all three stubs in background threads and return the backend environment.
+    """
+    store = fake_postgrest.InMemoryStore()
+    for path in seed_paths or ():
+        if os.path.exists(path):
+            sections = fake_postgrest.seed_from_json(store, path, fake_openai.embed_text)
+            print(f"Seeded {sections} sections from {path}")
+
+    serve(fake_openai.build_app(chat_latency_ms=chat_latency_ms, embed_latency_ms=embed_latency_ms), openai_port)
+    serve(fake_postgrest.build_app(store), postgrest_port)
+    serve(fake_slm.build_app(pass_ms=slm_pass_ms), slm_port)
+    return stub_environment(openai_port, postgrest_port, slm_port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--openai-port", type=int, default=8901)
+    parser.add_argument("--postgrest-port", type=int, default=8902)
+    parser.add_argument("--slm-port", type=int, default=8903)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    parser.add_argument("--slm-pass-ms", type=float, default=200.0)
+    parser.add_argument("--seed", action="append", help="knowledge JSON to load (repeatable)")
+    args = parser.parse_args()
+
+    env = start_stubs(
+        args.openai_port,
+        args.postgrest_port,
+        args.slm_port,
+        args.chat_latency_ms,
+        args.embed_latency_ms,
+        args.slm_pass_ms,
+        args.seed or ("emotional_data.json",),
+    )
+    print("Stubs running. Backend environment:")
+    for key, value in env.items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
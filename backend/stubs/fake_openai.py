@@ -0,0 +1,247 @@
+# stubs/fake_openai.py
+"""
+OpenAI-compatible stand-in: /v1/embeddings and /v1/chat/completions.
+
+Embeddings are deterministic signed feature-hashing vectors over words and
+word bigrams, so texts that share words are close in cosine space and the
+semantic router / retrieval behave plausibly. Chat replies are chosen from
+the system prompt (classifier, intent, medical, small talk) and honour
+max_tokens, stop, stream and stream_options.include_usage.
+
+Latency is configurable per call type to mimic the real API.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import struct
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIM = 1536
+
+TOPIC_KEYWORDS = (
+    "ivf", "iui", "icsi", "fertility", "infertility", "pregnan", "ovulat", "parenthood",
+    "treatment", "cost", "success", "clinic", "doctor", "pcos", "pcod", "sperm", "egg",
+    "embryo", "bleeding", "pain", "baby", "period", "miscarriage",
+)
+
+FILLER = (
+    "Many people feel the same way, and it is okay to take things one step at a time.",
+    "Your doctor can explain what applies to your own situation.",
+    "Keeping a simple note of your symptoms and questions helps at every visit.",
+    "Rest, regular meals and gentle movement support your body through this.",
+    "Please reach out to your care team whenever something feels unclear.",
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _feature(token: str):
+    digest = hashlib.sha1(token.encode("utf-8")).digest()
+    index = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+    sign = 1.0 if digest[4] & 1 else -1.0
+    return index, sign
+
+
+def embed_text(text: str) -> List[float]:
+    """
+    Deterministic unit vector for a text (same text -> same vector, in every process).
+    """
+    words = _WORD.findall((text or "").lower())
+    vector = np.zeros(EMBEDDING_DIM)
+    for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        index, sign = _feature(token)
+        vector[index] += sign
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def _last_user_message(messages: List[Dict[str, str]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+
+def _pick(seed_text: str, options, count: int) -> List[str]:
+    seed = int(hashlib.sha1(seed_text.encode("utf-8")).hexdigest(), 16)
+    return [options[(seed + i) % len(options)] for i in range(count)]
+
+
+def _reply_for(messages: List[Dict[str, str]], reply_words: int) -> str:
+    # Only the leading system message identifies the prompt; later ones carry history
+    system = (messages[0].get("content") or "") if messages and messages[0].get("role") == "system" else ""
+    user = _last_user_message(messages)
+    lowered = user.lower()
+
+    if "Identified Language" in system:
+        language = "Telugu" if re.search(r"[ఀ-౿]", user) else "English"
+        signal = "YES" if any(k in lowered for k in TOPIC_KEYWORDS) else "NO"
+        return f"Identified Language: {language}\n\nGeneral Output:\n[SIGNAL]: {signal}"
+
+    if "generating intent" in system:
+        return "We're here to walk with you through this with care and clarity."
+
+    sentences = _pick(user, FILLER, 8)
+    body = " ".join(sentences)
+    body = " ".join(body.split()[:reply_words])
+
+    if "Follow ups" in system:
+        topic = user.strip().rstrip("?") or "this"
+        return (
+            f"Thank you for asking about {topic}. {body}\n\n"
+            f" Follow ups : What are the next steps for {topic[:30]}?\n"
+            "How long does recovery usually take?\n"
+            "What should I ask my doctor?\n"
+            "[[END]]\n"
+            "Anything else I can help you with today?"
+        )
+    return f"I'm here for you. {body}"
+
+
+class _PrefixCache:
+    """
+    Mimics provider prefix caching: a repeated first message of 1024+ tokens is reported as cached.
+    """
+
+    MIN_TOKENS = 1024
+
+    def __init__(self):
+        self._seen = set()
+
+    def cached_tokens(self, messages: List[Dict[str, str]]) -> int:
+        if not messages:
+            return 0
+        prefix = messages[0].get("content") or ""
+        tokens = _count_tokens(prefix)
+        key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        if key in self._seen and tokens >= self.MIN_TOKENS:
+            return tokens - tokens % 128
+        self._seen.add(key)
+        return 0
+
+
+def build_app(
+    chat_latency_ms: float = 300.0,
+    embed_latency_ms: float = 50.0,
+    token_ms: float = 10.0,
+    reply_words: int = 60,
+) -> FastAPI:
+    """
+    Args:
+        chat_latency_ms: Delay before a completion (or its first streamed token)
+        embed_latency_ms: Delay per embeddings request
+        token_ms: Delay between streamed tokens
+        reply_words: Approximate length of generated replies
+    """
+    app = FastAPI(title="fake-openai")
+    prefix_cache = _PrefixCache()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await asyncio.sleep(embed_latency_ms / 1000.0)
+
+        data = []
+        for i, text in enumerate(inputs or []):
+            vector = embed_text(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(_count_tokens(t) for t in inputs or [])
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "gpt-4o-mini")
+        text = _reply_for(messages, reply_words)
+
+        finish_reason = "stop"
+        for stop in ([body["stop"]] if isinstance(body.get("stop"), str) else body.get("stop") or []):
+            if stop in text:
+                text = text.split(stop, 1)[0]
+        words = text.split(" ")
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(words) > max_tokens:
+            words = words[:max_tokens]
+            text = " ".join(words)
+            finish_reason = "length"
+
+        prompt_tokens = sum(_count_tokens(m.get("content") or "") for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+            "prompt_tokens_details": {"cached_tokens": prefix_cache.cached_tokens(messages)},
+        }
+        completion_id = f"chatcmpl-{hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]}"
+        created = int(time.time())
+
+        await asyncio.sleep(chat_latency_ms / 1000.0)
+
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        def chunk(delta: dict, finish: Optional[str] = None, chunk_usage: Optional[dict] = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if chunk_usage:
+                payload["usage"] = chunk_usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(token_ms / 1000.0)
+                yield chunk({"content": word if i == len(words) - 1 else word + " "})
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield chunk({}, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
@@ -0,0 +1,232 @@
+# stubs/fake_postgrest.py
+"""
+In-memory PostgREST stand-in for the Supabase project.
+
+Implements what the backend uses:
+- GET    /rest/v1/{table}?select=...&col=eq.value&limit=N&order=col.desc
+- POST   /rest/v1/{table}                (insert, returns the representation)
+- PATCH  /rest/v1/{table}?col=eq.value   (update, returns updated rows)
+- POST   /rest/v1/rpc/hierarchical_search | match_faq | match_sakhi_kb
+
+Rows get an auto-increment "id" and an ISO "created_at". Vector RPCs use
+cosine similarity over the stored "embedding" columns; seed_from_json loads
+the knowledge JSON the same way ingest_json.py does (H3 sections + chunks).
+"""
+
+import itertools
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class InMemoryStore:
+    """
+    Tables as lists of dicts, guarded by one lock.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def insert(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        out = []
+        with self._lock:
+            for row in rows:
+                row = dict(row)
+                row.setdefault("id", next(self._ids))
+                row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                self.tables.setdefault(table, []).append(row)
+                out.append(dict(row))
+        return out
+
+    def select(self, table: str, filters: List[Callable[[dict], bool]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self.tables.get(table, []) if all(f(r) for f in filters)]
+
+    def update(self, table: str, filters: List[Callable[[dict], bool]], data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        out = []
+        with self._lock:
+            for row in self.tables.get(table, []):
+                if all(f(row) for f in filters):
+                    row.update(data)
+                    out.append(dict(row))
+        return out
+
+
+def _parse_filter(column: str, expression: str) -> Optional[Callable[[dict], bool]]:
+    op, _, value = expression.partition(".")
+    if op == "eq":
+        return lambda r: str(r.get(column)) == value
+    if op == "neq":
+        return lambda r: str(r.get(column)) != value
+    if op == "is":
+        return lambda r: (r.get(column) is None) == (value == "null")
+    if op in ("gt", "gte", "lt", "lte"):
+        def compare(r):
+            current = r.get(column)
+            if current is None:
+                return False
+            try:
+                current, target = float(current), float(value)
+            except ValueError:
+                target = value
+            return {"gt": current > target, "gte": current >= target,
+                    "lt": current < target, "lte": current <= target}[op]
+        return compare
+    if op == "in":
+        options = set(value.strip("()").split(","))
+        return lambda r: str(r.get(column)) in options
+    return None
+
+
+def _query_filters(params) -> List[Callable[[dict], bool]]:
+    filters = []
+    for column, expression in params.multi_items():
+        if column in ("select", "limit", "order", "offset"):
+            continue
+        parsed = _parse_filter(column, expression)
+        if parsed:
+            filters.append(parsed)
+    return filters
+
+
+def _project(rows: List[dict], select: str) -> List[dict]:
+    if not select or select == "*":
+        return rows
+    columns = [c.strip() for c in select.split(",")]
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+def _cosine_rank(rows: List[dict], query: List[float], column: str = "embedding"):
+    query_vec = np.array(query, dtype=float)
+    query_norm = np.linalg.norm(query_vec) or 1.0
+    ranked = []
+    for row in rows:
+        embedding = row.get(column)
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        if not embedding:
+            continue
+        vec = np.array(embedding, dtype=float)
+        similarity = float(vec @ query_vec / ((np.linalg.norm(vec) or 1.0) * query_norm))
+        ranked.append((similarity, row))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+
+def hierarchical_search(store: InMemoryStore, params: dict) -> List[dict]:
+    sections = {s["id"]: s for s in store.select("sakhi_sections", [])}
+    best: Dict[Any, float] = {}
+    for similarity, chunk in _cosine_rank(store.select("sakhi_section_chunks", []), params["query_embedding"]):
+        if similarity > params.get("match_threshold", 0.0) and chunk.get("section_id") in sections:
+            best.setdefault(chunk["section_id"], similarity)
+    results = [
+        {
+            "section_content": sections[sid].get("content"),
+            "header_path": sections[sid].get("header_path"),
+            "similarity": sim,
+        }
+        for sid, sim in best.items()
+    ]
+    results.sort(key=lambda r: r["similarity"], reverse=True)
+    return results[: params.get("match_count", 4)]
+
+
+def _match_table(table: str, fields: List[str]):
+    def rpc(store: InMemoryStore, params: dict) -> List[dict]:
+        ranked = _cosine_rank(store.select(table, []), params["query_embedding"])
+        out = []
+        for similarity, row in ranked[: params.get("match_count", 3)]:
+            item = {f: row.get(f) for f in fields}
+            item["similarity"] = similarity
+            out.append(item)
+        return out
+    return rpc
+
+
+RPCS = {
+    "hierarchical_search": hierarchical_search,
+    "match_faq": _match_table("faq", ["id", "question", "answer", "youtube_link", "infographic_url"]),
+    "match_sakhi_kb": _match_table("sakhi_bot_knowledge", ["kb_id", "title", "content"]),
+}
+
+
+def seed_from_json(store: InMemoryStore, path: str, embed: Callable[[str], List[float]]) -> int:
+    """
+    Load a knowledge JSON (document_structure tree) into sakhi_sections / sakhi_section_chunks.
+    Returns the number of sections inserted.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+
+    count = 0
+
+    def visit(node: dict, path_stack: List[str]) -> None:
+        nonlocal count
+        current = path_stack + [node.get("title", "Untitled")]
+        if node.get("level") == "H3":
+            chunks = [c.get("text", "") for c in node.get("chunks", []) if c.get("text")]
+            if not chunks:
+                return
+            content = "\n".join(chunks)
+            section = store.insert("sakhi_sections", [{
+                "header_path": " > ".join(current),
+                "content": content,
+                "token_count": len(content.split()),
+            }])[0]
+            store.insert("sakhi_section_chunks", [
+                {"section_id": section["id"], "chunk_content": text, "embedding": embed(text)}
+                for text in chunks
+            ])
+            count += 1
+            return
+        for child in node.get("children", []):
+            visit(child, current)
+
+    for root in document.get("document_structure", []):
+        visit(root, [])
+    return count
+
+
+def build_app(store: Optional[InMemoryStore] = None) -> FastAPI:
+    app = FastAPI(title="fake-postgrest")
+    store = store or InMemoryStore()
+    app.state.store = store
+
+    @app.post("/rest/v1/rpc/{name}")
+    async def rpc(name: str, request: Request):
+        handler = RPCS.get(name)
+        if handler is None:
+            return JSONResponse({"message": f"function {name} does not exist"}, status_code=404)
+        return handler(store, await request.json())
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        params = request.query_params
+        rows = store.select(table, _query_filters(params))
+        order = params.get("order")
+        if order:
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset: offset + int(limit)] if limit else rows[offset:]
+        return _project(rows, params.get("select", "*"))
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        body = await request.json()
+        rows = store.insert(table, body if isinstance(body, list) else [body])
+        return JSONResponse(rows, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        return store.update(table, _query_filters(request.query_params), await request.json())
+
+    return app
@@ -0,0 +1,65 @@
+# stubs/fake_slm.py
+"""
+SLM endpoint stand-in speaking the SLMClient contract.
+
+Request:  {"question": str, "chat_history": str, "context"?: str, "stream"?: bool}
+          or a JSON array of such objects (micro-batching)
+Response: {"reply": str} (array in, array out), or SSE "data: {"token": ...}"
+          events ending with "data: [DONE]" when stream is true.
+
+Like a single-GPU model server, forward passes run one at a time and cost a
+fixed overhead plus a small per-item amount.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def _reply(item: Dict[str, Any]) -> str:
+    question = (item.get("question") or "").strip()
+    context = (item.get("context") or "").strip()
+    if context:
+        first_line = next((line for line in context.splitlines() if line.strip()), "")
+        return f"Based on what we know ({first_line[:80]}), here is some gentle guidance about: {question}"
+    return f"I'm here with you. You said: {question}"
+
+
+def build_app(pass_ms: float = 200.0, per_item_ms: float = 5.0, token_ms: float = 15.0) -> FastAPI:
+    """
+    Args:
+        pass_ms: Fixed cost of one forward pass
+        per_item_ms: Extra cost per request in a batched pass
+        token_ms: Delay between streamed tokens
+    """
+    app = FastAPI(title="fake-slm")
+    gpu = asyncio.Lock()
+
+    @app.post("/")
+    @app.post("/slm")
+    async def generate(request: Request):
+        body = await request.json()
+        items = body if isinstance(body, list) else [body]
+        async with gpu:
+            await asyncio.sleep((pass_ms + per_item_ms * len(items)) / 1000.0)
+        replies = [{"reply": _reply(item)} for item in items]
+
+        if isinstance(body, dict) and body.get("stream"):
+            words = replies[0]["reply"].split(" ")
+
+            async def events():
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(token_ms / 1000.0)
+                    token = word if i == len(words) - 1 else word + " "
+                    yield f"data: {json.dumps({'token': token})}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return replies if isinstance(body, list) else replies[0]
+
+    return app
@@ -4,9 +4,11 @@ import os
 import uuid
 from typing import Any, Dict, Optional
 
-import requests
 from dotenv import load_dotenv
-from supabase import create_client, Client
+
+from modules.circuit_breaker import get_breaker
+from modules.upstream_clients import call_timeout, get_postgrest_session
+from modules.upstream_limiter import upstream_slot
 
 # Ensure .env is loaded exactly once from this module
 _ENV_LOADED = False
@@ -25,9 +27,6 @@ _ensure_env_loaded()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise Exception("Supabase environment variables missing")
-
 HEADERS = {
     "apikey": SUPABASE_SERVICE_ROLE_KEY,
     "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
@@ -35,14 +34,41 @@ HEADERS = {
     "Prefer": "return=representation",
 }
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+class SupabaseError(Exception):
+    """
+    PostgREST answered with an error status (5xx counts against the circuit breaker).
+    """
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def supabase_configured() -> bool:
+    return bool(SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)
+
+
+def get_supabase_session():
+    """
+    Shared PostgREST session (see modules/upstream_clients.py).
+
+    Raises:
+        Exception: Supabase environment variables are missing
+    """
+    if not supabase_configured():
+        raise Exception("Supabase environment variables missing")
+    return get_postgrest_session()
 
 
 def supabase_insert(table: str, data: Dict[str, Any]):
+    session = get_supabase_session()
     url = f"{SUPABASE_URL}/rest/v1/{table}"
-    resp = requests.post(url, headers=HEADERS, json=data)
-    if resp.status_code >= 300:
-        raise Exception(f"Supabase insert failed: {resp.status_code} - {resp.text}")
+    with get_breaker("postgrest_write").guard():
+        with upstream_slot("postgrest"):
+            resp = session.post(url, headers=HEADERS, json=data, timeout=call_timeout("postgrest_write"))
+        if resp.status_code >= 300:
+            raise SupabaseError(resp.status_code, f"Supabase insert failed: {resp.status_code} - {resp.text}")
     return resp.json()
 
 
@@ -57,19 +83,25 @@ def supabase_select(
     """
     Fetch rows from a table or call an RPC when rpc is provided.
     """
+    session = get_supabase_session()
     if rpc:
         url = f"{SUPABASE_URL}/rest/v1/rpc/{rpc}"
-        resp = requests.post(url, headers=HEADERS, json=payload or {})
+        with get_breaker(f"rpc_{rpc}").guard():
+            with upstream_slot("rpc"):
+                resp = session.post(url, headers=HEADERS, json=payload or {}, timeout=call_timeout("rpc"))
+            if resp.status_code >= 500:
+                raise SupabaseError(resp.status_code, f"Supabase select failed: {resp.status_code} - {resp.text}")
     else:
         base_query = f"{SUPABASE_URL}/rest/v1/{table}?select={select}"
         if filters:
             base_query = f"{base_query}&{filters}"
         if limit:
             base_query = f"{base_query}&limit={limit}"
-        resp = requests.get(base_query, headers=HEADERS)
+        with upstream_slot("postgrest"):
+            resp = session.get(base_query, headers=HEADERS, timeout=call_timeout("postgrest_read"))
 
     if resp.status_code >= 300:
-        raise Exception(f"Supabase select failed: {resp.status_code} - {resp.text}")
+        raise SupabaseError(resp.status_code, f"Supabase select failed: {resp.status_code} - {resp.text}")
     return resp.json()
 
 
@@ -77,10 +109,13 @@ def supabase_update(table: str, match: str, data: Dict[str, Any]):
     """
     match example: \"user_id=eq.<id>\"
     """
+    session = get_supabase_session()
     url = f"{SUPABASE_URL}/rest/v1/{table}?{match}"
-    resp = requests.patch(url, headers=HEADERS, json=data)
-    if resp.status_code >= 300:
-        raise Exception(f"Supabase update failed: {resp.status_code} - {resp.text}")
+    with get_breaker("postgrest_write").guard():
+        with upstream_slot("postgrest"):
+            resp = session.patch(url, headers=HEADERS, json=data, timeout=call_timeout("postgrest_write"))
+        if resp.status_code >= 300:
+            raise SupabaseError(resp.status_code, f"Supabase update failed: {resp.status_code} - {resp.text}")
     return resp.json()
 
 
@@ -90,15 +125,14 @@ def generate_user_id() -> str:
 
 def supabase_rpc(function_name: str, params: Dict[str, Any]):
     """
-    Call a Postgres function via Supabase RPC.
+    Call a Postgres function via the PostgREST RPC endpoint. Each function has its
+    own circuit breaker (rpc_<function_name>); while it is open this raises CircuitOpen.
     """
-    res = supabase.rpc(function_name, params=params).execute()
-
-    # supabase-py returns data and possibly error on the response object
-    if hasattr(res, "error") and res.error:
-        raise Exception(f"Supabase RPC error: {res.error}")
-
-    if hasattr(res, "data"):
-        return res.data
-
-    return res
+    session = get_supabase_session()
+    url = f"{SUPABASE_URL}/rest/v1/rpc/{function_name}"
+    with get_breaker(f"rpc_{function_name}").guard():
+        with upstream_slot("rpc"):
+            resp = session.post(url, headers=HEADERS, json=params, timeout=call_timeout("rpc"))
+        if resp.status_code >= 300:
+            raise SupabaseError(resp.status_code, f"Supabase RPC error: {resp.status_code} - {resp.text}")
+    return resp.json()
@@ -0,0 +1,64 @@
+# tests/conftest.py
+"""
+Shared fixtures. The backend runs in-process against the local stubs
+(stubs/__main__.py) on free ports, so the tests need no credentials or network.
+
+    python -m pytest tests
+"""
+
+import os
+import socket
+import sys
+import time
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ONBOARDING_ANSWERS = ("hi", "Asha", "Female", "Vizag")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """
+    The imported main module, served on a free port. Yields (main, base_url).
+    """
+    os.chdir(BACKEND_DIR)
+    from stubs.__main__ import serve, start_stubs
+
+    os.environ.update(start_stubs(_free_port(), _free_port(), _free_port(), seed_paths=()))
+    os.environ["OPENAI_RATE_DB"] = str(tmp_path_factory.mktemp("rate") / "openai_rate.sqlite3")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import main
+
+    port = _free_port()
+    server = serve(main.app, port)
+    base_url = f"http://127.0.0.1:{port}"
+    with httpx.Client(base_url=base_url) as client:
+        while client.get("/readyz").status_code != 200:
+            time.sleep(0.1)
+    yield main, base_url
+    server.should_exit = True
+
+
+@pytest.fixture
+def onboard():
+    """
+    Coroutine that takes a new phone number through onboarding, so its next message is a chat turn.
+    """
+
+    async def _onboard(client: httpx.AsyncClient, phone: str) -> None:
+        for answer in ONBOARDING_ANSWERS:
+            response = await client.post("/sakhi/chat", json={"phone_number": phone, "message": answer})
+            assert response.status_code == 200
+
+    return _onboard
@@ -0,0 +1,92 @@
+# tests/test_clinic_directory.py
+"""
+A clinic directory answers facility questions without the LLM; without one
+they fall back to the SLM RAG path.
+"""
+
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from modules.clinic_directory import load_clinic_directory
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "clinic_directory.json")
+CITIES = {"Visakhapatnam", "Vijayawada", "Hyderabad", "Guntur"}
+
+
+@pytest.fixture(scope="module")
+def directory():
+    return load_clinic_directory(directory_path=FIXTURE, info_files=[])
+
+
+def test_fixture_loads_every_branch(directory):
+    assert {clinic["city"] for clinic in directory.clinics} == CITIES
+
+
+def test_empty_directory_defers_to_rag():
+    empty = load_clinic_directory(directory_path=os.path.join(os.path.dirname(FIXTURE), "missing.json"), info_files=[])
+    assert empty.clinics == []
+    assert empty.answer("vizag clinic address", "en") is None
+
+
+@pytest.mark.parametrize("message, city", [
+    ("vizag clinic address", "Visakhapatnam"),
+    ("phone number for vijayawada branch", "Vijayawada"),
+    ("what are the timings of the hyderabad clinic", "Hyderabad"),
+    ("where is your guntur centre located", "Guntur"),
+    ("bezawada lo clinic ekkada", "Vijayawada"),
+    ("విశాఖపట్నం క్లినిక్ చిరునామా", "Visakhapatnam"),
+])
+def test_city_lookup(directory, message, city):
+    assert [clinic["city"] for clinic in directory.find(message)] == [city]
+
+
+def test_short_alias_needs_a_whole_word(directory):
+    assert directory.find("tips for hydration during ivf") == []
+
+
+def test_reply_shows_the_requested_field(directory):
+    vijayawada = directory.find("vijayawada")[0]
+    reply = directory.answer("phone number for vijayawada branch", "English")
+    assert reply.splitlines() == [
+        "Here are the details for our Vijayawada clinic:",
+        f"📞 Phone: {vijayawada['phone']}",
+    ]
+
+
+def test_reply_in_telugu_with_profile_city(directory):
+    vizag = directory.find("vizag")[0]
+    reply = directory.answer("క్లినిక్ ఫోన్ నంబర్", "te", default_city="Vizag")
+    assert reply.splitlines() == ["మా Visakhapatnam క్లినిక్ వివరాలు:", f"📞 ఫోన్: {vizag['phone']}"]
+
+
+def test_unknown_city_lists_branches(directory):
+    reply = directory.answer("clinic address please", "en")
+    assert reply.startswith("We have clinics in ")
+    for city in CITIES:
+        assert city in reply
+
+
+def test_facility_route_answers_from_directory(backend, onboard, monkeypatch):
+    main, base_url = backend
+    phone = "+915550026001"
+    directory = load_clinic_directory(directory_path=FIXTURE, info_files=[])
+    monkeypatch.setattr(main, "clinic_directory", directory)
+    # The stub embeddings don't reproduce semantic routing; pin the facility route
+    monkeypatch.setattr(main.model_gateway, "decide_route", lambda message, embedding=None: main.Route.FACILITY_INFO)
+
+    async def run():
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await onboard(client, phone)
+            response = await client.post("/sakhi/chat", json={"phone_number": phone, "message": "vizag clinic address"})
+            assert response.status_code == 200
+            return response.json()
+
+    body = asyncio.run(run())
+    assert body["route"] == "facility_info"
+    assert body["reply"].splitlines() == [
+        "Here are the details for our Visakhapatnam clinic:",
+        "📍 Address: 1 Test Street, Visakhapatnam",
+    ]
@@ -0,0 +1,34 @@
+# tests/test_idempotency.py
+"""
+Only client keys dedupe chat turns unless content-derived keys are turned on.
+"""
+
+import asyncio
+
+from modules.idempotency import IdempotencyStore
+
+
+def _turns(store: IdempotencyStore, client_key=None):
+    calls = []
+
+    async def turn():
+        calls.append(1)
+        return {"reply": len(calls)}
+
+    async def run():
+        keyed = store.key_for(client_key, "+915550048100", "yes", "en")
+        return [await store.run(keyed, turn) for _ in range(2)]
+
+    return asyncio.run(run())
+
+
+def test_repeated_short_answer_runs_again_by_default():
+    assert _turns(IdempotencyStore()) == [({"reply": 1}, False), ({"reply": 2}, False)]
+
+
+def test_client_key_replays_the_stored_reply():
+    assert _turns(IdempotencyStore(), client_key="abc") == [({"reply": 1}, False), ({"reply": 1}, True)]
+
+
+def test_derived_keys_are_opt_in():
+    assert _turns(IdempotencyStore(derived_keys=True)) == [({"reply": 1}, False), ({"reply": 1}, True)]
@@ -0,0 +1,30 @@
+# tests/test_rate_limiter.py
+"""
+OpenAI pacing sleeps, so it refuses the event loop thread.
+"""
+
+import asyncio
+
+import pytest
+
+from modules.rate_limiter import TokenBucketLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return TokenBucketLimiter(db_path=str(tmp_path / "rate.sqlite3"), enabled=True)
+
+
+def test_acquire_rejected_on_event_loop(limiter):
+    async def on_loop():
+        limiter.acquire("chat", 100)
+
+    with pytest.raises(RuntimeError, match="asyncio.to_thread"):
+        asyncio.run(on_loop())
+
+
+def test_acquire_allowed_in_worker_thread(limiter):
+    async def from_loop():
+        return await asyncio.to_thread(limiter.acquire, "chat", 100)
+
+    assert asyncio.run(from_loop()) == 0.0
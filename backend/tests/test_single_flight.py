@@ -0,0 +1,32 @@
+# tests/test_single_flight.py
+"""
+Callers coalesced onto a stuck call give up instead of hanging with it.
+"""
+
+import threading
+
+import pytest
+
+from modules.single_flight import SingleFlight
+
+
+def test_follower_wait_is_bounded():
+    flight = SingleFlight("test", enabled=True, wait_timeout=0.2)
+    started, release = threading.Event(), threading.Event()
+
+    def stuck():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=flight.do, args=("key", stuck))
+    leader.start()
+    started.wait(5)
+    try:
+        with pytest.raises(TimeoutError):
+            flight.do("key", lambda: "follower ran")
+    finally:
+        release.set()
+        leader.join()
+    # Once the leader is done the next call runs again
+    assert flight.do("key", lambda: "fresh") == "fresh"
@@ -0,0 +1,32 @@
+# tests/test_stream_close.py
+"""
+A stream abandoned by its consumer gives its upstream slot back.
+"""
+
+import asyncio
+
+from modules.streaming import iterate_in_thread
+from modules.upstream_limiter import get_pool
+
+
+def test_closing_token_stream_releases_chat_slot(backend):
+    from modules.response_builder import _stream_completion
+
+    pool = get_pool("chat")
+    idle = pool.stats()["in_flight"]
+
+    async def run():
+        # Still referenced, as the SSE handlers keep it, so garbage collection won't close it
+        stream = _stream_completion("smalltalk", [{"role": "user", "content": "tell me about ivf"}])
+        tokens = iterate_in_thread(stream)
+        await tokens.__anext__()
+        streaming = pool.stats()["in_flight"]
+        # Like the SSE events() cleanup when the client disconnects
+        await tokens.aclose()
+        for _ in range(100):
+            if pool.stats()["in_flight"] == idle:
+                break
+            await asyncio.sleep(0.05)
+        return streaming, pool.stats()["in_flight"]
+
+    assert asyncio.run(run()) == (idle + 1, idle)
@@ -0,0 +1,30 @@
+# tests/test_upstream_limiter.py
+"""
+The blocking upstream slot refuses the event loop thread.
+"""
+
+import asyncio
+
+import pytest
+
+from modules.upstream_limiter import upstream_slot
+
+
+def test_sync_slot_rejected_on_event_loop():
+    async def on_loop():
+        with upstream_slot("postgrest"):
+            pass
+
+    with pytest.raises(RuntimeError, match="asyncio.to_thread"):
+        asyncio.run(on_loop())
+
+
+def test_sync_slot_allowed_in_worker_thread():
+    def blocking_call():
+        with upstream_slot("postgrest"):
+            return "ok"
+
+    async def from_loop():
+        return await asyncio.to_thread(blocking_call)
+
+    assert asyncio.run(from_loop()) == "ok"
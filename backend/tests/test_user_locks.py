@@ -0,0 +1,58 @@
+# tests/test_user_locks.py
+"""
+Per-user locks order one user's turns without serializing different users.
+"""
+
+import asyncio
+import time
+
+import httpx
+
+USERS = 4
+
+
+async def _timed_turn(client: httpx.AsyncClient, phone: str, message: str):
+    started = time.perf_counter()
+    response = await client.post("/sakhi/chat", json={"phone_number": phone, "message": message})
+    assert response.status_code == 200
+    return started, time.perf_counter()
+
+
+def test_different_users_turns_overlap(backend, onboard):
+    _main, base_url = backend
+    phones = [f"+915550046{i:03d}" for i in range(USERS)]
+
+    async def run():
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await asyncio.gather(*(onboard(client, phone) for phone in phones))
+            # One warm turn alone gives the duration of a single turn
+            started, ended = await _timed_turn(client, phones[0], "what is the success rate of ivf")
+            single = ended - started
+            turns = await asyncio.gather(*(
+                _timed_turn(client, phone, f"what are the side effects of ivf injections {i}")
+                for i, phone in enumerate(phones)
+            ))
+            return single, turns
+
+    single, turns = asyncio.run(run())
+    # Every turn was still running when the last one started...
+    assert max(start for start, _ in turns) < min(end for _, end in turns)
+    # ...and together they took about as long as one turn, not USERS turns back to back
+    wall = max(end for _, end in turns) - min(start for start, _ in turns)
+    assert wall < single * USERS / 2, (wall, single)
+
+
+def test_same_user_turns_run_in_order(backend, onboard):
+    _main, base_url = backend
+    phone = "+915550046100"
+
+    async def run():
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await onboard(client, phone)
+            return await asyncio.gather(*(
+                _timed_turn(client, phone, f"is it normal to feel tired during ivf {i}") for i in range(2)
+            ))
+
+    (first_start, first_end), (second_start, second_end) = sorted(asyncio.run(run()), key=lambda turn: turn[1])
+    # The second turn waited for the first one to finish
+    assert second_end - first_end > (first_end - first_start) / 2
@@ -0,0 +1,51 @@
+# tests/test_webhook_ack.py
+"""
+The webhook acknowledges right away even while every worker runs a medical turn,
+i.e. chat turns keep their blocking calls off the event loop.
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from modules.webhook_ingest import WORKERS_BUSY
+
+# Several times the stub's local ack time, well below one stub chat completion (300 ms)
+MAX_ACK_SECONDS = 0.15
+
+
+def test_webhook_acks_while_workers_run_medical_turns(backend, onboard):
+    main, base_url = backend
+    phones = [f"+915550047{i:03d}" for i in range(main.webhook_ingest.workers)]
+
+    async def run():
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await asyncio.gather(*(onboard(client, phone) for phone in phones))
+            for i, phone in enumerate(phones):
+                body = {"phone_number": phone, "message": f"what is the cost of ivf treatment {i}", "message_id": f"busy-{i}"}
+                assert (await client.post("/webhook/message", json=body)).status_code == 202
+
+            ack_times = []
+            busy_seen = 0
+            for i in range(10):
+                await asyncio.sleep(0.05)
+                busy_seen = max(busy_seen, WORKERS_BUSY.value())
+                started = time.perf_counter()
+                response = await client.post(
+                    "/webhook/message",
+                    json={"phone_number": "+915550047999", "message": "hi", "message_id": f"probe-{i}"},
+                )
+                ack_times.append(time.perf_counter() - started)
+                assert response.status_code == 202
+
+            # Leave no turns running for the next test
+            for _ in range(600):
+                if main.webhook_ingest.depth() == 0 and WORKERS_BUSY.value() == 0:
+                    break
+                await asyncio.sleep(0.1)
+            return ack_times, busy_seen
+
+    ack_times, busy_seen = asyncio.run(run())
+    assert busy_seen == main.webhook_ingest.workers
+    assert max(ack_times) < MAX_ACK_SECONDS, ack_times
@@ -0,0 +1,68 @@
+# tests/test_webhook_idempotency.py
+"""
+Webhook message IDs are only remembered for messages that were actually processed.
+"""
+
+import time
+
+import httpx
+
+from modules.upstream_limiter import UpstreamOverloaded
+
+
+def _wait_for(predicate, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_retry_after_queue_full_is_processed(backend, monkeypatch):
+    main, base_url = backend
+    submit = main.webhook_ingest.submit
+    calls = []
+
+    def full_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise UpstreamOverloaded("webhook", main.webhook_ingest.retry_after)
+        return submit(*args, **kwargs)
+
+    monkeypatch.setattr(main.webhook_ingest, "submit", full_once)
+    body = {"phone_number": "+915550048001", "message": "hi", "message_id": "full-1"}
+    with httpx.Client(base_url=base_url) as client:
+        first = client.post("/webhook/message", json=body)
+        retry = client.post("/webhook/message", json=body)
+        again = client.post("/webhook/message", json=body)
+
+    assert first.status_code == 503
+    assert first.headers["Retry-After"]
+    assert retry.status_code == 202
+    assert retry.json()["status"] == "accepted"
+    assert again.json()["status"] == "duplicate"
+    assert len(calls) == 2
+
+
+def test_redelivery_after_failed_turn_is_processed(backend, monkeypatch):
+    main, base_url = backend
+    handler = main.webhook_ingest.handler
+    body = {"phone_number": "+915550048002", "message": "hi", "message_id": "fail-1"}
+    turns = []
+
+    async def fail_once(request, received):
+        if request.phone_number != body["phone_number"]:
+            return await handler(request, received)
+        turns.append(request.message)
+        if len(turns) == 1:
+            raise RuntimeError("turn failed")
+        return await handler(request, received)
+
+    monkeypatch.setattr(main.webhook_ingest, "handler", fail_once)
+    with httpx.Client(base_url=base_url) as client:
+        assert client.post("/webhook/message", json=body).json()["status"] == "accepted"
+        assert _wait_for(lambda: len(turns) == 1 and main.webhook_ingest.depth() == 0)
+        # The failure releases the message ID asynchronously, right after the turn
+        assert _wait_for(lambda: client.post("/webhook/message", json=body).json()["status"] == "accepted")
+    assert _wait_for(lambda: len(turns) == 2)